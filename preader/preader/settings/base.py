@@ -75,6 +75,8 @@ MIDDLEWARE_CLASSES = (
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
     'django.middleware.security.SecurityMiddleware',
+    # reads go to the primary for a while after a write, see reader.routers
+    'reader.routers.PrimaryPinMiddleware',
 )
 
 ########## URL CONFIGURATION
@@ -155,6 +157,10 @@ DATABASES = {
         'PORT': '',
     }
 }
+
+# See: https://docs.djangoproject.com/en/dev/ref/settings/#database-routers
+# FeedLog goes to INGEST_DATABASE when it is set, see reader.routers
+DATABASE_ROUTERS = ['reader.routers.IngestRouter']
 ########## END DATABASE CONFIGURATION
 
 
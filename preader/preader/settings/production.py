@@ -51,13 +51,69 @@ SERVER_EMAIL = EMAIL_HOST_USER
 ########## END EMAIL CONFIGURATION
 
 ########## DATABASE CONFIGURATION
-DATABASES = {}
+# See: https://docs.djangoproject.com/en/dev/ref/settings/#databases
+# PostgreSQL enables the fast paths in reader.db (ON CONFLICT, SKIP LOCKED, server-side cursors).  Web and worker
+# processes keep their connection for CONN_MAX_AGE seconds instead of connecting for every request, so allow one
+# connection per process (and per fan-out worker, see FANOUT_PROCESSES) in max_connections.
+DATABASES = {
+    'default': {
+        'ENGINE': 'django.db.backends.postgresql_psycopg2',
+        'NAME': environ.get('DATABASE_NAME', 'preader'),
+        'USER': environ.get('DATABASE_USER', ''),
+        'PASSWORD': environ.get('DATABASE_PASSWORD', ''),
+        'HOST': environ.get('DATABASE_HOST', ''),
+        'PORT': environ.get('DATABASE_PORT', ''),
+        'CONN_MAX_AGE': int(environ.get('DATABASE_CONN_MAX_AGE', 600)),
+        'OPTIONS': {
+            'connect_timeout': int(environ.get('DATABASE_CONNECT_TIMEOUT', 10)),
+        },
+    }
+}
+
+# optional separate database for FeedLog, see reader.routers.IngestRouter
+if environ.get('INGEST_DATABASE_NAME'):
+    DATABASES['ingest'] = dict(
+        DATABASES['default'],
+        NAME=environ['INGEST_DATABASE_NAME'],
+        HOST=environ.get('INGEST_DATABASE_HOST', DATABASES['default']['HOST']),
+        PORT=environ.get('INGEST_DATABASE_PORT', DATABASES['default']['PORT']),
+    )
+    INGEST_DATABASE = 'ingest'
+
+# optional read replica for FeedListView and EntryListView, see reader.routers.read_database
+if environ.get('REPLICA_DATABASE_HOST'):
+    DATABASES['replica'] = dict(
+        DATABASES['default'],
+        HOST=environ['REPLICA_DATABASE_HOST'],
+        PORT=environ.get('REPLICA_DATABASE_PORT', DATABASES['default']['PORT']),
+        TEST={'MIRROR': 'default'},
+    )
+    READ_REPLICA_DATABASE = 'replica'
 ########## END DATABASE CONFIGURATION
 
 
 ########## CACHE CONFIGURATION
 # See: https://docs.djangoproject.com/en/dev/ref/settings/#caches
-CACHES = {}
+# Cache keys carry feed and user versions (reader.models.versioned_key) so nothing is ever invalidated,
+# old versions just expire.
+CACHES = {
+    'default': {
+        'BACKEND': environ.get('CACHE_BACKEND', 'django.core.cache.backends.filebased.FileBasedCache'),
+        'LOCATION': environ.get('CACHE_LOCATION', normpath(join(SITE_ROOT, 'cache'))),
+        'TIMEOUT': 60 * 60 * 24,
+    },
+    # rendered entry panels, see reader.fragments, culled by size rather than invalidated
+    'fragments': {
+        'BACKEND': environ.get('FRAGMENT_CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': environ.get('FRAGMENT_CACHE_LOCATION', 'preader-fragments'),
+        'TIMEOUT': 60 * 60 * 24 * 7,
+        'OPTIONS': {
+            'MAX_ENTRIES': int(environ.get('FRAGMENT_CACHE_MAX_ENTRIES', 10000)),
+            'CULL_FREQUENCY': 4,
+        },
+    },
+}
+FRAGMENT_CACHE = 'fragments'
 ########## END CACHE CONFIGURATION
 
 
@@ -1,6 +1,7 @@
 from django.contrib import admin
 from django.utils.timezone import now
-from .models import Feed, Entry, FeedLog, UserEntry
+from .models import Feed, Entry, FeedLog, UserEntry, SubscriptionJob, DiscoveryJob, FilterRule
+from .routers import INGEST_DATABASE
 
 
 class FeedLogAdmin(admin.ModelAdmin):
@@ -12,6 +13,8 @@ class FeedLogAdmin(admin.ModelAdmin):
         'duration',
     )
     date_hierarchy = 'datetime'
+    # feeds cannot be joined to logs kept in the ingest database
+    list_select_related = () if INGEST_DATABASE else False
 
 admin.site.register(FeedLog, FeedLogAdmin)
 
@@ -81,8 +84,47 @@ class UserEntryAdmin(admin.ModelAdmin):
         'user',
         'feed',
         'entry',
-        'status'
+        'status',
+        'flag'
+    )
+    list_filter = ('status', 'flag')
+
+admin.site.register(UserEntry, UserEntryAdmin)
+
+class SubscriptionJobAdmin(admin.ModelAdmin):
+    list_display = (
+        'user',
+        'feed',
+        'action',
+        'status',
+        'entries',
+        'created',
+        'modified'
+    )
+    list_filter = ('action', 'status')
+
+admin.site.register(SubscriptionJob, SubscriptionJobAdmin)
+
+
+class DiscoveryJobAdmin(admin.ModelAdmin):
+    list_display = (
+        'user',
+        'url',
+        'status',
+        'created',
+        'modified'
     )
     list_filter = ('status', )
 
-admin.site.register(UserEntry, UserEntryAdmin)
\ No newline at end of file
+admin.site.register(DiscoveryJob, DiscoveryJobAdmin)
+
+
+class FilterRuleAdmin(admin.ModelAdmin):
+    list_display = (
+        'user',
+        'keyword',
+        'action'
+    )
+    list_filter = ('action', )
+
+admin.site.register(FilterRule, FilterRuleAdmin)
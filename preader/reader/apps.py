@@ -0,0 +1,18 @@
+from django.apps import AppConfig
+from django.db.backends.signals import connection_created
+from django.db.models.signals import m2m_changed, post_delete, post_save
+
+
+class ReaderConfig(AppConfig):
+    name = 'reader'
+    verbose_name = 'Reader'
+
+    def ready(self):
+        from django.contrib.auth.models import User
+        from .db import configure_sqlite
+        from .models import Feed, create_user_version, delete_feed_logs, subscriptions_changed
+        connection_created.connect(configure_sqlite, dispatch_uid='reader.db.configure_sqlite')
+        post_save.connect(create_user_version, sender=User, dispatch_uid='reader.models.create_user_version')
+        m2m_changed.connect(subscriptions_changed, sender=Feed.subscriptions.through,
+                            dispatch_uid='reader.models.subscriptions_changed')
+        post_delete.connect(delete_feed_logs, sender=Feed, dispatch_uid='reader.models.delete_feed_logs')
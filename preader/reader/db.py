@@ -0,0 +1,240 @@
+from django.conf import settings
+from django.db import connection, models, transaction, IntegrityError
+from django.db.utils import NotSupportedError
+
+from contextlib import contextmanager
+from uuid import uuid4
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover
+    fcntl = None
+
+# rows fetched per round trip from a PostgreSQL server-side cursor
+ITER_CHUNK = getattr(settings, 'ITER_CHUNK', 2000)
+
+# applied to every new SQLite connection by configure_sqlite: readers do not block the writer with WAL, commits do
+# not fsync with synchronous=NORMAL (a power loss may lose the last transactions, never corrupts), a writer waits
+# busy_timeout milliseconds for the lock instead of failing with "database is locked"
+SQLITE_PRAGMAS = getattr(settings, 'SQLITE_PRAGMAS', (
+    ('journal_mode', 'WAL'),
+    ('synchronous', 'NORMAL'),
+    ('busy_timeout', 10000),
+    # negative sizes are KiB
+    ('cache_size', -32000),
+    ('mmap_size', 256 * 1024 * 1024),
+    ('temp_store', 'MEMORY'),
+))
+# lock file of single_writer, next to the database file by default
+SQLITE_WRITER_LOCK = getattr(settings, 'SQLITE_WRITER_LOCK', None)
+
+
+def supports_ignore_conflicts():
+    """
+    Supports Ignore Conflicts
+
+    :return: True if INSERT can skip rows that violate a unique constraint, INSERT OR IGNORE on SQLite and
+        ON CONFLICT DO NOTHING on PostgreSQL 9.5 and later
+    """
+    if connection.vendor == 'sqlite':
+        return True
+    return connection.vendor == 'postgresql' and connection.pg_version >= 90500
+
+
+def supports_skip_locked():
+    """
+    Supports Skip Locked
+
+    :return: True if SELECT ... FOR UPDATE SKIP LOCKED is available, PostgreSQL 9.5 and later
+    """
+    return connection.vendor == 'postgresql' and connection.pg_version >= 90500
+
+
+def insert_sql(table, columns, rows_sql, ignore_conflicts=False):
+    """
+    Insert SQL
+
+    INSERT statement for rows given as VALUES or a SELECT.
+
+        insert_sql('reader_userentry', ['user_id', 'entry_id'], 'SELECT %s, id FROM reader_entry', True)
+
+    :param table: table name
+    :param columns: list of column names
+    :param rows_sql: "VALUES ..." or "SELECT ..." SQL with the rows to insert
+    :param ignore_conflicts: skip rows that violate a unique constraint, see supports_ignore_conflicts
+    :return: SQL string
+    """
+    if ignore_conflicts and not supports_ignore_conflicts():
+        raise NotSupportedError('{0} cannot ignore conflicts on insert'.format(connection.vendor))
+    head = 'INSERT OR IGNORE INTO' if ignore_conflicts and connection.vendor == 'sqlite' else 'INSERT INTO'
+    sql = '{0} {1} ({2}) {3}'.format(head, table, ', '.join(columns), rows_sql)
+    if ignore_conflicts and connection.vendor == 'postgresql':
+        sql += ' ON CONFLICT DO NOTHING'
+    return sql
+
+
+def bulk_insert(model, objs, ignore_conflicts=False):
+    """
+    Bulk Insert
+
+    Insert model instances in batches like QuerySet.bulk_create.  With ignore_conflicts, instances that violate a
+    unique constraint are skipped: in the INSERT itself where the backend supports it, otherwise the batch is
+    retried one instance at a time.  Like bulk_create, primary keys are not set.
+
+    :param model: model class
+    :param objs: list of unsaved instances
+    :param ignore_conflicts: skip instances that violate a unique constraint
+    :return: number of rows inserted
+    """
+    objs = list(objs)
+    if not objs:
+        return 0
+    if not ignore_conflicts:
+        model.objects.bulk_create(objs)
+        return len(objs)
+    if not supports_ignore_conflicts():
+        try:
+            with transaction.atomic():
+                model.objects.bulk_create(objs)
+            return len(objs)
+        except IntegrityError:
+            count = 0
+            for obj in objs:
+                try:
+                    with transaction.atomic():
+                        obj.save(force_insert=True)
+                    count += 1
+                except IntegrityError:
+                    pass
+            return count
+
+    fields = [field for field in model._meta.concrete_fields if not isinstance(field, models.AutoField)]
+    row_sql = '({0})'.format(', '.join(['%s'] * len(fields)))
+    batch_size = max(connection.ops.bulk_batch_size(fields, objs), 1)
+    count = 0
+    with connection.cursor() as cursor:
+        for x in range(0, len(objs), batch_size):
+            batch = objs[x:x + batch_size]
+            params = [
+                field.get_db_prep_save(field.pre_save(obj, True), connection) for obj in batch for field in fields
+            ]
+            cursor.execute(insert_sql(
+                model._meta.db_table, [connection.ops.quote_name(field.column) for field in fields],
+                'VALUES ' + ', '.join([row_sql] * len(batch)), ignore_conflicts=True
+            ), params)
+            count += cursor.rowcount
+    return count
+
+
+def claim(queryset, num, **values):
+    """
+    Claim
+
+    Take up to "num" rows of a queryset for this worker by updating them with values, for example moving jobs from
+    pending to running.  With SKIP LOCKED the rows are selected and updated in one transaction and rows another
+    worker is claiming are passed over instead of waited for.  Otherwise each row is claimed with a conditional
+    UPDATE that repeats the queryset's filter, so a row another worker already changed is not claimed twice.
+
+    :param queryset: rows that can be claimed, values must take a row out of it
+    :param num: maximum number of rows to claim
+    :param values: field values marking a row as claimed
+    :return: list of claimed primary keys
+    """
+    if supports_skip_locked():
+        sql, params = queryset.values('pk')[:num].query.sql_with_params()
+        with transaction.atomic():
+            with connection.cursor() as cursor:
+                cursor.execute(sql + ' FOR UPDATE SKIP LOCKED', params)
+                pks = [row[0] for row in cursor.fetchall()]
+            if pks:
+                queryset.model.objects.filter(pk__in=pks).update(**values)
+        return pks
+
+    pks = []
+    with transaction.atomic():
+        for pk in list(queryset.values_list('pk', flat=True)[:num]):
+            if queryset.filter(pk=pk).update(**values):
+                pks.append(pk)
+    return pks
+
+
+def iter_rows(queryset, chunk_size=ITER_CHUNK):
+    """
+    Iter Rows
+
+    Rows of a values_list queryset without holding the whole result in memory.  On PostgreSQL the query runs in a
+    named (server-side) cursor and "chunk_size" rows are fetched per round trip, the cursor is declared WITH HOLD
+    so it works outside a transaction and other queries can run while iterating.  Other backends fall back to
+    QuerySet.iterator.
+
+    :param queryset: values_list queryset, not flat
+    :param chunk_size: rows per round trip
+    :return: iterator of row tuples
+    """
+    if connection.vendor != 'postgresql':
+        yield from queryset.iterator()
+        return
+    sql, params = queryset.query.sql_with_params()
+    connection.ensure_connection()
+    cursor = connection.connection.cursor(name='preader_{0}'.format(uuid4().hex), withhold=True)
+    cursor.itersize = chunk_size
+    try:
+        cursor.execute(sql, params)
+        yield from cursor
+    finally:
+        cursor.close()
+
+
+def configure_sqlite(sender, connection, **kwargs):
+    """
+    Configure SQLite
+
+    connection_created receiver applying SQLITE_PRAGMAS to SQLite connections, connected in ReaderConfig.ready.
+    """
+    if connection.vendor != 'sqlite':
+        return
+    with connection.cursor() as cursor:
+        for name, value in SQLITE_PRAGMAS:
+            cursor.execute('PRAGMA {0} = {1}'.format(name, value))
+
+
+def writer_lock_path():
+    """
+    Writer Lock Path
+
+    :return: path of the single_writer lock file or None if the database is not an SQLite file
+    """
+    if connection.vendor != 'sqlite':
+        return None
+    if SQLITE_WRITER_LOCK:
+        return SQLITE_WRITER_LOCK
+    name = connection.settings_dict['NAME']
+    if not name or name == ':memory:' or 'mode=memory' in name:
+        return None
+    return name + '-writer.lock'
+
+
+@contextmanager
+def single_writer():
+    """
+    Single Writer
+
+    Make ingest processes (update_feeds, update_subscriptions) write one at a time.  SQLite allows one writer at a
+    time anyway, a second ingest process would only spin on the busy timeout and slow down the web requests
+    waiting for the same lock, so it waits here for the first one to finish.  The lock is an exclusive flock on
+    writer_lock_path and is released when the process exits, on other databases nothing is locked.  It only
+    serializes processes, UserEntry.update_subscriptions also skips its worker pool on SQLite.
+
+        with single_writer():
+            Feed.update_feeds()
+    """
+    path = writer_lock_path()
+    if path is None or fcntl is None:
+        yield
+        return
+    with open(path, 'a') as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
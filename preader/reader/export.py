@@ -0,0 +1,82 @@
+from django.conf import settings
+from django.utils.timezone import now
+
+from collections import OrderedDict
+from xml.sax.saxutils import escape, quoteattr
+
+from .models import Feed, UserEntry
+from .serializers import dumps
+
+# rows read per query while exporting
+EXPORT_CHUNK = getattr(settings, 'EXPORT_CHUNK', 500)
+
+# exported name and UserEntry field of each JSON lines field
+ENTRY_FIELDS = (
+    ('id', 'id'),
+    ('status', 'status'),
+    ('flag', 'flag'),
+    ('feed_url', 'feed__feed_url'),
+    ('feed_title', 'feed__title'),
+    ('link', 'entry__link'),
+    ('title', 'entry__title'),
+    ('author', 'entry__author'),
+    ('content', 'entry__content'),
+    ('published', 'entry__published'),
+)
+
+
+def iter_chunked(queryset, chunk_size=EXPORT_CHUNK):
+    """
+    Iter Chunked
+
+    Iterate a .values() queryset in primary key order, chunk_size rows per query.  Every query is a bounded range
+    scan after the last id seen, so memory stays the same however many rows there are.
+
+    :param queryset: .values() queryset that includes "id"
+    :param chunk_size: rows per query
+    """
+    last_id = 0
+    while True:
+        rows = list(queryset.filter(id__gt=last_id).order_by('id')[:chunk_size].iterator())
+        if not rows:
+            return
+        yield from rows
+        last_id = rows[-1]['id']
+
+
+def iter_opml(user, chunk_size=EXPORT_CHUNK):
+    """
+    Iter OPML
+
+    User's subscriptions as OPML, one line per feed.
+
+    :param user: User
+    :param chunk_size: feeds per query
+    """
+    yield '<?xml version="1.0" encoding="UTF-8"?>\n'
+    yield '<opml version="2.0">\n'
+    yield '<head><title>{0}</title><dateCreated>{1}</dateCreated></head>\n'.format(
+        escape('{0} subscriptions'.format(user.get_username())), now().strftime('%a, %d %b %Y %H:%M:%S %z'))
+    yield '<body>\n'
+    feeds = Feed.objects.filter(subscriptions=user).values('id', 'title', 'feed_url', 'site_url')
+    for feed in iter_chunked(feeds, chunk_size):
+        yield '<outline type="rss" text={0} title={0} xmlUrl={1} htmlUrl={2}/>\n'.format(
+            quoteattr(feed['title']), quoteattr(feed['feed_url']), quoteattr(feed['site_url']))
+    yield '</body>\n'
+    yield '</opml>\n'
+
+
+def iter_entries_jsonl(user, statuses=(UserEntry.SAVED, UserEntry.READ), chunk_size=EXPORT_CHUNK):
+    """
+    Iter Entries JSON Lines
+
+    User's entries as JSON lines, one object per entry with the fields in ENTRY_FIELDS.
+
+    :param user: User
+    :param statuses: UserEntry statuses to export
+    :param chunk_size: entries per query
+    """
+    entries = UserEntry.objects.filter(user=user, status__in=statuses).values(
+        *(field for name, field in ENTRY_FIELDS))
+    for entry in iter_chunked(entries, chunk_size):
+        yield dumps(OrderedDict((name, entry[field]) for name, field in ENTRY_FIELDS)) + '\n'
@@ -1,11 +1,22 @@
 from django import forms
 from .models import Feed
+from .opml import OPML_MAX_SIZE
 
 
 class URLForm(forms.Form):
     url = forms.URLField(label='URL', max_length=255)
 
 
+class OPMLForm(forms.Form):
+    opml = forms.FileField(label='OPML file')
+
+    def clean_opml(self):
+        opml = self.cleaned_data['opml']
+        if opml.size > OPML_MAX_SIZE:
+            raise forms.ValidationError('OPML file is too big.')
+        return opml
+
+
 class NewSubscriptionForm(forms.Form):
     feeds = forms.MultipleChoiceField(widget=forms.CheckboxSelectMultiple, label='URLs')
 
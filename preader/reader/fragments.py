@@ -0,0 +1,53 @@
+from django.conf import settings
+from django.core.cache import caches
+from django.template.loader import render_to_string
+from django.utils.safestring import mark_safe
+
+from zlib import crc32
+
+# cache alias for rendered fragments, give it a backend with a size limit (MAX_ENTRIES) so old fragments are culled
+FRAGMENT_CACHE = getattr(settings, 'FRAGMENT_CACHE', 'default')
+FRAGMENT_CACHE_TIMEOUT = getattr(settings, 'FRAGMENT_CACHE_TIMEOUT', 60 * 60 * 24 * 7)
+
+ENTRY_PANEL_TEMPLATE = 'reader/_entry_panel.html'
+
+
+def entry_fingerprint(entry):
+    """
+    Entry Fingerprint
+
+    Checksum of every field the entry panel shows, an entry that changes gets a new fragment key.
+
+    :param entry: Entry
+    :return: fingerprint as hex string
+    """
+    parts = (entry.title, entry.link, entry.snippet, entry.published.isoformat())
+    return '{0:08x}'.format(crc32('\x00'.join(parts).encode('utf-8')))
+
+
+def fragment_key(entry):
+    return 'preader:fragment:entry:{0}:{1}'.format(entry.pk, entry_fingerprint(entry))
+
+
+def render_entries(entries, template_name=ENTRY_PANEL_TEMPLATE):
+    """
+    Render Entries
+
+    Render the panel of each entry, panels are cached by entry id and fingerprint so only entries not seen before
+    are rendered.  One get_many and at most one set_many per call.
+
+    :param entries: list of Entry
+    :param template_name: panel template, gets the entry as "e"
+    :return: list of rendered panels in the same order as entries
+    """
+    cache = caches[FRAGMENT_CACHE]
+    keys = [fragment_key(entry) for entry in entries]
+    cached = cache.get_many(keys)
+    rendered = {}
+    for key, entry in zip(keys, entries):
+        if key not in cached and key not in rendered:
+            rendered[key] = render_to_string(template_name, {'e': entry})
+    if rendered:
+        cache.set_many(rendered, FRAGMENT_CACHE_TIMEOUT)
+    cached.update(rendered)
+    return [mark_safe(cached[key]) for key in keys]
@@ -0,0 +1,114 @@
+from django.core.management.base import BaseCommand
+from reader.db import SQLITE_PRAGMAS
+
+from os.path import join
+from tempfile import TemporaryDirectory
+from threading import Event, Thread
+from time import monotonic
+import random
+import sqlite3
+
+SCHEMA = (
+    'CREATE TABLE entry (id INTEGER PRIMARY KEY, feed_id INTEGER NOT NULL, published REAL NOT NULL, '
+    'title TEXT NOT NULL, content TEXT NOT NULL)',
+    'CREATE INDEX entry_feed_published ON entry (feed_id, published, id)',
+)
+INSERT = 'INSERT INTO entry (feed_id, published, title, content) VALUES (?, ?, ?, ?)'
+# an entry list page
+SELECT = 'SELECT id, title FROM entry WHERE feed_id = ? ORDER BY published DESC, id DESC LIMIT 25'
+
+
+class Command(BaseCommand):
+    help = (
+        'Measure concurrent read and write throughput of a scratch SQLite database with SQLite defaults and with '
+        'SQLITE_PRAGMAS, like update_feeds writing while users browse'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--duration', type=float, default=5.0, help='seconds per run')
+        parser.add_argument('--readers', type=int, default=4, help='reading threads')
+        parser.add_argument('--rows', type=int, default=20000, help='rows in the table before each run')
+        parser.add_argument('--batch', type=int, default=50, help='rows per write transaction')
+        parser.add_argument('--feeds', type=int, default=100, help='distinct feed ids')
+
+    def handle(self, *args, **options):
+        self.stdout.write('{0:<10}{1:>12}{2:>16}{3:>10}'.format('mode', 'reads/s', 'rows written/s', 'errors'))
+        for mode, pragmas in (('default', ()), ('tuned', SQLITE_PRAGMAS)):
+            with TemporaryDirectory() as directory:
+                reads, writes, errors = self.run(join(directory, 'benchmark.sqlite3'), pragmas, options)
+            self.stdout.write('{0:<10}{1:>12.0f}{2:>16.0f}{3:>10}'.format(
+                mode, reads / options['duration'], writes / options['duration'], errors))
+
+    @staticmethod
+    def connect(path, pragmas):
+        # autocommit, transactions are started explicitly
+        db = sqlite3.connect(path, isolation_level=None, check_same_thread=False)
+        for name, value in pragmas:
+            db.execute('PRAGMA {0} = {1}'.format(name, value))
+        return db
+
+    def run(self, path, pragmas, options):
+        """
+        Run
+
+        Fill a new database, then run one writer inserting "batch" rows per transaction and "readers" threads
+        reading entry lists for "duration" seconds.
+
+        :return: (queries read, rows written, "database is locked" errors)
+        """
+        feeds = options['feeds']
+        db = self.connect(path, pragmas)
+        for statement in SCHEMA:
+            db.execute(statement)
+        db.execute('BEGIN')
+        db.executemany(INSERT, (
+            (random.randrange(feeds), float(x), 'title {0}'.format(x), 'content ' * 50) for x in range(options['rows'])
+        ))
+        db.execute('COMMIT')
+        db.close()
+
+        stop = Event()
+        # (reads, rows written, errors) of each thread, appended when the thread stops
+        counts = []
+
+        def write():
+            db = self.connect(path, pragmas)
+            published = float(options['rows'])
+            writes = errors = 0
+            while not stop.is_set():
+                try:
+                    db.execute('BEGIN IMMEDIATE')
+                    for x in range(options['batch']):
+                        published += 1
+                        db.execute(INSERT, (random.randrange(feeds), published, 'new', 'content ' * 50))
+                    db.execute('COMMIT')
+                    writes += options['batch']
+                except sqlite3.OperationalError:
+                    errors += 1
+                    if db.in_transaction:
+                        db.execute('ROLLBACK')
+            db.close()
+            counts.append((0, writes, errors))
+
+        def read():
+            db = self.connect(path, pragmas)
+            reads = errors = 0
+            while not stop.is_set():
+                try:
+                    db.execute(SELECT, (random.randrange(feeds), )).fetchall()
+                    reads += 1
+                except sqlite3.OperationalError:
+                    errors += 1
+            db.close()
+            counts.append((reads, 0, errors))
+
+        threads = [Thread(target=write)] + [Thread(target=read) for x in range(options['readers'])]
+        for thread in threads:
+            thread.start()
+        deadline = monotonic() + options['duration']
+        while monotonic() < deadline:
+            stop.wait(deadline - monotonic())
+        stop.set()
+        for thread in threads:
+            thread.join()
+        return tuple(sum(column) for column in zip(*counts))
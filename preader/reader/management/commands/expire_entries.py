@@ -0,0 +1,27 @@
+from django.core.management.base import BaseCommand
+from reader.models import Entry, RETAIN_CHUNK, RETAIN_DAYS, RETAIN_ENTRIES, RETAIN_PAUSE
+
+
+class Command(BaseCommand):
+    help = (
+        'Delete entries past the retention caps of their feed, keeping the newest --entries entries and entries '
+        'from the last --days days, feeds with retain_entries or retain_days set use those instead, saved entries '
+        'are always kept'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--entries', type=int, default=RETAIN_ENTRIES, help='entries to keep per feed')
+        parser.add_argument('--days', type=int, default=RETAIN_DAYS, help='days of entries to keep')
+        parser.add_argument('--feed', type=int, action='append', dest='feeds', help='only this feed, repeatable')
+        parser.add_argument('--chunk', type=int, default=RETAIN_CHUNK, help='entries deleted per transaction')
+        parser.add_argument('--pause', type=float, default=RETAIN_PAUSE, help='seconds to sleep between chunks')
+
+    def handle(self, *args, **options):
+        count = Entry.delete_expired(
+            feed_ids=options['feeds'],
+            max_entries=options['entries'],
+            max_days=options['days'],
+            chunk=options['chunk'],
+            pause=options['pause']
+        )
+        self.stdout.write('{0} entries deleted.'.format(count))
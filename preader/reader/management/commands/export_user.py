@@ -0,0 +1,31 @@
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from reader.export import iter_entries_jsonl, iter_opml, EXPORT_CHUNK
+
+
+class Command(BaseCommand):
+    help = "Stream a user's subscriptions as OPML or saved and read entries as JSON lines"
+
+    def add_arguments(self, parser):
+        parser.add_argument('username')
+        parser.add_argument('--format', choices=('opml', 'jsonl'), default='opml', help='what to export')
+        parser.add_argument('--output', help='file to write, standard output if not given')
+        parser.add_argument('--chunk', type=int, default=EXPORT_CHUNK, help='rows per query')
+
+    def handle(self, *args, **options):
+        try:
+            user = User.objects.get(username=options['username'])
+        except User.DoesNotExist:
+            raise CommandError('User "{0}" does not exist'.format(options['username']))
+
+        if options['format'] == 'opml':
+            lines = iter_opml(user, chunk_size=options['chunk'])
+        else:
+            lines = iter_entries_jsonl(user, chunk_size=options['chunk'])
+
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as output:
+                output.writelines(lines)
+        else:
+            for line in lines:
+                self.stdout.write(line, ending='')
@@ -0,0 +1,28 @@
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from reader.models import FETCH_WORKERS
+from reader.opml import OPMLError, import_opml
+
+
+class Command(BaseCommand):
+    help = 'Subscribe a user to every feed in an OPML file'
+
+    def add_arguments(self, parser):
+        parser.add_argument('username')
+        parser.add_argument('path', help='OPML file')
+        parser.add_argument('--no-fetch', action='store_false', dest='fetch', default=True,
+                            help='leave fetching new feeds to update_feeds')
+        parser.add_argument('--workers', type=int, default=FETCH_WORKERS, help='discovery and download threads')
+
+    def handle(self, *args, **options):
+        try:
+            user = User.objects.get(username=options['username'])
+        except User.DoesNotExist:
+            raise CommandError('User "{0}" does not exist'.format(options['username']))
+
+        try:
+            found, subscribed, queued = import_opml(
+                user, options['path'], fetch=options['fetch'], workers=options['workers'])
+        except (OPMLError, IOError) as e:
+            raise CommandError(str(e))
+        self.stdout.write('{0} feeds found, subscribed to {1} new feeds.'.format(found, subscribed))
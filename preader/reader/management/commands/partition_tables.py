@@ -0,0 +1,88 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.utils.timezone import now
+from reader.partitions import (
+    PARTITION_AHEAD_MONTHS, PARTITION_HISTORY_MONTHS, PARTITION_KEYS, USER_ENTRY_PARTITIONS, add_months,
+    convert_table, drop_partitions_before, is_partitioned, model_table, month_start, partitioning_supported,
+    partitions, roll_table
+)
+from reader.routers import INGEST_DATABASE
+
+# tables that roll keeps partitions ahead for, in order
+MONTHLY = ('entry', 'feedlog')
+
+
+class Command(BaseCommand):
+    help = (
+        'PostgreSQL declarative partitioning: "convert" replaces tables with partitioned ones (user entries by '
+        'user id hash, entries and feed logs by month), "roll" creates the coming months and drops old feed logs, '
+        '"status" lists partitions'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('action', choices=('status', 'convert', 'roll'))
+        parser.add_argument(
+            'tables', nargs='*', help='tables to convert: {0}'.format(', '.join(sorted(PARTITION_KEYS))))
+        parser.add_argument('--partitions', type=int, default=USER_ENTRY_PARTITIONS, help='user entry partitions')
+        parser.add_argument('--history', type=int, default=PARTITION_HISTORY_MONTHS,
+                            help='past months with their own partition when converting')
+        parser.add_argument('--ahead', type=int, default=PARTITION_AHEAD_MONTHS,
+                            help='months ahead that must have a partition')
+        parser.add_argument('--keep-log-months', type=int, default=None,
+                            help='drop feed log partitions older than this many months when rolling')
+        parser.add_argument('--dry-run', action='store_true', help='print the SQL instead of running it')
+
+    def handle(self, *args, **options):
+        if not partitioning_supported():
+            raise CommandError('Declarative partitioning needs PostgreSQL 11 or later')
+
+        if options['dry_run']:
+            def execute(sql):
+                self.stdout.write(sql + ';')
+        else:
+            def execute(sql):
+                with connection.cursor() as cursor:
+                    cursor.execute(sql)
+
+        action = options['action']
+        if action == 'status':
+            for name in sorted(PARTITION_KEYS):
+                table = model_table(name)
+                if is_partitioned(table):
+                    self.stdout.write('{0}: {1}'.format(table, ', '.join(partitions(table))))
+                else:
+                    self.stdout.write('{0}: not partitioned'.format(table))
+
+        elif action == 'convert':
+            if not options['tables'] or set(options['tables']) - set(PARTITION_KEYS):
+                raise CommandError('Name the tables to convert: {0}'.format(', '.join(sorted(PARTITION_KEYS))))
+            if 'feedlog' in options['tables'] and INGEST_DATABASE is not None:
+                raise CommandError('Feed logs are kept in the "{0}" database, not partitioned here'.format(
+                    INGEST_DATABASE))
+            for name in options['tables']:
+                if is_partitioned(model_table(name)):
+                    self.stdout.write('{0} is already partitioned'.format(model_table(name)))
+                    continue
+                with transaction.atomic():
+                    notes = convert_table(
+                        name, execute, modulus=options['partitions'], history=options['history'],
+                        ahead=options['ahead'])
+                for note in notes:
+                    self.stdout.write(note)
+                self.stdout.write('{0} partitioned.'.format(model_table(name)))
+
+        else:
+            for name in MONTHLY:
+                if not is_partitioned(model_table(name)):
+                    continue
+                with transaction.atomic():
+                    created = roll_table(name, execute, ahead=options['ahead'])
+                if created:
+                    self.stdout.write('created {0}'.format(', '.join(created)))
+            if options['keep_log_months'] is not None and INGEST_DATABASE is None and \
+                    is_partitioned(model_table('feedlog')):
+                cutoff = add_months(month_start(now()), -options['keep_log_months'])
+                with transaction.atomic():
+                    dropped = drop_partitions_before('feedlog', execute, cutoff)
+                if dropped:
+                    self.stdout.write('dropped {0}'.format(', '.join(dropped)))
@@ -0,0 +1,21 @@
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from reader.models import Feed
+
+
+class Command(BaseCommand):
+    help = 'Unsubscribe a user from all feeds and delete their entries in chunks'
+
+    def add_arguments(self, parser):
+        parser.add_argument('username')
+        parser.add_argument('--delete', action='store_true', default=False, help='delete the user when done')
+
+    def handle(self, *args, **options):
+        try:
+            user = User.objects.get(username=options['username'])
+        except User.DoesNotExist:
+            raise CommandError('User "{0}" does not exist'.format(options['username']))
+
+        Feed.purge_user(user, background=False)
+        if options['delete']:
+            user.delete()
@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand, CommandError
+from reader.models import Entry, SEARCH_INDEX_CHUNK, search_backend
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the full text search index of entries'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk', type=int, default=SEARCH_INDEX_CHUNK, help='entries per batch')
+        parser.add_argument('--pending', action='store_true', help='only index entries not indexed yet')
+
+    def handle(self, *args, **options):
+        if search_backend() is None:
+            raise CommandError('Full text search is not available on this database')
+        if options['pending']:
+            count = Entry.index_pending(options['chunk'])
+        else:
+            count = Entry.rebuild_index(options['chunk'])
+        self.stdout.write('{0} entries indexed.'.format(count))
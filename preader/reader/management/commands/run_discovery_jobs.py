@@ -0,0 +1,12 @@
+from django.core.management.base import BaseCommand
+from reader.models import DiscoveryJob
+
+
+class Command(BaseCommand):
+    help = 'Run pending feed discovery jobs'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--num', type=int, default=10, help='maximum number of jobs to run')
+
+    def handle(self, *args, **options):
+        DiscoveryJob.run_pending(options['num'])
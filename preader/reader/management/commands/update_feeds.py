@@ -1,4 +1,5 @@
 from django.core.management.base import BaseCommand
+from reader.db import single_writer
 from reader.models import Feed
 
 
@@ -6,4 +7,5 @@ class Command(BaseCommand):
     help = 'Update feeds'
 
     def handle(self, *args, **options):
-        Feed.update_feeds(100)
+        with single_writer():
+            Feed.update_feeds(100)
@@ -1,9 +1,20 @@
 from django.core.management.base import BaseCommand
-from reader.models import UserEntry
+from reader.db import single_writer
+from reader.models import UserEntry, FANOUT_SHARDS, FANOUT_PROCESSES, FANOUT_RETRIES
 
 
 class Command(BaseCommand):
     help = 'Update feeds'
 
+    def add_arguments(self, parser):
+        parser.add_argument('--shards', type=int, default=FANOUT_SHARDS, help='shards per feed, split by user id')
+        parser.add_argument('--processes', type=int, default=FANOUT_PROCESSES, help='worker processes')
+        parser.add_argument('--retries', type=int, default=FANOUT_RETRIES, help='attempts per shard')
+
     def handle(self, *args, **options):
-        UserEntry.update_subscriptions()
+        with single_writer():
+            UserEntry.update_subscriptions(
+                shards=options['shards'],
+                processes=options['processes'],
+                retries=options['retries']
+            )
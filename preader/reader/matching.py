@@ -0,0 +1,86 @@
+from collections import deque
+
+
+class KeywordMatcher(object):
+    """
+    Keyword Matcher
+
+    Aho-Corasick automaton for finding many keywords in a text in a single pass.  Keywords are matched case
+    insensitively on word boundaries, each keyword carries a value and search returns the values of every keyword
+    found.
+
+        matcher = KeywordMatcher()
+        matcher.add('python', 1)
+        matcher.add('django', 2)
+        matcher.build()
+        matcher.search('Django is written in Python')  # {1, 2}
+    """
+
+    def __init__(self):
+        self.goto = [{}]
+        self.fail = [0]
+        self.output = [[]]
+        self.built = False
+
+    def __len__(self):
+        return sum(len(values) for values in self.output)
+
+    def add(self, keyword, value):
+        keyword = keyword.strip().lower()
+        if not keyword:
+            return
+        state = 0
+        for char in keyword:
+            next_state = self.goto[state].get(char)
+            if next_state is None:
+                next_state = len(self.goto)
+                self.goto[state][char] = next_state
+                self.goto.append({})
+                self.fail.append(0)
+                self.output.append([])
+            state = next_state
+        self.output[state].append((len(keyword), value))
+        self.built = False
+
+    def build(self):
+        # breadth first so a state's fail link is always built before its children
+        queue = deque(self.goto[0].values())
+        for state in queue:
+            self.fail[state] = 0
+        while queue:
+            state = queue.popleft()
+            for char, next_state in self.goto[state].items():
+                queue.append(next_state)
+                fail = self.fail[state]
+                while fail and char not in self.goto[fail]:
+                    fail = self.fail[fail]
+                self.fail[next_state] = self.goto[fail].get(char, 0)
+                self.output[next_state] = self.output[next_state] + self.output[self.fail[next_state]]
+        self.built = True
+
+    def search(self, text):
+        """
+        Search
+
+        :param text: text to search
+        :return: set of values of keywords found in text
+        """
+        if not self.built:
+            self.build()
+        found = set()
+        text = text.lower()
+        state = 0
+        for end, char in enumerate(text):
+            while state and char not in self.goto[state]:
+                state = self.fail[state]
+            state = self.goto[state].get(char, 0)
+            for length, value in self.output[state]:
+                if value in found:
+                    continue
+                start = end - length + 1
+                if start > 0 and text[start - 1].isalnum():
+                    continue
+                if end + 1 < len(text) and text[end + 1].isalnum():
+                    continue
+                found.add(value)
+        return found
@@ -0,0 +1,38 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+import model_utils.fields
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('reader', '0003_auto_20160521_1920'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SubscriptionJob',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created', model_utils.fields.AutoCreatedField(default=django.utils.timezone.now, editable=False, verbose_name='created')),
+                ('modified', model_utils.fields.AutoLastModifiedField(default=django.utils.timezone.now, editable=False, verbose_name='modified')),
+                ('action', models.CharField(choices=[('b', 'Backfill')], default='b', max_length=1)),
+                ('status', models.CharField(choices=[('p', 'Pending'), ('r', 'Running'), ('d', 'Done'), ('f', 'Failed')], db_index=True, default='p', max_length=1)),
+                ('entries', models.PositiveIntegerField(default=0)),
+                ('notes', models.TextField(blank=True)),
+                ('feed', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='reader.Feed')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'ordering': ('created',),
+                'verbose_name': 'Subscription Job',
+                'verbose_name_plural': 'Subscription Jobs',
+            },
+        ),
+    ]
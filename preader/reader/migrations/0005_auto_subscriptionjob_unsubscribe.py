@@ -0,0 +1,25 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('reader', '0004_subscriptionjob'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='subscriptionjob',
+            name='action',
+            field=models.CharField(choices=[('b', 'Backfill'), ('u', 'Unsubscribe'), ('p', 'Purge')], default='b', max_length=1),
+        ),
+        migrations.AlterField(
+            model_name='subscriptionjob',
+            name='feed',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, to='reader.Feed'),
+        ),
+    ]
@@ -0,0 +1,35 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('reader', '0005_auto_subscriptionjob_unsubscribe'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FilterRule',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('keyword', models.CharField(max_length=255)),
+                ('action', models.CharField(choices=[('m', 'Mute'), ('h', 'Highlight')], default='m', max_length=1)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'Filter Rule',
+                'verbose_name_plural': 'Filter Rules',
+            },
+        ),
+        migrations.AddField(
+            model_name='userentry',
+            name='flag',
+            field=models.CharField(blank=True, choices=[('', 'None'), ('m', 'Muted'), ('h', 'Highlighted')], default='', max_length=1),
+        ),
+    ]
@@ -0,0 +1,46 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+def create_user_versions(apps, schema_editor):
+    # versions are not created on first read, every existing user gets one now
+    db_alias = schema_editor.connection.alias
+    User = apps.get_model(*settings.AUTH_USER_MODEL.split('.'))
+    UserVersion = apps.get_model('reader', 'UserVersion')
+    UserVersion.objects.using(db_alias).bulk_create(
+        [UserVersion(user_id=pk) for pk in User.objects.using(db_alias).values_list('pk', flat=True).iterator()],
+        batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('reader', '0007_entry_feed_published_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='feed',
+            name='version',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.CreateModel(
+            name='UserVersion',
+            fields=[
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, serialize=False, to=settings.AUTH_USER_MODEL)),
+                ('version', models.PositiveIntegerField(default=0)),
+                ('modified', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+            options={
+                'verbose_name': 'User Version',
+                'verbose_name_plural': 'User Versions',
+            },
+        ),
+        migrations.RunPython(create_user_versions, migrations.RunPython.noop),
+    ]
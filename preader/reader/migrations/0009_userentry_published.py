@@ -0,0 +1,30 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('reader', '0008_versions'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='userentry',
+            name='published',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.RunSQL(
+            'UPDATE reader_userentry SET published = '
+            '(SELECT reader_entry.published FROM reader_entry WHERE reader_entry.id = reader_userentry.entry_id)',
+            migrations.RunSQL.noop
+        ),
+        migrations.AlterIndexTogether(
+            name='userentry',
+            index_together=set([('user', 'status', 'published', 'id'), ('user', 'published', 'id')]),
+        ),
+    ]
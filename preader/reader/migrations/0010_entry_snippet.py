@@ -0,0 +1,51 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+from django.db.models import Case, Value, When
+
+import html
+import re
+
+html_tags = re.compile(r'<[^>]+>')
+block_tags = re.compile(r'</?(?:p|div|br|li|ul|ol|h[1-6]|blockquote|pre|table|tr|td|th)\b[^>]*>', re.IGNORECASE)
+whitespace = re.compile(r'\s+')
+
+
+def make_snippet(content, max_len=280, end='...'):
+    # frozen copy of reader.models.make_snippet so later changes there do not alter this migration
+    text = whitespace.sub(' ', html.unescape(html_tags.sub('', block_tags.sub(' ', content or '')))).strip()
+    if len(text) >= max_len:
+        return text[:max_len - len(end)] + end
+    return text
+
+
+def forwards(apps, schema_editor):
+    Entry = apps.get_model('reader', 'Entry')
+    last_id = 0
+    while True:
+        chunk = list(Entry.objects.filter(id__gt=last_id).order_by('id').values_list('id', 'content')[:200])
+        if not chunk:
+            break
+        # one UPDATE per chunk, 3 parameters per row stay under SQLite's limit of 999
+        Entry.objects.filter(id__in=[pk for pk, content in chunk]).update(snippet=Case(
+            *[When(id=pk, then=Value(make_snippet(content))) for pk, content in chunk],
+            output_field=models.CharField()
+        ))
+        last_id = chunk[-1][0]
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('reader', '0009_userentry_published'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='entry',
+            name='snippet',
+            field=models.CharField(blank=True, max_length=280),
+        ),
+        migrations.RunPython(forwards, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,46 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models, DatabaseError
+
+
+def create_search_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'postgresql':
+        schema_editor.execute(
+            'CREATE TABLE reader_entrysearch ('
+            'entry_id integer PRIMARY KEY '
+            'REFERENCES reader_entry (id) ON DELETE CASCADE DEFERRABLE INITIALLY DEFERRED, '
+            'document tsvector NOT NULL)'
+        )
+        schema_editor.execute('CREATE INDEX reader_entrysearch_document ON reader_entrysearch USING GIN (document)')
+    elif vendor == 'sqlite':
+        try:
+            schema_editor.execute('CREATE VIRTUAL TABLE reader_entry_fts USING fts5(title, body)')
+        except DatabaseError:
+            # SQLite built without FTS5, search finds nothing until the table exists
+            pass
+
+
+def drop_search_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'postgresql':
+        schema_editor.execute('DROP TABLE IF EXISTS reader_entrysearch')
+    elif vendor == 'sqlite':
+        schema_editor.execute('DROP TABLE IF EXISTS reader_entry_fts')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('reader', '0010_entry_snippet'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='entry',
+            name='indexed',
+            field=models.BooleanField(db_index=True, default=False),
+        ),
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
@@ -0,0 +1,37 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+import model_utils.fields
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('reader', '0011_entry_search'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DiscoveryJob',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created', model_utils.fields.AutoCreatedField(default=django.utils.timezone.now, editable=False, verbose_name='created')),
+                ('modified', model_utils.fields.AutoLastModifiedField(default=django.utils.timezone.now, editable=False, verbose_name='modified')),
+                ('url', models.URLField(max_length=2083)),
+                ('status', models.CharField(choices=[('p', 'Pending'), ('r', 'Running'), ('d', 'Done'), ('f', 'Failed')], db_index=True, default='p', max_length=1)),
+                ('notes', models.TextField(blank=True)),
+                ('feeds', models.ManyToManyField(blank=True, to='reader.Feed')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'ordering': ('created',),
+                'verbose_name': 'Discovery Job',
+                'verbose_name_plural': 'Discovery Jobs',
+            },
+        ),
+    ]
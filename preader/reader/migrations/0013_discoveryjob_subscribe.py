@@ -0,0 +1,19 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('reader', '0012_discoveryjob'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='discoveryjob',
+            name='subscribe',
+            field=models.BooleanField(default=False),
+        ),
+    ]
@@ -0,0 +1,29 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.conf import settings
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('reader', '0013_discoveryjob_subscribe'),
+    ]
+
+    operations = [
+        migrations.AlterIndexTogether(
+            name='feed',
+            index_together=set([('disabled', 'has_subscribers', 'next_checked')]),
+        ),
+        migrations.AlterIndexTogether(
+            name='entry',
+            index_together=set([('feed', 'published', 'id'), ('feed', 'added_to_subscribers', 'id')]),
+        ),
+        migrations.AlterIndexTogether(
+            name='userentry',
+            index_together=set([('user', 'status', 'published', 'id'), ('user', 'published', 'id'),
+                                ('user', 'feed', 'status')]),
+        ),
+    ]
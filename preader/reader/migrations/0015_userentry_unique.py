@@ -0,0 +1,37 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.conf import settings
+from django.db import migrations
+from django.db.models import Count
+
+# which copy of a duplicated user entry survives: saved, then read, then unread, then the oldest
+STATUS_RANK = {'s': 0, 'r': 1, 'u': 2}
+
+
+def forwards(apps, schema_editor):
+    # concurrent fan-out and backfills could add an entry to a user twice before the constraint existed
+    UserEntry = apps.get_model('reader', 'UserEntry')
+    duplicates = list(
+        UserEntry.objects.values('user_id', 'entry_id').annotate(copies=Count('id')).filter(copies__gt=1).order_by()
+    )
+    for duplicate in duplicates:
+        copies = UserEntry.objects.filter(user_id=duplicate['user_id'], entry_id=duplicate['entry_id'])
+        keep = min(copies.values_list('id', 'status'), key=lambda copy: (STATUS_RANK.get(copy[1], 3), copy[0]))
+        copies.exclude(id=keep[0]).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('reader', '0014_composite_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(forwards, migrations.RunPython.noop),
+        migrations.AlterUniqueTogether(
+            name='userentry',
+            unique_together=set([('user', 'entry')]),
+        ),
+    ]
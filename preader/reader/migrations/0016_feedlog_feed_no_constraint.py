@@ -0,0 +1,21 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('reader', '0015_userentry_unique'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='feedlog',
+            name='feed',
+            field=models.ForeignKey(db_constraint=False, editable=False,
+                                    on_delete=django.db.models.deletion.DO_NOTHING, to='reader.Feed'),
+        ),
+    ]
@@ -0,0 +1,24 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('reader', '0016_feedlog_feed_no_constraint'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='feed',
+            name='retain_days',
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='feed',
+            name='retain_entries',
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+    ]
@@ -1,7 +1,8 @@
 from django.conf import settings
 from django.contrib.auth.models import User
-from django.db import models
-from django.db.models import Q
+from django.core.cache import caches
+from django.db import connection, connections, models, transaction, DatabaseError
+from django.db.models import F, Max, Q
 from django.utils.http import http_date
 from django.utils.timezone import (
     now,
@@ -14,10 +15,17 @@ from bs4 import BeautifulSoup
 from model_utils import Choices
 from model_utils.managers import QueryManager
 from model_utils.models import TimeStampedModel
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
-from time import mktime
-from urllib.parse import urljoin
+from multiprocessing import Pool
+from time import mktime, monotonic, sleep
+from urllib.parse import urljoin, urlsplit, urlunsplit
+from .db import bulk_insert, claim, insert_sql, iter_rows, supports_ignore_conflicts
+from .matching import KeywordMatcher
 import hashlib
+import html
+import json
 import bleach
 import requests
 from speedparser import speedparser
@@ -48,7 +56,62 @@ REQ_MAX_REDIRECTS = getattr(settings, 'MAX_REDIRECTS', 3)
 REQ_TIMEOUT = getattr(settings, 'TIMEOUT', 5.0)
 
 MAX_FEEDS = getattr(settings, 'MAX_FEEDS', 5)
+# Entry.snippet column width, snippets are cut to SNIPPET_LENGTH which cannot be longer
+SNIPPET_MAX_LENGTH = 280
+SNIPPET_LENGTH = min(getattr(settings, 'SNIPPET_LENGTH', SNIPPET_MAX_LENGTH), SNIPPET_MAX_LENGTH)
 MAX_BULK_CREATE = getattr(settings, 'MAX_BULK_CREATE', 100)
+# threads downloading feeds in update_feeds
+FETCH_WORKERS = getattr(settings, 'FETCH_WORKERS', 8)
+# seconds a feed claimed by update_feeds is skipped by other workers, in case the claiming worker dies
+FEED_CLAIM_TIMEOUT = getattr(settings, 'FEED_CLAIM_TIMEOUT', 60 * 10)
+
+# how much history a new subscriber gets, None for no limit
+BACKFILL_ENTRIES = getattr(settings, 'BACKFILL_ENTRIES', 50)
+BACKFILL_DAYS = getattr(settings, 'BACKFILL_DAYS', None)
+# create a SubscriptionJob instead of backfilling inside the request
+BACKFILL_IN_BACKGROUND = getattr(settings, 'BACKFILL_IN_BACKGROUND', False)
+# leftover user entries are invisible once unsubscribed, so deleting them can wait for a SubscriptionJob
+UNSUBSCRIBE_IN_BACKGROUND = getattr(settings, 'UNSUBSCRIBE_IN_BACKGROUND', True)
+MAX_DELETE = getattr(settings, 'MAX_DELETE', 500)
+
+# cache holding each user's set of subscribed feed ids
+SUBSCRIPTION_CACHE = getattr(settings, 'SUBSCRIPTION_CACHE', 'default')
+SUBSCRIPTION_CACHE_TIMEOUT = getattr(settings, 'SUBSCRIPTION_CACHE_TIMEOUT', 60 * 60 * 24)
+
+# fan-out is split into shards by subscriber id, each shard is one INSERT in its own transaction
+FANOUT_SHARDS = getattr(settings, 'FANOUT_SHARDS', 1)
+FANOUT_PROCESSES = getattr(settings, 'FANOUT_PROCESSES', 1)
+FANOUT_RETRIES = getattr(settings, 'FANOUT_RETRIES', 3)
+# PostgreSQL channel announcing feeds with new entries, see notify_feeds
+NOTIFY_CHANNEL = getattr(settings, 'NOTIFY_CHANNEL', 'preader_entries')
+# pg_notify payloads must stay under 8000 bytes
+NOTIFY_CHUNK = 500
+# PostgreSQL text search configuration and entries indexed per batch
+SEARCH_CONFIG = getattr(settings, 'SEARCH_CONFIG', 'english')
+SEARCH_INDEX_CHUNK = getattr(settings, 'SEARCH_INDEX_CHUNK', 500)
+# full text index side tables, created by migration 0011
+SEARCH_TABLE_POSTGRESQL = 'reader_entrysearch'
+SEARCH_TABLE_SQLITE = 'reader_entry_fts'
+# search_backend of each (database alias, database name)
+search_backends = {}
+
+# retention: entries beyond the newest RETAIN_ENTRIES of a feed and older than RETAIN_DAYS days are deleted by
+# Entry.delete_expired, None for no limit, deleted RETAIN_CHUNK at a time with RETAIN_PAUSE seconds between chunks.
+# Feed.retain_entries and Feed.retain_days override the caps of one feed
+RETAIN_ENTRIES = getattr(settings, 'RETAIN_ENTRIES', None)
+RETAIN_DAYS = getattr(settings, 'RETAIN_DAYS', None)
+RETAIN_CHUNK = getattr(settings, 'RETAIN_CHUNK', 500)
+RETAIN_PAUSE = getattr(settings, 'RETAIN_PAUSE', 0.5)
+
+# columns written by the INSERT ... SELECT statements adding user entries
+USER_ENTRY_COLUMNS = ('user_id', 'feed_id', 'entry_id', 'status', 'flag', 'published')
+
+# feed discovery runs in a DiscoveryJob, pages are streamed and only read up to the end of <head>
+DISCOVERY_IN_BACKGROUND = getattr(settings, 'DISCOVERY_IN_BACKGROUND', True)
+DISCOVERY_TIMEOUT = getattr(settings, 'DISCOVERY_TIMEOUT', REQ_TIMEOUT)
+DISCOVERY_MAX_BYTES = getattr(settings, 'DISCOVERY_MAX_BYTES', 256 * 1024)
+DISCOVERY_CACHE = getattr(settings, 'DISCOVERY_CACHE', 'default')
+DISCOVERY_CACHE_TIMEOUT = getattr(settings, 'DISCOVERY_CACHE_TIMEOUT', 60 * 60 * 6)
 
 # stolen from http://code.activestate.com/recipes/363841-detect-character-encoding-in-an-xml-file/
 xmlDec = r"""
@@ -65,6 +128,11 @@ xmlDec = r"""
 XML_DECLARATION = re.compile(xmlDec, re.I | re.X)
 
 alphanum = re.compile(r'[\W_]+')
+html_tags = re.compile(r'<[^>]+>')
+block_tags = re.compile(r'</?(?:p|div|br|li|ul|ol|h[1-6]|blockquote|pre|table|tr|td|th)\b[^>]*>', re.IGNORECASE)
+whitespace = re.compile(r'\s+')
+search_terms = re.compile(r'\w+')
+head_end = re.compile(rb'</head\s*>|<body[\s>]', re.IGNORECASE)
 
 
 class SimpleBufferObject(object):
@@ -127,28 +195,120 @@ class Feed(TimeStampedModel):
 
     has_new_entries = models.BooleanField(default=False, db_index=True)
 
+    # bumped whenever the feed's content changes, see versioned_key
+    version = models.PositiveIntegerField(default=0)
+
+    # retention caps of this feed, None uses RETAIN_ENTRIES and RETAIN_DAYS, see Entry.delete_expired
+    retain_entries = models.PositiveIntegerField(null=True, blank=True)
+    retain_days = models.PositiveIntegerField(null=True, blank=True)
+
     def __str__(self):  # pragma: no cover
         return self.title
 
     class Meta:
         ordering = ('-modified', '-created')
+        index_together = (
+            # update_feeds scheduler
+            ('disabled', 'has_subscribers', 'next_checked'),
+        )
+
+    def subscribe(self, user, background=BACKFILL_IN_BACKGROUND):
+        """
+        Subscribe
+
+        Add user to feed's subscriptions and backfill the feed's existing entries.  If background is True the backfill
+        is left to a SubscriptionJob (see the "run_subscription_jobs" command) and the job is returned.
 
-    def subscribe(self, user):
+        :param user: User to subscribe
+        :param background: queue the backfill instead of running it now
+        :return: SubscriptionJob if backfill was queued, else None
+        """
         self.subscriptions.add(user)
-        UserEntry.subscribe_users(user, self)
+        job = None
+        if background:
+            job = SubscriptionJob.objects.create(user=user, feed=self, action=SubscriptionJob.ACTION.backfill)
+        else:
+            UserEntry.subscribe_users(user, self)
+        UserVersion.bump(user)
         if not self.has_subscribers:
             self.has_subscribers = True
             self.save()
+        return job
+
+    @staticmethod
+    def subscribe_feeds(user, feeds):
+        """
+        Subscribe Feeds
 
-    def unsubscribe(self, user):
+        Subscribe user to many feeds at once, the set based version of subscribe: one bulk insert of
+        subscriptions, one UPDATE of has_subscribers and one INSERT ... SELECT backfilling every feed.
+
+        :param user: User to subscribe
+        :param feeds: list of Feeds
+        :return: number of feeds the user was not subscribed to yet
+        """
+        through = Feed.subscriptions.through
+        feed_ids = {feed.pk for feed in feeds}
+        feed_ids -= set(through.objects.filter(user=user, feed_id__in=feed_ids).values_list('feed_id', flat=True))
+        if not feed_ids:
+            return 0
+        with transaction.atomic():
+            # a subscription added at the same time, e.g. by a second import, is skipped instead of failing
+            bulk_insert(through, [through(feed_id=feed_id, user_id=user.pk) for feed_id in feed_ids],
+                        ignore_conflicts=True)
+            Feed.objects.filter(pk__in=feed_ids, has_subscribers=False).update(has_subscribers=True)
+            UserEntry.subscribe_user_feeds(user, feed_ids)
+        clear_subscribed_feed_ids(user)
+        UserVersion.bump(user)
+        return len(feed_ids)
+
+    def unsubscribe(self, user, background=UNSUBSCRIBE_IN_BACKGROUND):
+        """
+        Unsubscribe
+
+        Remove user from feed's subscriptions, the feed is hidden from the user right away.  The user's entries
+        for the feed are deleted in chunks, by a SubscriptionJob if background is True.
+
+        :param user: User to unsubscribe
+        :param background: queue the delete instead of running it now
+        :return: SubscriptionJob if delete was queued, else None
+        """
         self.subscriptions.remove(user)
-        UserEntry.unsubscribe_users(user, self)
-        if self.subscriptions.count() < 1:
+        UserVersion.bump(user)
+        job = None
+        if background:
+            job = SubscriptionJob.objects.create(user=user, feed=self, action=SubscriptionJob.ACTION.unsubscribe)
+        else:
+            UserEntry.unsubscribe_users(user, self)
+        if not self.subscriptions.exists():
             self.has_subscribers = False
             self.save()
+        return job
+
+    @staticmethod
+    def purge_user(user, background=UNSUBSCRIBE_IN_BACKGROUND):
+        """
+        Purge User
+
+        Unsubscribe user from every feed and delete all of the user's entries in chunks, by a SubscriptionJob if
+        background is True.  Use before deleting a user, deleting the User row cascades in one unbounded delete.
+
+        :param user: User to purge
+        :param background: queue the delete instead of running it now
+        :return: SubscriptionJob if delete was queued, else None
+        """
+        feed_ids = list(Feed.objects.filter(subscriptions=user).values_list('id', flat=True))
+        Feed.subscriptions.through.objects.filter(user=user).delete()
+        clear_subscribed_feed_ids(user)
+        Feed.objects.filter(id__in=feed_ids, subscriptions=None).update(has_subscribers=False)
+        UserVersion.bump(user)
+        if background:
+            return SubscriptionJob.objects.create(user=user, action=SubscriptionJob.ACTION.purge)
+        UserEntry.purge_users(user)
+        return None
 
     def is_subscribed(self, user):
-        return self.subscriptions.filter(pk=user.pk).exists()
+        return self.pk in get_subscribed_feed_ids(user)
 
     def increment_error_count(self):
         self.error_count += 1
@@ -162,62 +322,112 @@ class Feed(TimeStampedModel):
     @staticmethod
     def get_feeds_from_url(url):
         """
-        From URL, check if URL is a feed or if URL has feeds.
-        Returns a list of Feed objects with feeds from URL
+        Get Feeds From URL
+
+        Check if URL is a feed or if URL has feeds.  The page is streamed and only read up to the end of its
+        <head>, with DISCOVERY_TIMEOUT per read and for the whole download.  Results, including no feeds found,
+        are cached per normalized URL for DISCOVERY_CACHE_TIMEOUT, connection errors and server errors are not.
+
+        :param url: URL of a feed or a page linking to feeds
+        :return: list of Feed objects
         """
-        feeds = []
-        # check if URL is already in database
-        existing = Feed.objects.filter(feed_url=url)
-        if existing:
-            return [existing.first(), ]
+        feeds = Feed.get_known_feeds(url)
+        if feeds is not None:
+            return feeds
+
         # not in database, check the URL via GET request
-        req = requests.get(
-            url,
-            headers=HEADERS,
-            allow_redirects=True
-        )
-        if req.status_code == requests.codes.ok:
-            req.encoding = 'utf-8'
-            # sometimes content types have extra text, get rid of ';'
-            content_type = req.headers.get('content-type', None)
-            if ';' in content_type:
-                content_type = content_type.split(';')[0]
-            # is this URL a feed?
-            if content_type in FEED_TYPES:
-                feed, created = Feed.objects.get_or_create(feed_url=req.url, defaults={'title': 'no title yet'})
-                return [feed, ]
-            # no feed, check for feeds in head
-
-            html = BeautifulSoup(req.text, 'lxml')
-            if html.head is not None:
-                for feed_type in FEED_TYPES:
-                    feed_count = 0
-                    for link in html.head.find_all(type=feed_type):
-                        feed_url = urljoin(req.url, link.get('href'))
-                        feed, created = Feed.objects.get_or_create(
-                            feed_url=feed_url,
-                            defaults={'title': 'no title yet'}
-                        )
-                        feeds.append(feed)
-                        feed_count += 1
-                        if feed_count >= MAX_FEEDS:
-                            break
-                return feeds
+        normalized = normalize_url(url)
+        feed_urls, cacheable = fetch_feed_urls(normalized)
+        feeds = Feed.get_or_create_feeds(feed_urls)
+        if cacheable:
+            caches[DISCOVERY_CACHE].set(
+                discovery_key(normalized), [feed.pk for feed in feeds], DISCOVERY_CACHE_TIMEOUT)
         return feeds
 
     @staticmethod
-    def update_feeds(num=10):
+    def get_known_feeds(url):
+        """
+        Get Known Feeds
+
+        Feeds for a URL that is already a feed or was checked recently, without any request.
+
+        :param url: URL of a feed or a page linking to feeds
+        :return: list of Feed objects or None if the URL has to be fetched
+        """
+        normalized = normalize_url(url)
+        existing = Feed.objects.filter(feed_url__in={url, normalized}).first()
+        if existing is not None:
+            return [existing, ]
+
+        feed_ids = caches[DISCOVERY_CACHE].get(discovery_key(normalized))
+        if feed_ids is None:
+            return None
+        feeds = Feed.objects.in_bulk(feed_ids)
+        return [feeds[feed_id] for feed_id in feed_ids if feed_id in feeds]
+
+    @staticmethod
+    def get_or_create_feeds(feed_urls, titles=None):
+        """
+        Get Or Create Feeds
+
+        Feeds for a list of URLs with one query for existing feeds and one bulk insert for the rest.  Feeds created
+        at the same time by someone else are skipped by the insert and found by the query that follows it.
 
-        with SimpleBufferObject(Entry) as new_entry_buffer:
+        :param feed_urls: list of feed URLs
+        :param titles: optional dict of feed URL to title for new feeds
+        :return: list of Feed objects in the order of feed_urls, without duplicates
+        """
+        titles = titles or {}
+        feed_urls = list(OrderedDict.fromkeys(feed_urls))
+        if not feed_urls:
+            return []
+        feeds = {feed.feed_url: feed for feed in Feed.objects.filter(feed_url__in=feed_urls)}
+        missing = [feed_url for feed_url in feed_urls if feed_url not in feeds]
+        if missing:
+            bulk_insert(Feed, [
+                Feed(feed_url=feed_url, title=shorten_string(titles.get(feed_url) or 'no title yet'))
+                for feed_url in missing
+            ], ignore_conflicts=True)
+            # bulk inserts do not set primary keys, read the new feeds back
+            feeds.update((feed.feed_url, feed) for feed in Feed.objects.filter(feed_url__in=missing))
+        return [feeds[feed_url] for feed_url in feed_urls if feed_url in feeds]
+
+    @staticmethod
+    def update_feeds(num=10, feed_ids=None, workers=FETCH_WORKERS):
+        """
+        Update Feeds
+
+        Fetch and parse up to "num" active feeds that are due, or the active feeds in feed_ids.  Feeds are
+        downloaded concurrently by "workers" threads, parsing and database writes stay in this thread.  Due feeds
+        are claimed (see db.claim) by moving next_checked FEED_CLAIM_TIMEOUT seconds ahead, so several update_feeds
+        processes can run at once without fetching the same feed.
+
+        :param num: maximum number of feeds to update
+        :param feed_ids: update these feeds whether they are due or not
+        :param workers: download threads
+        """
+
+        with SimpleBufferObject(Entry) as new_entry_buffer, SimpleBufferObject(FeedLog) as log_buffer:
             current_time = now()
 
-            # get all active feeds with subscribers that have not been checked or need to be checked based
-            # on "next_checked"
-            feeds = Feed.active.filter(Q(next_checked=None) | Q(next_checked__lte=current_time))[:num]
+            if feed_ids is None:
+                # get all active feeds with subscribers that have not been checked or need to be checked based
+                # on "next_checked"
+                claimed = claim(
+                    Feed.active.filter(Q(next_checked=None) | Q(next_checked__lte=current_time)), num,
+                    next_checked=current_time + timedelta(seconds=FEED_CLAIM_TIMEOUT)
+                )
+                feeds = list(Feed.objects.filter(pk__in=claimed))
+            else:
+                feeds = list(Feed.active.filter(pk__in=feed_ids))
 
             for feed in feeds:
                 # update last checked to current time
                 feed.last_checked = now()
+            all_headers = [feed_headers(feed) for feed in feeds]
+            responses = fetch_all([feed.feed_url for feed in feeds], all_headers, workers)
+
+            for feed, headers, response in zip(feeds, all_headers, responses):
                 # set "next_checked" based on "check_frequency"
                 feed.next_checked = feed.last_checked + timedelta(hours=feed.check_frequency)
 
@@ -225,16 +435,10 @@ class Feed(TimeStampedModel):
                 log = FeedLog(feed=feed)
                 notes = []
 
-                # load conditional GET headers from feed object
-                headers = HEADERS
-                if feed.etag and feed.etag != '':
-                    headers['If-None-Match'] = feed.etag
-                if feed.last_modified:
-                    last_modified = make_naive(feed.last_modified)
-                    headers['If-Modified-Since'] = http_date(last_modified.timestamp())
-
                 try:
-                    req = requests.get(feed.feed_url, headers=headers, allow_redirects=True)
+                    if isinstance(response, Exception):
+                        raise response
+                    req = response
 
                     log.status_code = req.status_code
                     log.headers = ', '.join("{!s}={!r}".format(key, val) for (key, val) in headers.items())
@@ -279,9 +483,14 @@ class Feed(TimeStampedModel):
                         else:
                             # update feed meta data, reset error count
                             feed.reset_error_count()
+                            meta = (feed.title, feed.description)
                             feed.title = parsed.feed.get('title', feed.title)
                             feed.title = shorten_string(feed.title)
-                            feed.description = parsed.feed.get('description', parsed.feed.get('subtitle', None))
+                            description = parsed.feed.get('description', parsed.feed.get('subtitle', None))
+                            # cleaned the way the field is cleaned on save, so an unchanged description compares
+                            # equal to the stored one
+                            feed.description = bleach.clean(
+                                description or '', **Feed._meta.get_field('description').bleach_kwargs)
                             # icon/logo are not working in speedparser
                             # feed.icon = parsed.feed.get('logo', feed.icon)
 
@@ -334,6 +543,7 @@ class Feed(TimeStampedModel):
                                             title=title,
                                             author=author,
                                             content=content,
+                                            snippet=make_snippet(content),
                                             published=published,
                                             updated=feed_datetime(entry.get('updated_parsed', None),
                                                                   default=feed.last_checked)
@@ -344,7 +554,10 @@ class Feed(TimeStampedModel):
                                     break
 
                             if log.entries > 0:
-                                feed.has_new_feeds = True
+                                feed.has_new_entries = True
+                            # a feed parsed without changes keeps its cached pages and ETags
+                            if log.entries > 0 or (feed.title, feed.description) != meta:
+                                feed.version = F('version') + 1
                     else:
                         notes.append('error: {0}'.format(req.status_code))
                         feed.increment_error_count()
@@ -366,7 +579,184 @@ class Feed(TimeStampedModel):
                 duration = now() - feed.last_checked
                 log.duration = duration.microseconds
                 feed.save()
-                log.save()
+                log_buffer.add(log)
+
+        # new entries were written when the buffer closed
+        Entry.index_pending()
+
+
+def _subscription_key(user_id):
+    return 'preader:subscriptions:{0}'.format(user_id)
+
+
+def feed_headers(feed):
+    """
+    Feed Headers
+
+    :param feed: Feed
+    :return: request headers with conditional GET headers from the feed's last response
+    """
+    headers = dict(HEADERS)
+    if feed.etag and feed.etag != '':
+        headers['If-None-Match'] = feed.etag
+    if feed.last_modified:
+        last_modified = make_naive(feed.last_modified)
+        headers['If-Modified-Since'] = http_date(last_modified.timestamp())
+    return headers
+
+
+def fetch_all(urls, all_headers, workers=FETCH_WORKERS):
+    """
+    Fetch All
+
+    GET many URLs with a pool of "workers" threads.  Threads only do network IO, they never touch the database.
+
+    :param urls: list of URLs
+    :param all_headers: list of request headers, one per URL
+    :param workers: number of threads, 1 fetches in this thread
+    :return: list of Response objects, or the exception raised for a URL, in the order of urls
+    """
+    def fetch(args):
+        url, headers = args
+        try:
+            return requests.get(url, headers=headers, allow_redirects=True, timeout=REQ_TIMEOUT)
+        except requests.exceptions.RequestException as e:
+            return e
+
+    tasks = list(zip(urls, all_headers))
+    if workers > 1 and len(tasks) > 1:
+        with ThreadPoolExecutor(max_workers=min(workers, len(tasks))) as executor:
+            return list(executor.map(fetch, tasks))
+    return [fetch(task) for task in tasks]
+
+
+def discovery_key(normalized_url):
+    return 'preader:discovery:{0}'.format(hashlib.sha1(normalized_url.encode('utf-8')).hexdigest())
+
+
+def normalize_url(url):
+    """
+    Normalize URL
+
+    Lower case scheme and host, no default port, no fragment and "/" for an empty path, so URLs naming the same
+    page share a discovery cache entry.
+
+    :param url: URL
+    :return: normalized URL
+    """
+    parts = urlsplit(url.strip())
+    scheme = parts.scheme.lower()
+    netloc = parts.netloc.lower()
+    if (scheme, netloc.rsplit(':', 1)[-1]) in (('http', '80'), ('https', '443')):
+        netloc = netloc.rsplit(':', 1)[0]
+    return urlunsplit((scheme, netloc, parts.path or '/', parts.query, ''))
+
+
+def fetch_feed_urls(url):
+    """
+    Fetch Feed URLs
+
+    Feed URLs of a URL that is a feed or a page linking to feeds, only network IO so it can run in a thread.  The
+    page is streamed and only read up to the end of its <head>.
+
+    :param url: normalized URL
+    :return: (list of feed URLs, True if the result may be cached)
+    """
+    req = requests.get(url, headers=HEADERS, allow_redirects=True, stream=True, timeout=DISCOVERY_TIMEOUT)
+    feed_urls = []
+    try:
+        if req.status_code == requests.codes.ok:
+            # sometimes content types have extra text, get rid of ';'
+            content_type = (req.headers.get('content-type', None) or '').split(';')[0].strip()
+            # is this URL a feed?
+            if content_type in FEED_TYPES:
+                feed_urls.append(req.url)
+            else:
+                # no feed, check for feeds in head
+                html = BeautifulSoup(read_head(req), 'lxml')
+                if html.head is not None:
+                    for feed_type in FEED_TYPES:
+                        links = [link for link in html.head.find_all(type=feed_type) if link.get('href')]
+                        feed_urls.extend(urljoin(req.url, link.get('href')) for link in links[:MAX_FEEDS])
+    finally:
+        req.close()
+    # server errors may go away, everything else is an answer
+    return feed_urls, req.status_code < 500
+
+
+def read_head(response, max_bytes=DISCOVERY_MAX_BYTES, timeout=DISCOVERY_TIMEOUT):
+    """
+    Read Head
+
+    Read a streamed response up to the end of its <head>, at most max_bytes and for at most timeout seconds.
+
+    :param response: requests Response, requested with stream=True
+    :param max_bytes: maximum bytes read
+    :param timeout: seconds allowed for the whole download
+    :return: decoded text of the start of the page
+    """
+    data = b''
+    deadline = monotonic() + (timeout if isinstance(timeout, (int, float)) else sum(timeout))
+    for chunk in response.iter_content(8192):
+        data += chunk
+        end = head_end.search(data)
+        if end is not None:
+            data = data[:end.start()]
+            break
+        if len(data) >= max_bytes or monotonic() > deadline:
+            break
+    return data[:max_bytes].decode(response.encoding or 'utf-8', errors='replace')
+
+
+def get_subscribed_feed_ids(user):
+    """
+    Get Subscribed Feed IDs
+
+    Ids of every feed user is subscribed to, disabled feeds included.  Read from SUBSCRIPTION_CACHE, the database is
+    only queried after a change of the user's subscriptions cleared the cached set, see subscriptions_changed.
+
+    :param user: User
+    :return: frozenset of Feed ids
+    """
+    cache = caches[SUBSCRIPTION_CACHE]
+    key = _subscription_key(user.pk)
+    feed_ids = cache.get(key)
+    if feed_ids is None:
+        feed_ids = frozenset(
+            Feed.subscriptions.through.objects.filter(user_id=user.pk).values_list('feed_id', flat=True))
+        cache.set(key, feed_ids, SUBSCRIPTION_CACHE_TIMEOUT)
+    return feed_ids
+
+
+def clear_subscribed_feed_ids(users):
+    """
+    Clear Subscribed Feed IDs
+
+    :param users: User, or iterable of Users or user ids
+    """
+    if not hasattr(users, '__iter__'):
+        users = (users, )
+
+    caches[SUBSCRIPTION_CACHE].delete_many([_subscription_key(getattr(user, 'pk', user)) for user in users])
+
+
+def subscriptions_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    """
+    Subscriptions Changed
+
+    m2m_changed receiver for Feed.subscriptions clearing the cached feed ids of every user whose subscriptions
+    changed, whether through Feed.subscribe, the admin or any other write to the relation.  Bulk inserts and
+    deletes on the through table send no signal and clear the cache themselves.  Connected in ReaderConfig.ready.
+    """
+    if action not in ('post_add', 'post_remove', 'pre_clear'):
+        return
+    if reverse:
+        # user.feed_set changed
+        clear_subscribed_feed_ids(instance)
+    elif action == 'pre_clear':
+        clear_subscribed_feed_ids(list(instance.subscriptions.values_list('pk', flat=True)))
+    else:
+        clear_subscribed_feed_ids(pk_set)
 
 
 def shorten_string(string, max_len=255, end='...'):
@@ -376,6 +766,31 @@ def shorten_string(string, max_len=255, end='...'):
     return string
 
 
+def plain_text(content):
+    """
+    Plain Text
+
+    :param content: HTML content
+    :return: content with tags removed, entities decoded and whitespace collapsed
+    """
+    if not content:
+        return ''
+    return whitespace.sub(' ', html.unescape(html_tags.sub('', block_tags.sub(' ', content)))).strip()
+
+
+def make_snippet(content, max_len=SNIPPET_LENGTH):
+    """
+    Make Snippet
+
+    Plain text version of an entry's HTML content shortened to max_len.
+
+    :param content: HTML content
+    :param max_len: maximum length of snippet
+    :return: plain text snippet
+    """
+    return shorten_string(plain_text(content), max_len)
+
+
 def feed_datetime(timetuple, allow_none=False, default=None):
     """
     Feed Datetime
@@ -422,19 +837,240 @@ class Entry(models.Model):
     title = models.CharField(max_length=255)
     author = models.CharField(max_length=255, blank=True)
     content = BleachField()
+    # plain text start of content for list views, full content is loaded on demand
+    snippet = models.CharField(max_length=SNIPPET_MAX_LENGTH, blank=True)
     updated = models.DateTimeField(blank=True)
     published = models.DateTimeField(db_index=True)
 
     added_to_subscribers = models.BooleanField(default=False, db_index=True)
+    # in the full text index, cleared when title or content change
+    indexed = models.BooleanField(default=False, db_index=True)
 
     class Meta:
         ordering = ('-published', '-updated')
         get_latest_by = 'published'
         verbose_name_plural = 'entries'
+        index_together = (
+            # entry lists and latest entries, newest first
+            ('feed', 'published', 'id'),
+            # fan-out of a feed's new entries
+            ('feed', 'added_to_subscribers', 'id'),
+        )
 
     def __str__(self):  # pragma: no cover
         return '{0}: {1}'.format(self.feed, self.entry_id)
 
+    @staticmethod
+    def latest_for_feeds(feed_ids, num):
+        """
+        Latest For Feeds
+
+        Newest "num" entries of every feed in feed_ids with a single query.  Entries are picked per feed with a
+        LATERAL join on PostgreSQL and a ROW_NUMBER() window on other databases.
+
+        :param feed_ids: list of Feed ids
+        :param num: entries per feed
+        :return: Entry queryset, newest first
+        """
+        feed_ids = list(feed_ids)
+        if not feed_ids:
+            return Entry.objects.none()
+        if connection.vendor == 'postgresql':
+            where = (
+                '{0}.id IN (SELECT latest.id FROM unnest(%s) AS f(id) CROSS JOIN LATERAL ('
+                'SELECT e.id FROM {0} e WHERE e.feed_id = f.id ORDER BY e.published DESC, e.id DESC LIMIT %s'
+                ') latest)'
+            )
+            params = [feed_ids, num]
+        else:
+            where = (
+                '{0}.id IN (SELECT ranked.id FROM ('
+                'SELECT e.id, ROW_NUMBER() OVER (PARTITION BY e.feed_id ORDER BY e.published DESC, e.id DESC) AS row_num '
+                'FROM {0} e WHERE e.feed_id IN ({1})'
+                ') ranked WHERE ranked.row_num <= %s)'
+            )
+            params = feed_ids + [num]
+        where = where.format(Entry._meta.db_table, ', '.join(['%s'] * len(feed_ids)))
+        return Entry.objects.extra(where=[where], params=params).order_by('-published', '-id')
+
+    @staticmethod
+    def search(query, feed_ids):
+        """
+        Search
+
+        Full text search of entries' titles and content.  Uses a tsvector side table with a GIN index on
+        PostgreSQL and an FTS5 table on SQLite, other databases (or SQLite built without FTS5) find nothing.
+        All words in query must match.
+
+        :param query: search text
+        :param feed_ids: ids of feeds to search, usually the user's subscriptions
+        :return: Entry queryset
+        """
+        feed_ids = list(feed_ids)
+        backend = search_backend()
+        if not feed_ids or backend is None:
+            return Entry.objects.none()
+        if backend == 'postgresql':
+            where = '{0}.id IN (SELECT entry_id FROM {1} WHERE document @@ plainto_tsquery(%s::regconfig, %s))'
+            params = [SEARCH_CONFIG, query]
+        else:
+            # quote every word so user input is never read as FTS5 query syntax
+            terms = ' '.join('"{0}"'.format(term) for term in search_terms.findall(query))
+            if not terms:
+                return Entry.objects.none()
+            where = '{0}.id IN (SELECT rowid FROM {1} WHERE {1} MATCH %s)'
+            params = [terms]
+        where = where.format(Entry._meta.db_table, backend_search_table(backend))
+        return Entry.objects.filter(feed_id__in=feed_ids).extra(where=[where], params=params)
+
+    @staticmethod
+    def index_pending(chunk=SEARCH_INDEX_CHUNK):
+        """
+        Index Pending
+
+        Add entries not yet in the full text index, chunk entries at a time.  Each chunk is written with one
+        executemany and flagged indexed with one UPDATE.
+
+        :param chunk: entries per batch
+        :return: number of entries indexed
+        """
+        backend = search_backend()
+        if backend is None:
+            return 0
+        if backend == 'postgresql':
+            sql = (
+                'INSERT INTO {0} (entry_id, document) '
+                'VALUES (%s, setweight(to_tsvector(%s::regconfig, %s), \'A\') || to_tsvector(%s::regconfig, %s)) '
+                'ON CONFLICT (entry_id) DO UPDATE SET document = EXCLUDED.document'
+            ).format(SEARCH_TABLE_POSTGRESQL)
+        else:
+            sql = 'INSERT OR REPLACE INTO {0} (rowid, title, body) VALUES (%s, %s, %s)'.format(SEARCH_TABLE_SQLITE)
+
+        count = 0
+        while True:
+            entries = list(
+                Entry.objects.filter(indexed=False).order_by('id').values_list('id', 'title', 'content')[:chunk])
+            if not entries:
+                return count
+            if backend == 'postgresql':
+                rows = [
+                    (pk, SEARCH_CONFIG, title, SEARCH_CONFIG, plain_text(content)) for pk, title, content in entries
+                ]
+            else:
+                rows = [(pk, title, plain_text(content)) for pk, title, content in entries]
+            with transaction.atomic():
+                with connection.cursor() as cursor:
+                    cursor.executemany(sql, rows)
+                Entry.objects.filter(id__in=[row[0] for row in rows]).update(indexed=True)
+            count += len(rows)
+
+    @staticmethod
+    def rebuild_index(chunk=SEARCH_INDEX_CHUNK):
+        """
+        Rebuild Index
+
+        Empty the full text index and index every entry again.
+
+        :param chunk: entries per batch
+        :return: number of entries indexed
+        """
+        backend = search_backend()
+        if backend is None:
+            return 0
+        with transaction.atomic():
+            with connection.cursor() as cursor:
+                cursor.execute('DELETE FROM {0}'.format(backend_search_table(backend)))
+            Entry.objects.filter(indexed=True).update(indexed=False)
+        return Entry.index_pending(chunk)
+
+
+    @staticmethod
+    def expired(feed_id, max_entries=RETAIN_ENTRIES, max_days=RETAIN_DAYS):
+        """
+        Expired
+
+        A feed's entries past its retention caps: not among the newest "max_entries" and published more than
+        "max_days" days ago.  The newest entry is never expired because update_feeds compares new items against
+        it, entries that are saved by a user or not yet added to subscribers are never expired either.
+
+        :param feed_id: Feed id
+        :param max_entries: entries to keep, None for no limit
+        :param max_days: days of entries to keep, None for no limit
+        :return: Entry queryset
+        """
+        keep = max(max_entries or 1, 1)
+        boundary = Entry.objects.filter(feed_id=feed_id).order_by('-published', '-id').values_list(
+            'published', 'id')[keep - 1:keep].first()
+        if boundary is None:
+            return Entry.objects.none()
+        published, pk = boundary
+        entries = Entry.objects.filter(
+            Q(published__lt=published) | Q(published=published, id__lt=pk),
+            feed_id=feed_id, added_to_subscribers=True
+        ).exclude(userentry__status=UserEntry.SAVED)
+        if max_days is not None:
+            entries = entries.filter(published__lt=now() - timedelta(days=max_days))
+        return entries
+
+    @staticmethod
+    def delete_expired(feed_ids=None, max_entries=RETAIN_ENTRIES, max_days=RETAIN_DAYS, chunk=RETAIN_CHUNK,
+                       pause=RETAIN_PAUSE):
+        """
+        Delete Expired
+
+        Delete the expired entries (see Entry.expired) of every feed, or the feeds in feed_ids, with their user
+        entries and full text index rows.  A feed's retain_entries and retain_days replace max_entries and
+        max_days for that feed.  Each chunk of "chunk" entries is one short transaction followed by a "pause"
+        seconds sleep, so it can run alongside live traffic.  An entry that gets saved while it is being deleted
+        keeps its saved user entry and is skipped.
+
+        :param feed_ids: ids of feeds to expire, None for every feed
+        :param max_entries: entries to keep per feed without retain_entries, None for no limit
+        :param max_days: days of entries to keep per feed without retain_days, None for no limit
+        :param chunk: entries per transaction
+        :param pause: seconds to sleep between chunks
+        :return: number of entries deleted
+        """
+        feeds = Feed.objects.order_by('pk').values_list('pk', 'retain_entries', 'retain_days')
+        if feed_ids is not None:
+            feeds = feeds.filter(pk__in=feed_ids)
+        if max_entries is None and max_days is None:
+            # only feeds with caps of their own
+            feeds = feeds.filter(Q(retain_entries__isnull=False) | Q(retain_days__isnull=False))
+        backend = search_backend()
+
+        count = 0
+        for feed_id, retain_entries, retain_days in iter_rows(feeds):
+            if retain_entries is None:
+                retain_entries = max_entries
+            if retain_days is None:
+                retain_days = max_days
+            if retain_entries is None and retain_days is None:
+                continue
+            deleted = 0
+            expired = Entry.expired(feed_id, retain_entries, retain_days).order_by('published', 'id')
+            while True:
+                ids = list(expired.values_list('id', flat=True)[:chunk])
+                if not ids:
+                    break
+                with transaction.atomic():
+                    UserEntry.objects.filter(entry_id__in=ids).exclude(status=UserEntry.SAVED).delete()
+                    # anything left was saved or added since the ids were read
+                    ids = list(Entry.objects.filter(id__in=ids, userentry__isnull=True).values_list('id', flat=True))
+                    if ids and backend is not None:
+                        with connection.cursor() as cursor:
+                            cursor.execute('DELETE FROM {0} WHERE {1} IN ({2})'.format(
+                                backend_search_table(backend), 'entry_id' if backend == 'postgresql' else 'rowid',
+                                ', '.join(['%s'] * len(ids))), ids)
+                    Entry.objects.filter(id__in=ids).delete()
+                deleted += len(ids)
+                sleep(pause)
+            if deleted:
+                Feed.objects.filter(pk=feed_id).update(version=F('version') + 1)
+                UserVersion.bump_subscribers([feed_id])
+                count += deleted
+        return count
+
 
 class UserEntry(models.Model):
     UNREAD = 'u'
@@ -445,10 +1081,21 @@ class UserEntry(models.Model):
         (READ, 'Read'),
         (SAVED, 'Saved'),
     )
+    NO_FLAG = ''
+    MUTED = 'm'
+    HIGHLIGHTED = 'h'
+    FLAGS = (
+        (NO_FLAG, 'None'),
+        (MUTED, 'Muted'),
+        (HIGHLIGHTED, 'Highlighted'),
+    )
     user = models.ForeignKey(User)
     feed = models.ForeignKey(Feed)
     entry = models.ForeignKey(Entry)
     status = models.CharField(max_length=1, choices=STATUS, default=UNREAD)
+    flag = models.CharField(max_length=1, choices=FLAGS, default=NO_FLAG, blank=True)
+    # copy of entry.published so the timeline is read from the index alone
+    published = models.DateTimeField(null=True, blank=True)
 
     objects = models.Manager()
     read = QueryManager(status=READ)
@@ -458,57 +1105,662 @@ class UserEntry(models.Model):
     class Meta:
         verbose_name = 'User Entry'
         verbose_name_plural = 'User Entries'
+        index_together = (
+            # timeline
+            ('user', 'status', 'published', 'id'),
+            ('user', 'published', 'id'),
+            # a user's entries of one feed, entry actions and unsubscribing
+            ('user', 'feed', 'status'),
+        )
+        # lets fan-out and backfills skip entries a user already has with ON CONFLICT DO NOTHING
+        unique_together = (('user', 'entry'), )
 
     @staticmethod
-    def update_subscriptions():
+    def update_subscriptions(shards=FANOUT_SHARDS, processes=FANOUT_PROCESSES, retries=FANOUT_RETRIES):
         """
         Add New Entries
 
-        For all feeds with new_entries flag, get all subscribers and feeds with added_to_subscribers flag false.
-        For each subscriber, add to bulk create buffer a new UserEntry object.
-        Update flags on entries and feeds.
+        For all feeds with new_entries flag, add entries with added_to_subscribers flag false to every subscriber.
+        Subscribers of each feed are split into "shards" ranges of user ids, each shard is run by fan_out_shard
+        in its own transaction, in a pool of "processes" worker processes if more than one.
+        Entry flags are only updated once every shard of a feed succeeded, a feed with a failed shard keeps its
+        new_entries flag and is retried on the next run.  Subscribers' FilterRules are applied once per new entry.
+        SQLite takes one writer at a time so shards always run in this process there, worker processes would only
+        wait on each other's locks (see db.single_writer).
+
+        :param shards: number of shards per feed
+        :param processes: number of worker processes, 1 runs shards in this process, ignored on SQLite
+        :param retries: attempts per shard before giving up
+        :return: number of UserEntry objects created
+        """
+        tasks = []
+        snapshots = {}
+        for (feed_id, ) in iter_rows(Feed.active.filter(has_new_entries=True).values_list('pk')):
+            # clear the flag first, entries ingested from here on set it again
+            Feed.objects.filter(pk=feed_id).update(has_new_entries=False)
+            max_entry_id = Entry.objects.filter(
+                feed_id=feed_id, added_to_subscribers=False).aggregate(Max('id'))['id__max']
+            if max_entry_id is None:
+                continue
+            snapshots[feed_id] = max_entry_id
+            for min_user_id, max_user_id in UserEntry.user_shards(feed_id, shards):
+                tasks.append((feed_id, max_entry_id, min_user_id, max_user_id, retries))
+
+        if connection.vendor == 'sqlite':
+            processes = 1
+        if processes > 1 and len(tasks) > 1:
+            # worker processes must not share this process' connections
+            for conn in connections.all():
+                conn.close()
+            with Pool(processes) as pool:
+                results = pool.map(fan_out_shard, tasks)
+        else:
+            results = [fan_out_shard(task) for task in tasks]
+
+        count = 0
+        failed = set()
+        for (feed_id, created) in results:
+            if created is None:
+                failed.add(feed_id)
+            else:
+                count += created
+
+        added = set(snapshots.keys()) - failed
+        matcher = None
+        if added:
+            # only the rules of users getting new entries
+            matcher = FilterRule.get_matcher(
+                Feed.subscriptions.through.objects.filter(feed_id__in=added).values('user_id'))
+        for feed_id, max_entry_id in snapshots.items():
+            if feed_id in failed:
+                Feed.objects.filter(pk=feed_id).update(has_new_entries=True)
+            else:
+                if matcher is not None:
+                    FilterRule.apply(matcher, feed_id, max_entry_id)
+                Entry.objects.filter(
+                    feed_id=feed_id, added_to_subscribers=False, id__lte=max_entry_id
+                ).update(added_to_subscribers=True)
+        if count:
+            UserVersion.bump_subscribers(added)
+            notify_feeds(added)
+        return count
 
+    @staticmethod
+    def user_shards(feed, shards):
         """
-        with SimpleBufferObject(UserEntry) as user_entry_object_buffer:
-            feeds = Feed.active.filter(has_new_entries=True)
-            for feed in feeds:
-                entries = feed.entry_set.filter(added_to_subscribers=False).only('id')
-                if entries:
-                    subscribers = feed.subscriptions.all()
-                    for subscriber in subscribers:
-                        for entry in entries:
-                            user_entry_object_buffer.add(
-                                UserEntry(user=subscriber, feed=feed, entry=entry)
-                            )
-                    entries.update(added_to_subscribers=True)
-                feed.has_new_entries = False
-                feed.save()
+        User Shards
+
+        Split a feed's subscribers into at most "shards" contiguous user id ranges of about the same size.  Subscriber
+        ids are streamed with iter_rows, only the bounds of each shard are kept.
+
+        :param feed: Feed or feed id
+        :param shards: number of shards
+        :return: list of (min_user_id, max_user_id) tuples
+        """
+        subscribers = Feed.subscriptions.through.objects.filter(feed=feed)
+        total = subscribers.count()
+        if not total:
+            return []
+        size = -(-total // max(shards, 1))
+        bounds = []
+        for count, (user_id, ) in enumerate(iter_rows(subscribers.order_by('user_id').values_list('user_id'))):
+            if count % size == 0:
+                bounds.append([user_id, user_id])
+            else:
+                bounds[-1][1] = user_id
+        return [tuple(bound) for bound in bounds]
 
     @staticmethod
-    def subscribe_users(users, feed):
+    def fan_out(feed_id, max_entry_id, min_user_id, max_user_id):
+        """
+        Fan Out
+
+        Add a feed's entries not yet added to subscribers, up to max_entry_id, for subscribers with user ids from
+        min_user_id to max_user_id with one INSERT ... SELECT in its own transaction.  Entries a user already has
+        are skipped so a shard can be retried, by the unique (user, entry) constraint where the backend can ignore
+        conflicts (see db.supports_ignore_conflicts), otherwise by an anti-join.
+
+        :param feed_id: Feed id
+        :param max_entry_id: newest Entry id to add
+        :param min_user_id: lowest subscriber id in shard
+        :param max_user_id: highest subscriber id in shard
+        :return: number of UserEntry objects created
+        """
+        ignore_conflicts = supports_ignore_conflicts()
+        select = [
+            'SELECT s.user_id, e.feed_id, e.id, %s, %s, e.published FROM {0} e'.format(Entry._meta.db_table),
+            'INNER JOIN {0} s ON s.feed_id = e.feed_id'.format(Feed.subscriptions.through._meta.db_table),
+            'WHERE e.feed_id = %s AND e.added_to_subscribers = %s AND e.id <= %s',
+            'AND s.user_id >= %s AND s.user_id <= %s',
+        ]
+        if not ignore_conflicts:
+            select.append(
+                'AND NOT EXISTS (SELECT 1 FROM {0} ue WHERE ue.user_id = s.user_id AND ue.entry_id = e.id)'.format(
+                    UserEntry._meta.db_table))
+        sql = insert_sql(UserEntry._meta.db_table, USER_ENTRY_COLUMNS, ' '.join(select), ignore_conflicts)
+        with transaction.atomic():
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    sql, [UserEntry.UNREAD, UserEntry.NO_FLAG, feed_id, False, max_entry_id, min_user_id, max_user_id])
+                return cursor.rowcount
+
+    @staticmethod
+    def subscribe_users(users, feed, max_entries=BACKFILL_ENTRIES, max_days=BACKFILL_DAYS):
+        """
+        Subscribe Users
+
+        Backfill a feed's entries that have already been added to subscribers for new subscribers.  Each user gets
+        a single INSERT ... SELECT limited to the newest "max_entries" entries and/or entries published in the last
+        "max_days" days.  Entries the user already has are skipped so a backfill can safely be run again, see
+        fan_out.  The users' FilterRules are applied to the entries added.
+
+        :param users: User or iterable of Users
+        :param feed: Feed to backfill
+        :param max_entries: maximum number of entries per user, None for no limit
+        :param max_days: only entries published within this many days, None for no limit
+        :return: number of UserEntry objects created
+        """
         if not hasattr(users, '__iter__'):
             users = (users, )
 
-        user_entry_object_buffer = SimpleBufferObject(UserEntry)
-        for user in users:
-            entries = feed.entry_set.filter(added_to_subscribers=True).only('id')
-            if entries:
-                for entry in entries:
-                    user_entry_object_buffer.add(
-                        UserEntry(user=user, feed=feed, entry=entry)
-                    )
-        user_entry_object_buffer.purge()
+        ignore_conflicts = supports_ignore_conflicts()
+        select = [
+            'SELECT %s, e.feed_id, e.id, %s, %s, e.published FROM {0} e'.format(Entry._meta.db_table),
+            'WHERE e.feed_id = %s AND e.added_to_subscribers = %s',
+        ]
+        if not ignore_conflicts:
+            select.append('AND NOT EXISTS (SELECT 1 FROM {0} ue WHERE ue.user_id = %s AND ue.entry_id = e.id)'.format(
+                UserEntry._meta.db_table))
+        extra_params = []
+        if max_days is not None:
+            select.append('AND e.published >= %s')
+            extra_params.append(Entry._meta.get_field('published').get_db_prep_value(
+                now() - timedelta(days=max_days), connection))
+        select.append('ORDER BY e.published DESC, e.id DESC')
+        if max_entries is not None:
+            select.append('LIMIT %s')
+            extra_params.append(max_entries)
+        sql = insert_sql(UserEntry._meta.db_table, USER_ENTRY_COLUMNS, ' '.join(select), ignore_conflicts)
+
+        count = 0
+        user_ids = [user.pk for user in users]
+        last_id = UserEntry.last_id()
+        with connection.cursor() as cursor:
+            for user_id in user_ids:
+                params = [user_id, UserEntry.UNREAD, UserEntry.NO_FLAG, feed.pk, True]
+                if not ignore_conflicts:
+                    params.append(user_id)
+                cursor.execute(sql, params + extra_params)
+                count += cursor.rowcount
+        if count:
+            FilterRule.apply_backfill(UserEntry.objects.filter(user_id__in=user_ids, feed=feed, id__gt=last_id))
+        return count
+
+    @staticmethod
+    def subscribe_user_feeds(user, feed_ids, max_entries=BACKFILL_ENTRIES, max_days=BACKFILL_DAYS):
+        """
+        Subscribe User Feeds
+
+        Backfill many feeds for one new subscriber with a single INSERT ... SELECT, the newest "max_entries"
+        entries of each feed are picked with Entry.latest_for_feeds.  Entries the user already has are skipped,
+        the user's FilterRules are applied to the entries added.
+
+        :param user: User
+        :param feed_ids: ids of feeds to backfill
+        :param max_entries: maximum number of entries per feed, None for no limit
+        :param max_days: only entries published within this many days, None for no limit
+        :return: number of UserEntry objects created
+        """
+        feed_ids = list(feed_ids)
+        if not feed_ids:
+            return 0
+        if max_entries is None:
+            entries = Entry.objects.filter(feed_id__in=feed_ids)
+        else:
+            entries = Entry.latest_for_feeds(feed_ids, max_entries)
+        entries = entries.filter(added_to_subscribers=True)
+        if max_days is not None:
+            entries = entries.filter(published__gte=now() - timedelta(days=max_days))
+        entries_sql, entries_params = entries.order_by().values('id').query.sql_with_params()
+
+        ignore_conflicts = supports_ignore_conflicts()
+        select = [
+            'SELECT %s, e.feed_id, e.id, %s, %s, e.published FROM {0} e'.format(Entry._meta.db_table),
+            'WHERE e.id IN ({0})'.format(entries_sql),
+        ]
+        params = [user.pk, UserEntry.UNREAD, UserEntry.NO_FLAG] + list(entries_params)
+        if not ignore_conflicts:
+            select.append('AND NOT EXISTS (SELECT 1 FROM {0} ue WHERE ue.user_id = %s AND ue.entry_id = e.id)'.format(
+                UserEntry._meta.db_table))
+            params.append(user.pk)
+        sql = insert_sql(UserEntry._meta.db_table, USER_ENTRY_COLUMNS, ' '.join(select), ignore_conflicts)
+        last_id = UserEntry.last_id()
+        with connection.cursor() as cursor:
+            cursor.execute(sql, params)
+            count = cursor.rowcount
+        if count:
+            FilterRule.apply_backfill(UserEntry.objects.filter(user=user, id__gt=last_id))
+        return count
+
+    @staticmethod
+    def last_id():
+        """
+        Last Id
+
+        :return: highest UserEntry id, 0 if there are none, rows added later have higher ids
+        """
+        return UserEntry.objects.aggregate(Max('id'))['id__max'] or 0
+
+    @staticmethod
+    def delete_chunked(queryset, chunk_size=MAX_DELETE):
+        """
+        Delete Chunked
+
+        Delete a UserEntry queryset "chunk_size" rows at a time so each DELETE stays small and locks are held briefly.
+        Each DELETE keeps the queryset's filter, so with user entries partitioned by user it only touches the
+        partitions of the queryset's users.
+
+        :param queryset: UserEntry queryset to delete
+        :param chunk_size: maximum rows per DELETE
+        :return: number of UserEntry objects deleted
+        """
+        count = 0
+        while True:
+            ids = list(queryset.values_list('id', flat=True)[:chunk_size])
+            if not ids:
+                return count
+            queryset.filter(id__in=ids).delete()
+            count += len(ids)
 
     @staticmethod
     def unsubscribe_users(users, feed):
         if not hasattr(users, '__iter__'):
             users = (users, )
 
-        UserEntry.objects.filter(user__in=users, feed=feed).delete()
+        return UserEntry.delete_chunked(UserEntry.objects.filter(user__in=users, feed=feed))
+
+    @staticmethod
+    def purge_users(users):
+        if not hasattr(users, '__iter__'):
+            users = (users, )
+
+        return UserEntry.delete_chunked(UserEntry.objects.filter(user__in=users))
+
+
+class SubscriptionJob(TimeStampedModel):
+    """
+    Subscription Job
+
+    Work for a subscription that is too slow to do inside a web request.  Jobs are created by Feed.subscribe,
+    Feed.unsubscribe and Feed.purge_user and run by the "run_subscription_jobs" management command, status and
+    entries let the user follow progress.
+    """
+    STATUS = Choices(
+        ('p', 'pending', 'Pending'),
+        ('r', 'running', 'Running'),
+        ('d', 'done', 'Done'),
+        ('f', 'failed', 'Failed'),
+    )
+    ACTION = Choices(
+        ('b', 'backfill', 'Backfill'),
+        ('u', 'unsubscribe', 'Unsubscribe'),
+        ('p', 'purge', 'Purge'),
+    )
+    user = models.ForeignKey(User)
+    feed = models.ForeignKey(Feed, null=True, blank=True)
+    action = models.CharField(max_length=1, choices=ACTION, default=ACTION.backfill)
+    status = models.CharField(max_length=1, choices=STATUS, default=STATUS.pending, db_index=True)
+    entries = models.PositiveIntegerField(default=0)
+    notes = models.TextField(blank=True)
+
+    objects = models.Manager()
+    pending = QueryManager(status=STATUS.pending)
+
+    class Meta:
+        ordering = ('created', )
+        verbose_name = 'Subscription Job'
+        verbose_name_plural = 'Subscription Jobs'
+
+    def __str__(self):  # pragma: no cover
+        return '{0} {1} for {2}'.format(self.get_action_display(), self.feed, self.user)
+
+    def run(self):
+        if self.action == self.ACTION.backfill:
+            self.entries = UserEntry.subscribe_users(self.user, self.feed)
+            UserVersion.bump(self.user)
+        elif self.action == self.ACTION.unsubscribe:
+            # user subscribed again before the job ran, keep the entries
+            if not self.feed.is_subscribed(self.user):
+                self.entries = UserEntry.unsubscribe_users(self.user, self.feed)
+        elif self.action == self.ACTION.purge:
+            self.entries = UserEntry.purge_users(self.user)
+
+    @staticmethod
+    def run_pending(num=10):
+        """
+        Run Pending
+
+        Claim and run up to "num" pending jobs, oldest first.  Jobs are claimed by moving them from pending to
+        running with db.claim so several workers can share the queue.
+
+        :param num: maximum number of jobs to run
+        :return: number of jobs run
+        """
+        count = 0
+        claimed = claim(SubscriptionJob.pending.all(), num, status=SubscriptionJob.STATUS.running)
+        for job in SubscriptionJob.objects.filter(pk__in=claimed).select_related('user', 'feed'):
+            try:
+                job.run()
+                job.status = SubscriptionJob.STATUS.done
+            except Exception as e:
+                job.status = SubscriptionJob.STATUS.failed
+                job.notes = repr(e)
+            job.save()
+            count += 1
+        return count
+
+
+class DiscoveryJob(TimeStampedModel):
+    """
+    Discovery Job
+
+    Feed discovery for a URL a user entered, run by the "run_discovery_jobs" management command so slow sites do
+    not hold up web requests.  The page polls the job until it is done or failed, feeds holds what was found.
+    Jobs with subscribe set, queued by an OPML import, also subscribe the user to every feed found.
+    """
+    STATUS = SubscriptionJob.STATUS
+    user = models.ForeignKey(User)
+    url = models.URLField(max_length=2083)
+    status = models.CharField(max_length=1, choices=STATUS, default=STATUS.pending, db_index=True)
+    subscribe = models.BooleanField(default=False)
+    feeds = models.ManyToManyField(Feed, blank=True)
+    notes = models.TextField(blank=True)
+
+    objects = models.Manager()
+    pending = QueryManager(status=STATUS.pending)
+
+    class Meta:
+        ordering = ('created', )
+        verbose_name = 'Discovery Job'
+        verbose_name_plural = 'Discovery Jobs'
+
+    def __str__(self):  # pragma: no cover
+        return '{0} for {1}'.format(self.url, self.user)
+
+    def run(self):
+        feeds = Feed.get_feeds_from_url(self.url)
+        self.feeds.set(feeds)
+        if self.subscribe:
+            Feed.subscribe_feeds(self.user, feeds)
+
+    @staticmethod
+    def run_pending(num=10):
+        """
+        Run Pending
+
+        Claim and run up to "num" pending jobs, oldest first, see SubscriptionJob.run_pending.
+
+        :param num: maximum number of jobs to run
+        :return: number of jobs run
+        """
+        count = 0
+        claimed = claim(DiscoveryJob.pending.all(), num, status=DiscoveryJob.STATUS.running)
+        for job in DiscoveryJob.objects.filter(pk__in=claimed).select_related('user'):
+            try:
+                job.run()
+                job.status = DiscoveryJob.STATUS.done
+            except Exception as e:
+                job.status = DiscoveryJob.STATUS.failed
+                job.notes = repr(e)
+            job.save()
+            count += 1
+        return count
+
+
+class FilterRule(models.Model):
+    """
+    Filter Rule
+
+    A user's keyword rule, entries mentioning keyword in their title or content are muted (marked read) or
+    highlighted.  Rules are applied once per entry when entries are added to subscribers, see
+    UserEntry.update_subscriptions, and to the entries a backfill adds, see UserEntry.subscribe_users.
+    """
+    ACTION = Choices(
+        (UserEntry.MUTED, 'mute', 'Mute'),
+        (UserEntry.HIGHLIGHTED, 'highlight', 'Highlight'),
+    )
+    user = models.ForeignKey(User)
+    keyword = models.CharField(max_length=255)
+    action = models.CharField(max_length=1, choices=ACTION, default=ACTION.mute)
+
+    class Meta:
+        verbose_name = 'Filter Rule'
+        verbose_name_plural = 'Filter Rules'
+
+    def __str__(self):  # pragma: no cover
+        return '{0} "{1}" for {2}'.format(self.get_action_display(), self.keyword, self.user)
+
+    @staticmethod
+    def get_matcher(user_ids):
+        """
+        Get Matcher
+
+        Compile the rules of some users into one KeywordMatcher, values are (user_id, action) tuples.
+
+        :param user_ids: user ids, a list or a values('user_id') queryset used as a subquery
+        :return: KeywordMatcher or None if the users have no rules
+        """
+        matcher = KeywordMatcher()
+        rules = FilterRule.objects.filter(user_id__in=user_ids).values_list('user_id', 'keyword', 'action')
+        for user_id, keyword, action in rules:
+            matcher.add(keyword, (user_id, action))
+        if not len(matcher):
+            return None
+        matcher.build()
+        return matcher
+
+    @staticmethod
+    def apply(matcher, feed_id, max_entry_id):
+        """
+        Apply
+
+        Search a feed's entries not yet added to subscribers, up to max_entry_id, and flag the matching
+        UserEntry objects.  Mute wins over highlight when both match.
+
+        :param matcher: KeywordMatcher from get_matcher
+        :param feed_id: Feed id
+        :param max_entry_id: newest Entry id to search
+        :return: number of UserEntry objects flagged
+        """
+        flags = {}
+        entries = Entry.objects.filter(
+            feed_id=feed_id, added_to_subscribers=False, id__lte=max_entry_id
+        ).values_list('id', 'title', 'content')
+        for entry_id, title, content in entries:
+            for user_id, action in matcher.search(title + ' ' + html_tags.sub(' ', content)):
+                if flags.get((user_id, entry_id)) != FilterRule.ACTION.mute:
+                    flags[(user_id, entry_id)] = action
+
+        grouped = {}
+        for (user_id, entry_id), action in flags.items():
+            grouped.setdefault((user_id, action), []).append(entry_id)
+
+        count = 0
+        for (user_id, action), entry_ids in grouped.items():
+            count += FilterRule.set_flag(UserEntry.objects.filter(user_id=user_id, entry_id__in=entry_ids), action)
+        return count
+
+    @staticmethod
+    def apply_backfill(user_entries):
+        """
+        Apply Backfill
+
+        Flag backfilled UserEntry objects matching their user's rules.  Mute wins over highlight when both match.
+
+        :param user_entries: UserEntry queryset of the entries a backfill added
+        :return: number of UserEntry objects flagged
+        """
+        matcher = FilterRule.get_matcher(user_entries.values('user_id'))
+        if matcher is None:
+            return 0
+        flags = {}
+        rows = user_entries.values_list('id', 'user_id', 'entry__title', 'entry__content')
+        for pk, user_id, title, content in rows:
+            for rule_user_id, action in matcher.search(title + ' ' + html_tags.sub(' ', content)):
+                if rule_user_id == user_id and flags.get(pk) != FilterRule.ACTION.mute:
+                    flags[pk] = action
+
+        grouped = {}
+        for pk, action in flags.items():
+            grouped.setdefault(action, []).append(pk)
+        return sum(FilterRule.set_flag(UserEntry.objects.filter(id__in=pks), action) for action, pks in grouped.items())
+
+    @staticmethod
+    def set_flag(user_entries, action):
+        """
+        Set Flag
+
+        :param user_entries: UserEntry queryset
+        :param action: FilterRule.ACTION, muted entries are also marked read
+        :return: number of UserEntry objects updated
+        """
+        if action == FilterRule.ACTION.mute:
+            return user_entries.update(flag=action, status=UserEntry.READ)
+        return user_entries.update(flag=action)
+
+
+class UserVersion(models.Model):
+    """
+    User Version
+
+    Counter bumped whenever something a user sees changes: subscriptions, entries added to the user's feeds and
+    read state.  Cache keys and ETags built from it with versioned_key never need explicit invalidation.
+    Rows are created with the user (see create_user_version), reading a version never writes so it is safe on a
+    read replica.
+    """
+    user = models.OneToOneField(User, primary_key=True)
+    version = models.PositiveIntegerField(default=0)
+    modified = models.DateTimeField(default=now)
+
+    class Meta:
+        verbose_name = 'User Version'
+        verbose_name_plural = 'User Versions'
+
+    def __str__(self):  # pragma: no cover
+        return '{0} v{1}'.format(self.user, self.version)
+
+    @staticmethod
+    def get(user):
+        """
+        Get
+
+        :param user: User
+        :return: the user's UserVersion, an unsaved one at version 0 if the user has none
+        """
+        version = UserVersion.objects.filter(user=user).first()
+        if version is None:
+            version = UserVersion(user=user, modified=user.date_joined)
+        return version
+
+    @staticmethod
+    def bump(users):
+        if not hasattr(users, '__iter__'):
+            users = (users, )
+
+        return UserVersion.objects.filter(user__in=users).update(version=F('version') + 1, modified=now())
+
+    @staticmethod
+    def bump_subscribers(feed_ids):
+        return UserVersion.objects.filter(
+            user__in=Feed.subscriptions.through.objects.filter(feed_id__in=feed_ids).values('user_id')
+        ).update(version=F('version') + 1, modified=now())
+
+
+def create_user_version(sender, instance, created, raw, **kwargs):
+    """
+    Create User Version
+
+    post_save receiver for User creating the user's UserVersion, connected in ReaderConfig.ready.
+    """
+    if created and not raw:
+        UserVersion.objects.get_or_create(user=instance)
+
+
+def versioned_key(prefix, *parts):
+    """
+    Versioned Key
+
+    Cache key from a prefix and parts such as object ids and Feed or UserVersion versions.  A new version gives a
+    new key so stale entries are never read and simply expire.
+
+        versioned_key('dashboard', user.pk, UserVersion.get(user).version)
+    """
+    return 'preader:{0}:{1}'.format(prefix, ':'.join(str(part) for part in parts))
+
+
+def search_backend():
+    """
+    Search Backend
+
+    Decided once per database and process, the FTS5 table is only looked up the first time.
+
+    :return: "postgresql", "sqlite" if the FTS5 table exists or None if full text search is not available
+    """
+    key = (connection.alias, connection.settings_dict['NAME'])
+    if key not in search_backends:
+        backend = None
+        if connection.vendor == 'postgresql':
+            backend = 'postgresql'
+        elif connection.vendor == 'sqlite' and SEARCH_TABLE_SQLITE in connection.introspection.table_names():
+            backend = 'sqlite'
+        search_backends[key] = backend
+    return search_backends[key]
+
+
+def backend_search_table(backend):
+    return SEARCH_TABLE_POSTGRESQL if backend == 'postgresql' else SEARCH_TABLE_SQLITE
+
+
+def notify_feeds(feed_ids):
+    """
+    Notify Feeds
+
+    Announce that feeds have new entries for their subscribers.  On PostgreSQL a NOTIFY with a JSON list of feed
+    ids is sent on NOTIFY_CHANNEL so open event streams wake up at once, other databases have no channel and
+    streams find the change by polling UserVersion.
+
+    :param feed_ids: iterable of feed ids
+    """
+    if connection.vendor != 'postgresql':
+        return
+    feed_ids = sorted(feed_ids)
+    with connection.cursor() as cursor:
+        for x in range(0, len(feed_ids), NOTIFY_CHUNK):
+            cursor.execute('SELECT pg_notify(%s, %s)', [NOTIFY_CHANNEL, json.dumps(feed_ids[x:x + NOTIFY_CHUNK])])
+
+
+def fan_out_shard(task):
+    """
+    Fan Out Shard
+
+    Run UserEntry.fan_out for one shard, retrying on database errors.  Takes a single tuple so it can be used
+    with multiprocessing.Pool.map.
+
+    :param task: (feed_id, max_entry_id, min_user_id, max_user_id, retries)
+    :return: (feed_id, number of UserEntry objects created or None if every attempt failed)
+    """
+    feed_id, max_entry_id, min_user_id, max_user_id, retries = task
+    for attempt in range(max(retries, 1)):
+        try:
+            return feed_id, UserEntry.fan_out(feed_id, max_entry_id, min_user_id, max_user_id)
+        except DatabaseError:
+            sleep(attempt + 1)
+    return feed_id, None
 
 
 class FeedLog(models.Model):
-    feed = models.ForeignKey(Feed, editable=False)
+    # no constraint so logs can live in their own database, see routers.IngestRouter
+    feed = models.ForeignKey(Feed, editable=False, db_constraint=False, on_delete=models.DO_NOTHING)
     status_code = models.PositiveSmallIntegerField(null=True, blank=True)
     headers = models.TextField(blank=True)
     notes = models.TextField(blank=True)
@@ -522,3 +1774,13 @@ class FeedLog(models.Model):
 
     def __str__(self):  # pragma: no cover
         return '{0} ({1}) on {2}'.format(self.feed, self.status_code, self.datetime)
+
+
+def delete_feed_logs(sender, instance, **kwargs):
+    """
+    Delete Feed Logs
+
+    post_delete receiver for Feed, connected in ReaderConfig.ready.  FeedLog.feed has no constraint and does
+    nothing on delete, so the feed's logs are deleted here, on whichever database IngestRouter puts them.
+    """
+    FeedLog.objects.filter(feed_id=instance.pk).delete()
@@ -0,0 +1,152 @@
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection
+from django.db.models import Count
+
+from time import monotonic, sleep
+import select
+
+from .models import UserEntry, UserVersion, NOTIFY_CHANNEL, get_subscribed_feed_ids, versioned_key
+from .serializers import dumps
+
+# seconds a stream stays open, 0 answers every request at once and the browser polls every SSE_POLL_INTERVAL
+# seconds.  An open stream holds a worker and a database connection for its whole life, only raise it when the
+# events URL is served by an async worker (for example gunicorn -k gevent), sync workers run out after a few tabs
+SSE_TIMEOUT = getattr(settings, 'SSE_TIMEOUT', 0)
+# milliseconds before a browser reconnects to an open stream that ended
+SSE_RETRY = getattr(settings, 'SSE_RETRY', 3000)
+# seconds between checks of the user's version, also the keepalive and the polling interval
+SSE_POLL_INTERVAL = getattr(settings, 'SSE_POLL_INTERVAL', 15)
+# seconds the unread counts sent for a version are kept for the next poll
+SSE_COUNTS_TIMEOUT = getattr(settings, 'SSE_COUNTS_TIMEOUT', 3600)
+
+
+def unread_counts(user):
+    """
+    Unread Counts
+
+    Feeds unsubscribed in the background are left out, their entries are deleted later by a SubscriptionJob.
+
+    :param user: User
+    :return: dict of feed id to number of unread entries, feeds without unread entries are left out
+    """
+    return dict(
+        UserEntry.unread.filter(user=user, feed_id__in=get_subscribed_feed_ids(user)).values('feed').annotate(
+            unread=Count('id')).values_list('feed', 'unread')
+    )
+
+
+def sse_event(event, data, event_id=None):
+    if event_id is not None:
+        return 'id: {0}\nevent: {1}\ndata: {2}\n\n'.format(event_id, event, dumps(data))
+    return 'event: {0}\ndata: {1}\n\n'.format(event, dumps(data))
+
+
+def unread_key(user, version):
+    return versioned_key('unread', user.pk, version)
+
+
+def version_events(user, version, counts):
+    """
+    Version Events
+
+    Events for a new version of the user: an "entries" event per feed with more unread entries than in "counts",
+    then an "unread" event if any count changed.  Every event sequence ends with the version as event id, the
+    browser sends it back in the Last-Event-ID header when it reconnects.  The counts are cached under the version
+    so the next request can tell what changed.
+
+    :param user: User
+    :param version: the user's current version
+    :param counts: unread counts sent before, None if there were none
+    :return: (list of events, current unread counts)
+    """
+    latest = unread_counts(user)
+    cache.set(unread_key(user, version), latest, SSE_COUNTS_TIMEOUT)
+    events = []
+    if counts is not None:
+        for feed_id, unread in sorted(latest.items()):
+            if unread > counts.get(feed_id, 0):
+                events.append(sse_event('entries', {'feed': feed_id, 'new': unread - counts.get(feed_id, 0)}))
+    if latest != counts:
+        events.append(sse_event('unread', latest, version))
+    else:
+        events.append('id: {0}\n\n'.format(version))
+    return events, latest
+
+
+def _listen():
+    """
+    Listen
+
+    LISTEN on NOTIFY_CHANNEL with this request's connection.
+
+    :return: function waiting up to a number of seconds for a notification
+    """
+    with connection.cursor() as cursor:
+        cursor.execute('LISTEN {0}'.format(NOTIFY_CHANNEL))
+    pg_connection = connection.connection
+
+    def wait(timeout):
+        if select.select([pg_connection], [], [], timeout) != ([], [], []):
+            pg_connection.poll()
+            del pg_connection.notifies[:]
+    return wait
+
+
+def _unlisten():
+    with connection.cursor() as cursor:
+        cursor.execute('UNLISTEN {0}'.format(NOTIFY_CHANNEL))
+
+
+def event_stream(user, timeout=SSE_TIMEOUT, interval=SSE_POLL_INTERVAL, last_version=None):
+    """
+    Event Stream
+
+    Server-Sent Events for a user.  Starts with an "unread" event holding the unread count of every feed, then
+    whenever the user's version changes sends an "entries" event per feed with new entries
+
+        event: entries
+        data: {"feed": 4, "new": 3}
+
+    followed by a new "unread" event.  Events carry the user's version as id, a browser reconnecting with a
+    Last-Event-ID gets only what changed since, or nothing when the version is the same.
+
+    With a timeout of 0 the stream ends at once and the browser reconnects after "interval" seconds, short polling
+    that costs a version lookup per request and holds no worker.  Otherwise the version is checked every
+    "interval" seconds, on PostgreSQL the stream also wakes as soon as fan-out sends a notification (see
+    models.notify_feeds).  A comment line is sent when nothing changed to keep proxies from closing the
+    connection.  The stream ends after "timeout" seconds, the browser reconnects on its own.
+
+    :param user: User
+    :param timeout: seconds to keep the stream open, 0 to answer at once
+    :param interval: seconds between version checks
+    :param last_version: version from the Last-Event-ID header, None on the first request
+    """
+    yield 'retry: {0}\n\n'.format(SSE_RETRY if timeout else interval * 1000)
+    version = UserVersion.get(user).version
+    counts = None
+    if last_version is not None:
+        counts = cache.get(unread_key(user, last_version))
+    if counts is None or version != last_version:
+        events, counts = version_events(user, version, counts)
+        for event in events:
+            yield event
+    if not timeout:
+        return
+
+    wait = _listen() if connection.vendor == 'postgresql' else sleep
+    deadline = monotonic() + timeout
+    try:
+        while monotonic() < deadline:
+            wait(interval)
+            latest = UserVersion.objects.filter(user=user).values_list('version', flat=True).first()
+            if latest == version:
+                yield ': keepalive\n\n'
+                continue
+            version = latest
+            events, counts = version_events(user, version, counts)
+            for event in events:
+                yield event
+    finally:
+        if wait is not sleep:
+            _unlisten()
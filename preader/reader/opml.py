@@ -0,0 +1,123 @@
+from django.conf import settings
+from django.core.cache import caches
+
+from concurrent.futures import ThreadPoolExecutor
+from xml.etree import ElementTree
+
+from .db import single_writer
+from .models import (
+    Feed, UserEntry, DiscoveryJob, DISCOVERY_CACHE, DISCOVERY_CACHE_TIMEOUT, FETCH_WORKERS, discovery_key,
+    fetch_feed_urls, normalize_url
+)
+
+# most feeds taken from one OPML file
+OPML_MAX_FEEDS = getattr(settings, 'OPML_MAX_FEEDS', 1000)
+OPML_MAX_SIZE = getattr(settings, 'OPML_MAX_SIZE', 2 * 1024 * 1024)
+
+
+class OPMLError(ValueError):
+    pass
+
+
+def parse_opml(source):
+    """
+    Parse OPML
+
+    Outlines of an OPML file, nested folders are flattened.  Outlines with an xmlUrl are feeds, outlines with only
+    an htmlUrl are sites to look for feeds on.
+
+    :param source: file object or path
+    :return: list of (xml_url, html_url, title) tuples, xml_url or html_url may be empty
+    """
+    outlines = []
+    try:
+        for event, element in ElementTree.iterparse(source):
+            if element.tag != 'outline':
+                continue
+            xml_url = element.get('xmlUrl', '').strip()
+            html_url = element.get('htmlUrl', '').strip()
+            if xml_url or html_url:
+                outlines.append((xml_url, html_url, element.get('title') or element.get('text', '')))
+            element.clear()
+    except ElementTree.ParseError as e:
+        raise OPMLError('Not a valid OPML file: {0}'.format(e))
+    return outlines
+
+
+def discover_all(urls, workers=FETCH_WORKERS):
+    """
+    Discover All
+
+    Feed URLs of many sites, pages are fetched concurrently by "workers" threads that only do network IO.
+
+    :param urls: list of normalized site URLs
+    :param workers: number of threads, 1 fetches in this thread
+    :return: list of (feed URLs, cacheable) tuples in the order of urls
+    """
+    def discover(url):
+        try:
+            return fetch_feed_urls(url)
+        except Exception:
+            return [], False
+
+    if workers > 1 and len(urls) > 1:
+        with ThreadPoolExecutor(max_workers=min(workers, len(urls))) as executor:
+            return list(executor.map(discover, urls))
+    return [discover(url) for url in urls]
+
+
+def import_opml(user, source, fetch=True, workers=FETCH_WORKERS, background=False):
+    """
+    Import OPML
+
+    Subscribe user to every feed in an OPML file.  Known feeds are matched with one query and new ones created
+    with one bulk insert, sites without a feed URL are discovered concurrently (using the discovery cache) and
+    the user is subscribed and backfilled with Feed.subscribe_feeds.  With background, sites missing from the
+    discovery cache are queued as DiscoveryJobs that subscribe the user to what they find instead.  With fetch,
+    feeds never checked before are downloaded concurrently and their entries handed to subscribers, otherwise
+    they wait for the next update_feeds run.
+
+    :param user: User to subscribe
+    :param source: OPML file object or path
+    :param fetch: fetch new feeds now
+    :param workers: threads for discovery and fetching
+    :param background: queue discovery of uncached sites instead of fetching them now
+    :return: (number of feeds in file, number of new subscriptions, number of sites queued for discovery)
+    """
+    outlines = parse_opml(source)[:OPML_MAX_FEEDS]
+    feed_urls = [xml_url for xml_url, html_url, title in outlines if xml_url]
+    titles = {xml_url: title for xml_url, html_url, title in outlines if xml_url}
+
+    cache = caches[DISCOVERY_CACHE]
+    site_urls = list({normalize_url(html_url) for xml_url, html_url, title in outlines if not xml_url})
+    cached = cache.get_many([discovery_key(url) for url in site_urls])
+    cached_ids = [feed_id for feed_ids in cached.values() for feed_id in feed_ids]
+    if cached_ids:
+        feed_urls.extend(Feed.objects.filter(pk__in=cached_ids).values_list('feed_url', flat=True))
+    site_urls = [url for url in site_urls if discovery_key(url) not in cached]
+
+    queued = 0
+    if background:
+        DiscoveryJob.objects.bulk_create([DiscoveryJob(user=user, url=url, subscribe=True) for url in site_urls])
+        queued, site_urls = len(site_urls), []
+
+    discovered = discover_all(site_urls, workers)
+    for site_feed_urls, cacheable in discovered:
+        feed_urls.extend(site_feed_urls)
+
+    feeds = Feed.get_or_create_feeds(feed_urls, titles)
+    feed_ids = {feed.feed_url: feed.pk for feed in feeds}
+    cache.set_many({
+        discovery_key(url): [feed_ids[feed_url] for feed_url in site_feed_urls if feed_url in feed_ids]
+        for url, (site_feed_urls, cacheable) in zip(site_urls, discovered) if cacheable
+    }, DISCOVERY_CACHE_TIMEOUT)
+
+    subscribed = Feed.subscribe_feeds(user, feeds)
+    if fetch:
+        new_feed_ids = [feed.pk for feed in feeds if feed.last_checked is None]
+        if new_feed_ids:
+            # one writer at a time with the update_feeds and update_subscriptions commands
+            with single_writer():
+                Feed.update_feeds(feed_ids=new_feed_ids, workers=workers)
+                UserEntry.update_subscriptions()
+    return len(feeds), subscribed, queued
@@ -0,0 +1,81 @@
+from django.conf import settings
+from django.db.models import Q
+from django.http import Http404
+from django.utils.timezone import utc
+
+from datetime import datetime, timedelta
+
+PAGE_SIZE = getattr(settings, 'PAGE_SIZE', 25)
+
+EPOCH = datetime(1970, 1, 1, tzinfo=utc)
+
+
+def encode_cursor(published, pk):
+    """
+    Encode Cursor
+
+    Token for the position after an object in a (published, id) descending list, published is stored as integer
+    microseconds so the token round trips exactly.
+
+    :param published: timezone aware datetime
+    :param pk: object id
+    :return: cursor token
+    """
+    delta = published - EPOCH
+    microseconds = (delta.days * 86400 + delta.seconds) * 1000000 + delta.microseconds
+    return '{0}.{1}'.format(microseconds, pk)
+
+
+def decode_cursor(cursor):
+    """
+    Decode Cursor
+
+    :param cursor: token from encode_cursor
+    :return: (published, pk) tuple or None if cursor is not valid
+    """
+    try:
+        microseconds, pk = cursor.split('.')
+        return EPOCH + timedelta(microseconds=int(microseconds)), int(pk)
+    except (ValueError, OverflowError):
+        return None
+
+
+class KeysetPaginationMixin(object):
+    """
+    Keyset Pagination Mixin
+
+    Paginates a queryset on (published, id), newest first.  Instead of an offset the "cursor" GET parameter holds
+    the position of the last object of the previous page, so every page is a bounded index range scan no matter
+    how deep the user scrolls.
+    """
+    page_size = PAGE_SIZE
+    published_field = 'published'
+    cursor_param = 'cursor'
+
+    def paginate_keyset(self, queryset):
+        """
+        Paginate Keyset
+
+        :param queryset: queryset to paginate, may be a .values() queryset that includes id and published
+        :return: (list of objects on page, cursor for next page or None if this is the last page)
+        """
+        queryset = queryset.order_by('-' + self.published_field, '-id')
+        cursor = self.request.GET.get(self.cursor_param)
+        if cursor:
+            position = decode_cursor(cursor)
+            if position is None:
+                raise Http404
+            published, pk = position
+            queryset = queryset.filter(
+                Q(**{self.published_field + '__lt': published}) |
+                Q(**{self.published_field: published, 'id__lt': pk})
+            )
+
+        page = list(queryset[:self.page_size + 1])
+        if len(page) > self.page_size:
+            page = page[:self.page_size]
+            last = page[-1]
+            if isinstance(last, dict):
+                return page, encode_cursor(last[self.published_field], last['id'])
+            return page, encode_cursor(getattr(last, self.published_field), last.pk)
+        return page, None
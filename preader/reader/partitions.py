@@ -0,0 +1,241 @@
+from django.apps import apps
+from django.conf import settings
+from django.db import connection
+from django.utils.timezone import now, utc
+
+from datetime import datetime
+import re
+
+# partitioning method and key of each table that can be partitioned: user entries are always read for one user
+# so hashing the user id prunes every user facing query to one partition, entries and logs are split by month
+# so old months can be dropped (logs) or vacuumed separately (entries)
+PARTITION_KEYS = {
+    'userentry': ('HASH', 'user_id'),
+    'entry': ('RANGE', 'published'),
+    'feedlog': ('RANGE', 'datetime'),
+}
+USER_ENTRY_PARTITIONS = getattr(settings, 'USER_ENTRY_PARTITIONS', 16)
+# months before the current one that get their own partition when a table is converted, older rows share one
+PARTITION_HISTORY_MONTHS = getattr(settings, 'PARTITION_HISTORY_MONTHS', 12)
+# months after the current one that always have a partition, see roll_table
+PARTITION_AHEAD_MONTHS = getattr(settings, 'PARTITION_AHEAD_MONTHS', 3)
+
+monthly_partition = re.compile(r'_p(\d{4})(\d{2})$')
+
+
+def partitioning_supported():
+    # hash partitioning, indexes and foreign keys on partitioned tables need PostgreSQL 11
+    return connection.vendor == 'postgresql' and connection.pg_version >= 110000
+
+
+def model_table(name):
+    return apps.get_model('reader', name)._meta.db_table
+
+
+def month_start(value):
+    return value.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+
+
+def add_months(value, months):
+    """
+    Add Months
+
+    :param value: datetime on the first of a month
+    :param months: number of months, may be negative
+    :return: datetime "months" months later
+    """
+    month = value.year * 12 + value.month - 1 + months
+    return value.replace(year=month // 12, month=month % 12 + 1)
+
+
+def month_bound(value):
+    return "'{0:%Y-%m-%d} 00:00:00+00'".format(value)
+
+
+def partition_name(table, month):
+    return '{0}_p{1:%Y%m}'.format(table, month)
+
+
+def is_partitioned(table):
+    with connection.cursor() as cursor:
+        cursor.execute(
+            'SELECT 1 FROM pg_partitioned_table p JOIN pg_class c ON c.oid = p.partrelid WHERE c.relname = %s',
+            [table])
+        return cursor.fetchone() is not None
+
+
+def partitions(table):
+    """
+    Partitions
+
+    :param table: partitioned table name
+    :return: sorted list of partition names
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(
+            'SELECT c.relname FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid '
+            'JOIN pg_class p ON p.oid = i.inhparent WHERE p.relname = %s ORDER BY c.relname', [table])
+        return [row[0] for row in cursor.fetchall()]
+
+
+def monthly_partitions(table):
+    """
+    Monthly Partitions
+
+    :param table: table partitioned by month with convert_table
+    :return: sorted list of (first day of month, partition name) tuples, without the "_old" and "_future" partitions
+    """
+    months = []
+    for name in partitions(table):
+        match = monthly_partition.search(name)
+        if match is not None:
+            months.append((datetime(int(match.group(1)), int(match.group(2)), 1, tzinfo=utc), name))
+    return sorted(months)
+
+
+def range_partition_sql(table, name, start, end):
+    return 'CREATE TABLE {0} PARTITION OF {1} FOR VALUES FROM ({2}) TO ({3})'.format(
+        name, table, month_bound(start) if start else 'MINVALUE', month_bound(end) if end else 'MAXVALUE')
+
+
+def convert_table(name, execute, modulus=USER_ENTRY_PARTITIONS, history=PARTITION_HISTORY_MONTHS,
+                  ahead=PARTITION_AHEAD_MONTHS):
+    """
+    Convert Table
+
+    Replace a table with a partitioned copy, in one transaction holding an exclusive lock on the table, so plan for
+    downtime on a large table.  The new table keeps the columns, defaults, id sequence, indexes and foreign keys of
+    the old one.  The primary key becomes (id, partition key) and unique indexes without the partition key are
+    left out because PostgreSQL cannot enforce them across partitions.  Foreign keys referencing the table are
+    dropped for the same reason, deletes still cascade in the ORM.
+
+    Hash partitioned tables get "modulus" partitions.  Month partitioned tables get one partition per month from
+    "history" months ago to "ahead" months ahead, an "_old" partition for older rows and a "_future" partition
+    for later ones.
+
+    :param name: model name, a key of PARTITION_KEYS
+    :param execute: function running one SQL statement, for example cursor.execute or a dry run printing it
+    :param modulus: number of hash partitions
+    :param history: months before the current one with their own partition
+    :param ahead: months after the current one with their own partition
+    :return: list of notes on what was left out
+    """
+    method, key = PARTITION_KEYS[name]
+    table = model_table(name)
+    old = table + '_unpartitioned'
+    notes = []
+    with connection.cursor() as cursor:
+        cursor.execute(
+            'SELECT i.indexdef, x.indisunique FROM pg_indexes i JOIN pg_class c ON c.relname = i.indexname '
+            'JOIN pg_index x ON x.indexrelid = c.oid '
+            'WHERE i.tablename = %s AND NOT x.indisprimary ORDER BY i.indexname', [table])
+        indexes = cursor.fetchall()
+        cursor.execute(
+            'SELECT conname, pg_get_constraintdef(oid), confrelid::regclass::text FROM pg_constraint '
+            'WHERE conrelid = %s::regclass AND contype = %s ORDER BY conname', [table, 'f'])
+        foreign_keys = cursor.fetchall()
+        cursor.execute(
+            'SELECT conname, conrelid::regclass::text FROM pg_constraint '
+            'WHERE confrelid = %s::regclass AND contype = %s ORDER BY conname', [table, 'f'])
+        references = cursor.fetchall()
+        cursor.execute('SELECT pg_get_serial_sequence(%s, %s)', [table, 'id'])
+        sequence = cursor.fetchone()[0]
+
+    execute('LOCK TABLE {0} IN ACCESS EXCLUSIVE MODE'.format(table))
+    execute('ALTER TABLE {0} RENAME TO {1}'.format(table, old))
+    execute('CREATE TABLE {0} (LIKE {1} INCLUDING DEFAULTS INCLUDING STORAGE) PARTITION BY {2} ({3})'.format(
+        table, old, method, key))
+    execute('ALTER SEQUENCE {0} OWNED BY {1}.id'.format(sequence, table))
+
+    if method == 'HASH':
+        for remainder in range(modulus):
+            execute('CREATE TABLE {0}_p{1} PARTITION OF {0} FOR VALUES WITH (MODULUS {2}, REMAINDER {1})'.format(
+                table, remainder, modulus))
+    else:
+        start = add_months(month_start(now()), -history)
+        end = add_months(month_start(now()), ahead + 1)
+        execute(range_partition_sql(table, table + '_old', None, start))
+        month = start
+        while month < end:
+            execute(range_partition_sql(table, partition_name(table, month), month, add_months(month, 1)))
+            month = add_months(month, 1)
+        execute(range_partition_sql(table, table + '_future', end, None))
+
+    execute('INSERT INTO {0} SELECT * FROM {1}'.format(table, old))
+    execute('DROP TABLE {0} CASCADE'.format(old))
+    # created once the old table and its index names are gone
+    execute('ALTER TABLE {0} ADD PRIMARY KEY (id, {1})'.format(table, key))
+    for conname, referencing in references:
+        notes.append('dropped foreign key {0} of {1}'.format(conname, referencing))
+
+    for indexdef, unique in indexes:
+        if unique and key not in indexdef.rsplit('(', 1)[-1]:
+            notes.append('left out unique index without {0}: {1}'.format(key, indexdef))
+            continue
+        execute(indexdef)
+    for conname, definition, referenced in foreign_keys:
+        if is_partitioned(referenced):
+            notes.append('left out foreign key {0} to partitioned table {1}'.format(conname, referenced))
+            continue
+        execute('ALTER TABLE {0} ADD CONSTRAINT {1} {2}'.format(table, conname, definition))
+    execute('ANALYZE {0}'.format(table))
+    return notes
+
+
+def roll_table(name, execute, ahead=PARTITION_AHEAD_MONTHS):
+    """
+    Roll Table
+
+    Make sure a month partitioned table has a partition for every month up to "ahead" months after the current
+    one.  The "_future" partition is detached, the new months are created in front of it and its rows, usually
+    none, are moved back in through the parent.  Run it monthly, for example from cron next to update_feeds.
+
+    :param name: model name of a table partitioned by month
+    :param execute: function running one SQL statement
+    :param ahead: months after the current one that must have a partition
+    :return: list of partitions created
+    """
+    table = model_table(name)
+    months = monthly_partitions(table)
+    if not months:
+        return []
+    month = add_months(months[-1][0], 1)
+    end = add_months(month_start(now()), ahead + 1)
+    if month >= end:
+        return []
+
+    future = table + '_future'
+    created = []
+    execute('ALTER TABLE {0} DETACH PARTITION {1}'.format(table, future))
+    execute('ALTER TABLE {0} RENAME TO {0}_detached'.format(future))
+    while month < end:
+        created.append(partition_name(table, month))
+        execute(range_partition_sql(table, created[-1], month, add_months(month, 1)))
+        month = add_months(month, 1)
+    execute(range_partition_sql(table, future, end, None))
+    execute('INSERT INTO {0} SELECT * FROM {1}_detached'.format(table, future))
+    execute('DROP TABLE {0}_detached'.format(future))
+    return created
+
+
+def drop_partitions_before(name, execute, cutoff):
+    """
+    Drop Partitions Before
+
+    Drop the monthly partitions, and the "_old" partition, that only hold rows from before "cutoff".  Dropping a
+    partition frees its space at once, without the long DELETE and the vacuum that follows it.
+
+    :param name: model name of a table partitioned by month
+    :param execute: function running one SQL statement
+    :param cutoff: datetime, rows before it may be dropped
+    :return: list of partitions dropped
+    """
+    table = model_table(name)
+    months = monthly_partitions(table)
+    dropped = []
+    if months and months[0][0] <= cutoff and table + '_old' in partitions(table):
+        dropped.append(table + '_old')
+    dropped.extend(partition for month, partition in months if add_months(month, 1) <= cutoff)
+    for partition in dropped:
+        execute('DROP TABLE {0}'.format(partition))
+    return dropped
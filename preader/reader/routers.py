@@ -0,0 +1,87 @@
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS
+
+# database alias for FeedLog, written on every update_feeds run and never joined by user facing queries,
+# None keeps it in the default database
+INGEST_DATABASE = getattr(settings, 'INGEST_DATABASE', None)
+INGEST_MODELS = ('feedlog', )
+
+# database alias of a read replica for read heavy views (see read_database), None reads from the primary
+READ_REPLICA_DATABASE = getattr(settings, 'READ_REPLICA_DATABASE', None)
+# after a write a browser reads from the primary for this many seconds, so it sees its own changes even when
+# the replica lags behind
+REPLICA_PIN_SECONDS = getattr(settings, 'REPLICA_PIN_SECONDS', 10)
+REPLICA_PIN_COOKIE = 'preader_primary'
+
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+
+def is_ingest_model(model):
+    return model._meta.app_label == 'reader' and model._meta.model_name in INGEST_MODELS
+
+
+class IngestRouter(object):
+    """
+    Ingest Router
+
+    Puts FeedLog on INGEST_DATABASE.  FeedLog.feed has no database constraint so the log can live apart from the
+    feeds, a feed read through a log comes from the default database.  Every database is migrated as usual
+    (run migrate with --database for the ingest database), the replica is left to replication.
+    """
+
+    def _route(self, model, **hints):
+        if INGEST_DATABASE is None:
+            return None
+        if is_ingest_model(model):
+            return INGEST_DATABASE
+        instance = hints.get('instance')
+        if instance is not None and is_ingest_model(type(instance)):
+            return DEFAULT_DB_ALIAS
+        return None
+
+    def db_for_read(self, model, **hints):
+        return self._route(model, **hints)
+
+    def db_for_write(self, model, **hints):
+        return self._route(model, **hints)
+
+    def allow_relation(self, obj1, obj2, **hints):
+        if INGEST_DATABASE is not None and (is_ingest_model(type(obj1)) or is_ingest_model(type(obj2))):
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        if READ_REPLICA_DATABASE is not None and db == READ_REPLICA_DATABASE:
+            return False
+        return None
+
+
+def read_database(request):
+    """
+    Read Database
+
+    Database for the read only queries of a request: the replica for safe requests, the primary for writes and
+    for browsers pinned by PrimaryPinMiddleware after a recent write.
+
+        Feed.active.using(read_database(request)).filter(...)
+
+    :param request: HttpRequest
+    :return: database alias
+    """
+    if READ_REPLICA_DATABASE is None or request.method not in SAFE_METHODS or REPLICA_PIN_COOKIE in request.COOKIES:
+        return DEFAULT_DB_ALIAS
+    return READ_REPLICA_DATABASE
+
+
+class PrimaryPinMiddleware(object):
+    """
+    Primary Pin Middleware
+
+    Sets a short lived cookie on the response to every write request, read_database sends the browser's next
+    requests to the primary until it expires.
+    """
+
+    def process_response(self, request, response):
+        if READ_REPLICA_DATABASE is not None and request.method not in SAFE_METHODS:
+            response.set_cookie(REPLICA_PIN_COOKIE, '1', max_age=REPLICA_PIN_SECONDS, httponly=True)
+        return response
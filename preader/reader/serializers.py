@@ -0,0 +1,81 @@
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import HttpResponse, StreamingHttpResponse
+
+from itertools import islice
+import json
+
+# lists with more rows than this are streamed instead of built in memory
+STREAM_JSON_ROWS = getattr(settings, 'STREAM_JSON_ROWS', 500)
+
+encoder = DjangoJSONEncoder(separators=(',', ':'))
+
+
+def dumps(obj):
+    return encoder.encode(obj)
+
+
+def iter_json_list(rows, chunk_size=STREAM_JSON_ROWS):
+    """
+    Iter JSON List
+
+    Encode rows as a JSON list, yielding one string per chunk of rows.
+
+    :param rows: iterable of JSON serializable rows, usually a .values() queryset
+    :param chunk_size: rows per chunk
+    """
+    rows = iter(rows)
+    yield '['
+    first = True
+    while True:
+        chunk = list(islice(rows, chunk_size))
+        if not chunk:
+            break
+        encoded = ','.join(encoder.encode(row) for row in chunk)
+        yield encoded if first else ',' + encoded
+        first = False
+    yield ']'
+
+
+def json_list_response(rows, **kwargs):
+    """
+    JSON List Response
+
+    Respond with rows as a flat JSON list.  Short lists are sent as a normal response, lists longer than
+    STREAM_JSON_ROWS are streamed so the whole body is never held in memory.
+
+    :param rows: iterable of JSON serializable rows, a .values() queryset is read with .iterator()
+    :return: HttpResponse or StreamingHttpResponse
+    """
+    if hasattr(rows, 'iterator'):
+        rows = rows.iterator()
+    rows = iter(rows)
+    head = list(islice(rows, STREAM_JSON_ROWS + 1))
+    if len(head) <= STREAM_JSON_ROWS:
+        return HttpResponse(dumps(head), content_type='application/json', **kwargs)
+
+    def chain():
+        yield from head
+        yield from rows
+    return StreamingHttpResponse(iter_json_list(chain()), content_type='application/json', **kwargs)
+
+
+def json_response(obj, **kwargs):
+    return HttpResponse(dumps(obj), content_type='application/json', **kwargs)
+
+
+def select_fields(request, fields):
+    """
+    Select Fields
+
+    Fields named in the "fields" GET parameter, comma separated, limited to the allowed fields.
+
+    :param request: HttpRequest
+    :param fields: allowed fields
+    :return: tuple of fields, all allowed fields if none were requested
+    """
+    requested = request.GET.get('fields')
+    if not requested:
+        return tuple(fields)
+    requested = requested.split(',')
+    return tuple(field for field in fields if field in requested) or tuple(fields)
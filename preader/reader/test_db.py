@@ -0,0 +1,101 @@
+from django.contrib.auth.models import User
+from django.db import connection, IntegrityError
+from django.test import TestCase
+from django.utils.timezone import now
+
+from os.path import join
+from tempfile import TemporaryDirectory
+from unittest import mock, skipUnless
+
+from .db import (
+    bulk_insert, claim, insert_sql, iter_rows, single_writer, supports_ignore_conflicts, writer_lock_path
+)
+from .models import Feed, Entry, UserEntry, SubscriptionJob
+
+
+class InsertTest(TestCase):
+
+    @skipUnless(connection.vendor == 'sqlite', 'SQLite syntax')
+    def test_insert_sql_sqlite(self):
+        self.assertEqual('INSERT OR IGNORE INTO t (a, b) VALUES (%s, %s)',
+                         insert_sql('t', ['a', 'b'], 'VALUES (%s, %s)', ignore_conflicts=True))
+
+    @skipUnless(connection.vendor == 'postgresql', 'PostgreSQL syntax')
+    def test_insert_sql_postgresql(self):
+        self.assertEqual('INSERT INTO t (a, b) VALUES (%s, %s) ON CONFLICT DO NOTHING',
+                         insert_sql('t', ['a', 'b'], 'VALUES (%s, %s)', ignore_conflicts=True))
+
+    def test_insert_sql(self):
+        self.assertEqual('INSERT INTO t (a) SELECT 1', insert_sql('t', ['a'], 'SELECT 1'))
+
+    def test_bulk_insert_ignore_conflicts(self):
+        Feed.objects.create(title='existing', feed_url='http://example.com/existing/')
+        count = bulk_insert(Feed, [
+            Feed(title='existing', feed_url='http://example.com/existing/'),
+            Feed(title='new', feed_url='http://example.com/new/'),
+        ], ignore_conflicts=True)
+        self.assertEqual(1, count)
+        self.assertEqual(2, Feed.objects.count())
+        feed = Feed.objects.get(feed_url='http://example.com/new/')
+        self.assertEqual('new', feed.title)
+        self.assertIsNotNone(feed.created)
+        self.assertEqual(0, bulk_insert(Feed, [], ignore_conflicts=True))
+
+    def test_user_entry_unique(self):
+        user = User.objects.create_user('tester', 'tester@example.com', 'tester')
+        feed = Feed.objects.create(title='test feed', feed_url='http://example.com/feed/')
+        entry = Entry.objects.create(
+            feed=feed, entry_id='1', link='http://example.com/1', title='1', content='Some text.',
+            updated=now(), published=now())
+        UserEntry.objects.create(user=user, feed=feed, entry=entry)
+        with self.assertRaises(IntegrityError):
+            UserEntry.objects.create(user=user, feed=feed, entry=entry)
+
+    def test_supports_ignore_conflicts(self):
+        if connection.vendor in ('sqlite', 'postgresql'):
+            self.assertTrue(supports_ignore_conflicts())
+
+
+class ClaimTest(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user('tester', 'tester@example.com', 'tester')
+        self.jobs = [SubscriptionJob.objects.create(user=self.user) for x in range(3)]
+
+    def test_claim(self):
+        running = SubscriptionJob.STATUS.running
+        self.assertEqual([job.pk for job in self.jobs[:2]], claim(SubscriptionJob.pending.all(), 2, status=running))
+        self.assertEqual(2, SubscriptionJob.objects.filter(status=running).count())
+        # claimed jobs are no longer pending and are not claimed again
+        self.assertEqual([self.jobs[2].pk], claim(SubscriptionJob.pending.all(), 2, status=running))
+        self.assertEqual([], claim(SubscriptionJob.pending.all(), 2, status=running))
+
+    def test_iter_rows(self):
+        rows = list(iter_rows(SubscriptionJob.objects.order_by('pk').values_list('pk', 'status'), chunk_size=2))
+        self.assertEqual([(job.pk, SubscriptionJob.STATUS.pending) for job in self.jobs], [tuple(row) for row in rows])
+
+
+@skipUnless(connection.vendor == 'sqlite', 'SQLite tuning')
+class SQLiteTest(TestCase):
+
+    def test_pragmas(self):
+        # synchronous=NORMAL is 1, the SQLite default is FULL (2)
+        with connection.cursor() as cursor:
+            cursor.execute('PRAGMA synchronous')
+            self.assertEqual(1, cursor.fetchone()[0])
+            cursor.execute('PRAGMA busy_timeout')
+            self.assertEqual(10000, cursor.fetchone()[0])
+
+    def test_single_writer(self):
+        # an in-memory test database has no lock file
+        self.assertIsNone(writer_lock_path())
+        with single_writer():
+            pass
+        with TemporaryDirectory() as directory:
+            path = join(directory, 'writer.lock')
+            with mock.patch('reader.db.SQLITE_WRITER_LOCK', path):
+                self.assertEqual(path, writer_lock_path())
+                with single_writer():
+                    Feed.objects.create(title='test feed', feed_url='http://example.com/feed/')
+                with single_writer():
+                    self.assertEqual(1, Feed.objects.count())
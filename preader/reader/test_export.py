@@ -0,0 +1,64 @@
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.urlresolvers import reverse
+from django.test import Client, TestCase
+from django.utils.timezone import now
+
+from io import BytesIO
+import json
+
+from .export import iter_chunked, iter_entries_jsonl, iter_opml
+from .models import Feed, Entry, UserEntry
+from .opml import parse_opml
+
+
+class ExportTest(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user('tester', 'tester@example.com', 'tester')
+        self.feed = Feed.objects.create(title='Fish & "Chips"', feed_url='http://example.com/feed/?a=1&b=2')
+        for x in range(5):
+            Entry.objects.create(
+                feed=self.feed,
+                entry_id='entry{0}'.format(x),
+                link='http://example.com/entry{0}'.format(x),
+                title='entry {0}'.format(x),
+                content='Some text.',
+                updated=now(),
+                published=now(),
+                added_to_subscribers=True
+            )
+        self.feed.subscribe(self.user)
+        entries = list(UserEntry.objects.filter(user=self.user).order_by('id'))
+        UserEntry.objects.filter(pk__in=[entries[0].pk, entries[1].pk]).update(status=UserEntry.SAVED)
+        UserEntry.objects.filter(pk=entries[2].pk).update(status=UserEntry.READ)
+
+    def test_iter_chunked(self):
+        rows = list(iter_chunked(UserEntry.objects.filter(user=self.user).values('id'), chunk_size=2))
+        self.assertEqual(5, len(rows))
+        self.assertListEqual(sorted(row['id'] for row in rows), [row['id'] for row in rows])
+
+    def test_iter_opml(self):
+        # exported OPML can be imported again
+        opml = ''.join(iter_opml(self.user, chunk_size=1)).encode('utf-8')
+        self.assertListEqual([('http://example.com/feed/?a=1&b=2', '', 'Fish & "Chips"')], parse_opml(BytesIO(opml)))
+
+    def test_iter_entries_jsonl(self):
+        lines = list(iter_entries_jsonl(self.user, chunk_size=2))
+        self.assertEqual(3, len(lines))
+        entry = json.loads(lines[0])
+        self.assertEqual(UserEntry.SAVED, entry['status'])
+        self.assertEqual('http://example.com/feed/?a=1&b=2', entry['feed_url'])
+        self.assertEqual('Some text.', entry['content'])
+        self.assertEqual(2, len(list(iter_entries_jsonl(self.user, statuses=(UserEntry.SAVED, )))))
+
+    def test_export_views(self):
+        c = Client()
+        c.login(username='tester', password='tester')
+        res = c.get(reverse('feeds:export-opml'))
+        self.assertTrue(res.streaming)
+        self.assertIn(b'xmlUrl="http://example.com/feed/?a=1&amp;b=2"', b''.join(res.streaming_content))
+        res = c.get(reverse('feeds:export-entries'), {'status': 'read'})
+        self.assertEqual(1, len(b''.join(res.streaming_content).splitlines()))
+        self.assertEqual(404, c.get(reverse('feeds:export-entries'), {'status': 'unread'}).status_code)
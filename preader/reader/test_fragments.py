@@ -0,0 +1,49 @@
+from django.core.cache import cache
+from django.test import SimpleTestCase
+from django.utils.timezone import now
+
+from unittest import mock
+
+from .fragments import render_entries, fragment_key
+from .models import Entry
+
+
+class RenderEntriesTest(SimpleTestCase):
+
+    def setUp(self):
+        cache.clear()
+        published = now()
+        self.entries = [
+            Entry(
+                id=x,
+                title='entry {0}'.format(x),
+                link='http://example.com/entry{0}'.format(x),
+                snippet='Some text {0}.'.format(x),
+                published=published
+            ) for x in range(1, 4)
+        ]
+
+    def test_render_entries(self):
+        with mock.patch('reader.fragments.render_to_string', return_value='panel') as render:
+            self.assertListEqual(['panel'] * 3, render_entries(self.entries))
+            self.assertEqual(3, render.call_count)
+            render_entries(self.entries)
+            self.assertEqual(3, render.call_count)
+
+    def test_render_entries_changed(self):
+        with mock.patch('reader.fragments.render_to_string', return_value='panel') as render:
+            render_entries(self.entries)
+            self.entries[0].title = 'changed'
+            render_entries(self.entries)
+            self.assertEqual(4, render.call_count)
+
+    def test_fragment_key(self):
+        key = fragment_key(self.entries[0])
+        self.assertTrue(key.startswith('preader:fragment:entry:1:'))
+        self.entries[0].snippet = 'changed'
+        self.assertNotEqual(key, fragment_key(self.entries[0]))
+
+    def test_render_entries_template(self):
+        panels = render_entries(self.entries)
+        self.assertIn('entryCollapse_1', panels[0])
+        self.assertIn('Some text 2.', panels[1])
@@ -0,0 +1,27 @@
+from django.test import SimpleTestCase
+
+from .matching import KeywordMatcher
+
+
+class KeywordMatcherTest(SimpleTestCase):
+
+    def setUp(self):
+        self.matcher = KeywordMatcher()
+        for keyword, value in (('he', 1), ('she', 2), ('hers', 3), ('new york', 4)):
+            self.matcher.add(keyword, value)
+        self.matcher.build()
+
+    def test_search(self):
+        # overlapping keywords are all found, case insensitive
+        self.assertSetEqual({2, 3}, self.matcher.search('SHE said it was hers'))
+        self.assertSetEqual({4}, self.matcher.search('the New York Times'))
+
+    def test_search_word_boundaries(self):
+        # keywords inside other words are not matched
+        self.assertSetEqual(set(), self.matcher.search('ushers and theme'))
+
+    def test_empty_keyword(self):
+        matcher = KeywordMatcher()
+        matcher.add('  ', 1)
+        self.assertEqual(0, len(matcher))
+        self.assertSetEqual(set(), matcher.search('anything'))
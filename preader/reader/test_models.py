@@ -1,9 +1,14 @@
 from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db import connection
 from django.test import TestCase
 from django.utils.http import http_date
 from django.utils.timezone import now, make_naive
 
 from datetime import datetime, timedelta
+from unittest import mock, skipUnless
+import hashlib
+import requests
 import requests_mock
 
 from reader.models import (
@@ -11,11 +16,20 @@ from reader.models import (
     FeedLog,
     MAX_ERRORS,
     Entry,
+    UserEntry,
+    SubscriptionJob,
+    DiscoveryJob,
+    FilterRule,
+    UserVersion,
+    search_backend,
+    normalize_url,
+    read_head,
     feed_datetime,
     MAX_FEEDS,
     SimpleBufferObject,
     MAX_BULK_CREATE,
     shorten_string,
+    make_snippet,
     feed_datetime,
     parse_http_date
 )
@@ -91,6 +105,14 @@ class ModelUtilsTest(TestCase):
             '1234567...'
         )
 
+    def test_make_snippet(self):
+        self.assertEqual('', make_snippet(None))
+        self.assertEqual(
+            'Fish & chips, now with vinegar.',
+            make_snippet('<p>Fish &amp; chips,</p>\n\n<p>now  with <b>vinegar</b>.</p>')
+        )
+        self.assertEqual('1234567...', make_snippet('<p>1234567890</p>', 10))
+
     def test_feed_datetime(self):
         self.assertIsNone(feed_datetime(timetuple=None, allow_none=True, default=None))
         self.assertIsNotNone(feed_datetime(timetuple=None, allow_none=False, default=None))
@@ -110,6 +132,7 @@ class ModelUtilsTest(TestCase):
 class ReaderModelsTest(TestCase):
 
     def setUp(self):
+        cache.clear()
         Feed.objects.get_or_create(
             title='test feed 01',
             feed_url='http://example.com/feedtest/',
@@ -154,6 +177,30 @@ class ReaderModelsTest(TestCase):
         f, u = self._test_subscribe_setup()
         self.assertFalse(f.is_subscribed(u))
 
+    def test_is_subscribed_cached(self):
+        # subscribed feed ids are cached, subscribe and unsubscribe clear the cache
+        f, u = self._test_subscribe_setup()
+        self.assertFalse(f.is_subscribed(u))
+        f.subscribe(u)
+        self.assertTrue(f.is_subscribed(u))
+        with self.assertNumQueries(0):
+            self.assertTrue(f.is_subscribed(u))
+        f.unsubscribe(u)
+        self.assertFalse(f.is_subscribed(u))
+
+    def test_is_subscribed_relation_changed(self):
+        # writes through the relation, as the admin does, clear the cache too
+        f, u = self._test_subscribe_setup()
+        self.assertFalse(f.is_subscribed(u))
+        f.subscriptions.add(u)
+        self.assertTrue(f.is_subscribed(u))
+        u.feed_set.remove(f)
+        self.assertFalse(f.is_subscribed(u))
+        f.subscriptions.add(u)
+        self.assertTrue(f.is_subscribed(u))
+        f.subscriptions.clear()
+        self.assertFalse(f.is_subscribed(u))
+
     def test_increment_error_count_increment(self):
         # get current error count, increment
         f = Feed.objects.get(pk=1)
@@ -319,6 +366,77 @@ class ReaderModelsTest(TestCase):
                 Feed.get_feeds_from_url('http://example.com/feed/')
             )
 
+    def test_get_feeds_from_url_cached(self):
+        # results are cached per normalized URL, including no feeds found
+        with requests_mock.Mocker() as mock:
+            mock.get(
+                'http://example.com/',
+                text='<html><head><link rel="alternate" type="application/rss+xml" href="/rss/"></head></html>',
+                status_code=200,
+                headers={'content-type': 'text/html'}
+            )
+            mock.get('http://example.com/empty/', text='<html><head></head></html>', status_code=200,
+                     headers={'content-type': 'text/html'})
+            feeds = Feed.get_feeds_from_url('http://EXAMPLE.com:80')
+            self.assertEqual(['http://example.com/rss/'], [feed.feed_url for feed in feeds])
+            self.assertListEqual(feeds, Feed.get_feeds_from_url('http://example.com/#top'))
+            self.assertListEqual([], Feed.get_feeds_from_url('http://example.com/empty/'))
+            self.assertListEqual([], Feed.get_feeds_from_url('http://example.com/empty/'))
+            self.assertEqual(2, mock.call_count)
+        self.assertListEqual(feeds, Feed.get_known_feeds('http://example.com/'))
+        self.assertIsNone(Feed.get_known_feeds('http://example.com/other/'))
+
+    def test_get_feeds_from_url_server_error_not_cached(self):
+        with requests_mock.Mocker() as mock:
+            mock.get('http://example.com/', text='', status_code=503)
+            self.assertListEqual([], Feed.get_feeds_from_url('http://example.com/'))
+        self.assertIsNone(Feed.get_known_feeds('http://example.com/'))
+
+    def test_read_head(self):
+        # only the head of a streamed page is read
+        with requests_mock.Mocker() as mock:
+            mock.get(
+                'http://example.com/',
+                text='<html><head><title>t</title></head><body>{0}</body></html>'.format('x' * 100000),
+                headers={'content-type': 'text/html'}
+            )
+            self.assertEqual(
+                '<html><head><title>t</title>',
+                read_head(requests.get('http://example.com/', stream=True))
+            )
+            self.assertEqual(
+                '<html><he',
+                read_head(requests.get('http://example.com/', stream=True), max_bytes=9)
+            )
+
+    def test_normalize_url(self):
+        self.assertEqual('http://example.com/', normalize_url('HTTP://Example.COM'))
+        self.assertEqual('https://example.com/a?b=1', normalize_url('https://example.com:443/a?b=1#c'))
+        self.assertEqual('http://example.com:8080/', normalize_url('http://example.com:8080'))
+
+    def test_get_or_create_feeds(self):
+        existing = Feed.objects.create(feed_url='http://example.com/feed/')
+        feeds = Feed.get_or_create_feeds(
+            ['http://example.com/new/', 'http://example.com/feed/', 'http://example.com/new/'])
+        self.assertEqual(['http://example.com/new/', 'http://example.com/feed/'], [feed.feed_url for feed in feeds])
+        self.assertEqual(existing, feeds[1])
+        self.assertIsNotNone(feeds[0].pk)
+        self.assertListEqual([], Feed.get_or_create_feeds([]))
+
+    def test_discovery_job(self):
+        u = User.objects.create_user('discoverer', 'discoverer@example.com', 'discoverer')
+        job = DiscoveryJob.objects.create(user=u, url='http://example.com/')
+        failed = DiscoveryJob.objects.create(user=u, url='http://example.com/broken/')
+        with requests_mock.Mocker() as mock:
+            mock.get('http://example.com/', text='', status_code=200, headers={'content-type': 'application/rss+xml'})
+            mock.get('http://example.com/broken/', exc=requests.exceptions.ConnectTimeout)
+            self.assertEqual(2, DiscoveryJob.run_pending())
+        job = DiscoveryJob.objects.get(pk=job.pk)
+        self.assertEqual(DiscoveryJob.STATUS.done, job.status)
+        self.assertEqual(['http://example.com/'], [feed.feed_url for feed in job.feeds.all()])
+        self.assertEqual(DiscoveryJob.STATUS.failed, DiscoveryJob.objects.get(pk=failed.pk).status)
+        self.assertEqual(0, DiscoveryJob.run_pending())
+
     def test_update_feeds_last_checked(self):
         # test update_feeds, ensure last_checked and next_checked are updated
         time_hack_high = now() + timedelta(seconds=1)
@@ -475,6 +593,52 @@ class ReaderModelsTest(TestCase):
             self.assertEqual(0, f.error_count)
             self.assertEqual('Example Feed', f.title)
             self.assertEqual('this is a feed', f.description)
+            self.assertEqual(1, f.version)
+            # parsed again without changes, cached pages of the feed stay valid
+            Feed.objects.filter(pk=1).update(next_checked=None)
+            Feed.update_feeds()
+            self.assertEqual(1, Feed.objects.get(pk=1).version)
+
+    def test_update_feeds_feed_meta_cleaned(self):
+        # descriptions are compared after cleaning, a missing or escaped description is not a change
+        f, u = self._test_subscribe_setup()
+        f.subscribe(u)
+        for subtitle in ('', '<subtitle>Q&amp;A <b>feed</b></subtitle>'):
+            with requests_mock.Mocker() as mock:
+                mock.get(
+                    f.feed_url,
+                    text="""
+<?xml version="1.0" encoding="utf-8"?>
+<feed xmlns="http://www.w3.org/2005/Atom">
+
+   <title>Example Feed</title>
+   <link href="http://example.org/"/>
+   {0}
+   <updated>2003-12-13T18:30:02Z</updated>
+   <id>urn:uuid:60a76c80-d399-11d9-b93C-0003939e0af6</id>
+
+</feed>
+                    """.format(subtitle),
+                    status_code=200,
+                    headers={
+                        'content_type': 'application/atom+xml'
+                    }
+                )
+                Feed.objects.filter(pk=f.pk).update(next_checked=None)
+                Feed.update_feeds()
+                version = Feed.objects.get(pk=f.pk).version
+                Feed.objects.filter(pk=f.pk).update(next_checked=None)
+                Feed.update_feeds()
+                self.assertEqual(version, Feed.objects.get(pk=f.pk).version)
+
+    def test_delete_feed_logs(self):
+        # logs have no constraint on their feed, deleting the feed deletes them
+        f, u = self._test_subscribe_setup()
+        FeedLog.objects.create(feed=f, duration=1)
+        other = Feed.objects.create(feed_url='http://example.com/other/')
+        FeedLog.objects.create(feed=other, duration=1)
+        f.delete()
+        self.assertListEqual([other.pk], list(FeedLog.objects.values_list('feed_id', flat=True)))
 
     def test_updates_feeds_no_summary_multiple_content(self):
         # test update_feeds where entry has no "summary" field and uses "content" instead
@@ -517,6 +681,8 @@ class ReaderModelsTest(TestCase):
             Feed.update_feeds()
             e = f.entry_set.first()
             self.assertEqual('<p>Some text 1.</p><p>Some text 2.</p>', e.content)
+            self.assertEqual('Some text 1. Some text 2.', e.snippet)
+            self.assertTrue(e.indexed)
 
     def test_updates_feeds_no_summary_no_content(self):
         # test update_feeds where entry has no "summary" field and uses "content" instead
@@ -626,4 +792,353 @@ class ReaderModelsTest(TestCase):
             )
             Feed.update_feeds()
             f = Feed.objects.get(pk=1)
-            self.assertEqual(1, f.error_count)
\ No newline at end of file
+            self.assertEqual(1, f.error_count)
+
+
+class SubscriptionModelsTest(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.feed = Feed.objects.create(title='test feed 01', feed_url='http://example.com/feedtest/')
+        self.user = User.objects.create(username='tester', email='tester@example.com')
+        time_hack = now()
+        for x in range(5):
+            Entry.objects.create(
+                feed=self.feed,
+                entry_id='entry{0}'.format(x),
+                link='http://example.com/entry{0}'.format(x),
+                title='entry {0}'.format(x),
+                content='Some text.',
+                updated=time_hack - timedelta(days=x),
+                published=time_hack - timedelta(days=x),
+                added_to_subscribers=True
+            )
+
+    def test_subscribe_users_max_entries(self):
+        # only the newest max_entries entries are backfilled
+        count = UserEntry.subscribe_users(self.user, self.feed, max_entries=2, max_days=None)
+        self.assertEqual(2, count)
+        self.assertListEqual(
+            ['entry0', 'entry1'],
+            sorted(UserEntry.objects.filter(user=self.user).values_list('entry__entry_id', flat=True))
+        )
+
+    def test_subscribe_users_max_days(self):
+        # only entries newer than max_days are backfilled
+        count = UserEntry.subscribe_users(self.user, self.feed, max_entries=None, max_days=2)
+        self.assertEqual(2, count)
+
+    def test_subscribe_users_no_duplicates(self):
+        # running the backfill again does not create duplicate user entries
+        UserEntry.subscribe_users(self.user, self.feed, max_entries=None, max_days=None)
+        count = UserEntry.subscribe_users(self.user, self.feed, max_entries=None, max_days=None)
+        self.assertEqual(0, count)
+        self.assertEqual(5, UserEntry.objects.filter(user=self.user).count())
+
+    def test_subscribe_user_feeds(self):
+        # one statement backfills every feed, limited per feed
+        other = Feed.objects.create(title='test feed 02', feed_url='http://example.com/other/')
+        Entry.objects.create(
+            feed=other, entry_id='other', link='http://example.com/other', title='other', content='Some text.',
+            updated=now(), published=now(), added_to_subscribers=True)
+        self.assertEqual(3, UserEntry.subscribe_user_feeds(self.user, [self.feed.pk, other.pk], max_entries=2))
+        self.assertEqual(3, UserEntry.subscribe_user_feeds(self.user, [self.feed.pk], max_entries=None))
+        self.assertEqual(0, UserEntry.subscribe_user_feeds(self.user, [self.feed.pk, other.pk], max_entries=None))
+        self.assertEqual(0, UserEntry.subscribe_user_feeds(self.user, []))
+        self.assertEqual(2, UserEntry.subscribe_user_feeds(
+            User.objects.create(username='other'), [self.feed.pk], max_entries=None, max_days=2))
+
+    def test_subscribe_users_filter_rules(self):
+        # backfilled entries are flagged like fanned out ones, entries the user already had are left alone
+        Entry.objects.filter(entry_id='entry0').update(title='Robots Run Amok')
+        Entry.objects.filter(entry_id='entry1').update(content='<p>about <em>python</em></p>')
+        UserEntry.subscribe_users(self.user, self.feed, max_entries=1, max_days=None)
+        FilterRule.objects.create(user=self.user, keyword='robots', action=FilterRule.ACTION.mute)
+        FilterRule.objects.create(user=self.user, keyword='python', action=FilterRule.ACTION.highlight)
+        other = User.objects.create(username='other')
+        self.assertEqual(9, UserEntry.subscribe_users([self.user, other], self.feed, max_entries=None, max_days=None))
+
+        self.assertEqual(UserEntry.NO_FLAG, UserEntry.objects.get(user=self.user, entry__entry_id='entry0').flag)
+        self.assertEqual(UserEntry.HIGHLIGHTED, UserEntry.objects.get(user=self.user, entry__entry_id='entry1').flag)
+        self.assertFalse(UserEntry.objects.filter(user=other).exclude(flag=UserEntry.NO_FLAG).exists())
+
+    def test_subscribe_user_feeds_filter_rules(self):
+        Entry.objects.filter(entry_id='entry0').update(title='Robots Run Amok')
+        FilterRule.objects.create(user=self.user, keyword='robots', action=FilterRule.ACTION.mute)
+        UserEntry.subscribe_user_feeds(self.user, [self.feed.pk], max_entries=None)
+        muted = UserEntry.objects.get(user=self.user, entry__entry_id='entry0')
+        self.assertEqual(UserEntry.MUTED, muted.flag)
+        self.assertEqual(UserEntry.READ, muted.status)
+        self.assertEqual(1, UserEntry.objects.exclude(flag=UserEntry.NO_FLAG).count())
+
+    def test_subscribe_feeds(self):
+        other = Feed.objects.create(title='test feed 02', feed_url='http://example.com/other/')
+        self.feed.subscribe(self.user)
+        version = UserVersion.get(self.user).version
+        self.assertEqual(1, Feed.subscribe_feeds(self.user, [self.feed, other]))
+        self.assertTrue(other.is_subscribed(self.user))
+        self.assertTrue(Feed.objects.get(pk=other.pk).has_subscribers)
+        self.assertEqual(version + 1, UserVersion.get(self.user).version)
+        self.assertEqual(0, Feed.subscribe_feeds(self.user, [self.feed, other]))
+
+    def test_user_version(self):
+        # created with the user, reading a missing version does not write
+        self.assertTrue(UserVersion.objects.filter(user=self.user).exists())
+        UserVersion.objects.filter(user=self.user).delete()
+        with self.assertNumQueries(1):
+            self.assertEqual(0, UserVersion.get(self.user).version)
+        self.assertFalse(UserVersion.objects.filter(user=self.user).exists())
+
+    def test_subscribe_background(self):
+        # backfill is queued as a job, running pending jobs does the backfill
+        job = self.feed.subscribe(self.user, background=True)
+        self.assertTrue(self.feed.is_subscribed(self.user))
+        self.assertEqual(SubscriptionJob.STATUS.pending, job.status)
+        self.assertFalse(UserEntry.objects.filter(user=self.user).exists())
+
+        self.assertEqual(1, SubscriptionJob.run_pending())
+        job = SubscriptionJob.objects.get(pk=job.pk)
+        self.assertEqual(SubscriptionJob.STATUS.done, job.status)
+        self.assertEqual(5, job.entries)
+        self.assertEqual(5, UserEntry.objects.filter(user=self.user).count())
+
+    def test_unsubscribe_background(self):
+        # subscription is removed right away, entries are deleted by the job
+        self.feed.subscribe(self.user)
+        job = self.feed.unsubscribe(self.user, background=True)
+        self.assertFalse(self.feed.is_subscribed(self.user))
+        self.assertFalse(Feed.objects.get(pk=self.feed.pk).has_subscribers)
+        self.assertEqual(5, UserEntry.objects.filter(user=self.user).count())
+
+        SubscriptionJob.run_pending()
+        job = SubscriptionJob.objects.get(pk=job.pk)
+        self.assertEqual(SubscriptionJob.STATUS.done, job.status)
+        self.assertEqual(5, job.entries)
+        self.assertFalse(UserEntry.objects.filter(user=self.user).exists())
+
+    def test_unsubscribe_background_resubscribed(self):
+        # user subscribed again before the job ran, entries are kept
+        self.feed.subscribe(self.user)
+        self.feed.unsubscribe(self.user, background=True)
+        self.feed.subscribe(self.user)
+        SubscriptionJob.run_pending()
+        self.assertEqual(5, UserEntry.objects.filter(user=self.user).count())
+
+    def test_delete_chunked(self):
+        self.feed.subscribe(self.user)
+        self.assertEqual(5, UserEntry.delete_chunked(UserEntry.objects.filter(user=self.user), chunk_size=2))
+        self.assertFalse(UserEntry.objects.filter(user=self.user).exists())
+
+    def test_purge_user(self):
+        self.feed.subscribe(self.user)
+        Feed.purge_user(self.user, background=False)
+        self.assertFalse(self.feed.is_subscribed(self.user))
+        self.assertFalse(Feed.objects.get(pk=self.feed.pk).has_subscribers)
+        self.assertFalse(UserEntry.objects.filter(user=self.user).exists())
+
+
+class FanOutModelsTest(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.feed = Feed.objects.create(title='test feed 01', feed_url='http://example.com/feedtest/')
+        self.users = [User.objects.create(username='tester{0}'.format(x)) for x in range(5)]
+        for user in self.users:
+            self.feed.subscribe(user)
+        time_hack = now()
+        for x in range(3):
+            Entry.objects.create(
+                feed=self.feed,
+                entry_id='entry{0}'.format(x),
+                link='http://example.com/entry{0}'.format(x),
+                title='entry {0}'.format(x),
+                content='Some text.',
+                updated=time_hack,
+                published=time_hack
+            )
+        Feed.objects.filter(pk=self.feed.pk).update(has_new_entries=True)
+
+    def test_user_shards(self):
+        # subscribers are split into contiguous user id ranges
+        user_ids = [u.pk for u in self.users]
+        self.assertListEqual(
+            [(user_ids[0], user_ids[1]), (user_ids[2], user_ids[3]), (user_ids[4], user_ids[4])],
+            UserEntry.user_shards(self.feed, 3)
+        )
+        self.assertListEqual([(user_ids[0], user_ids[4])], UserEntry.user_shards(self.feed, 1))
+
+    def test_update_subscriptions_sharded(self):
+        # every subscriber gets every new entry, flags and subscriber versions are updated
+        version = UserVersion.get(self.users[0]).version
+        self.assertEqual(15, UserEntry.update_subscriptions(shards=2, processes=1))
+        self.assertEqual(version + 1, UserVersion.get(self.users[0]).version)
+        self.assertEqual(15, UserEntry.objects.filter(feed=self.feed).count())
+        self.assertFalse(self.feed.entry_set.filter(added_to_subscribers=False).exists())
+        self.assertFalse(Feed.objects.get(pk=self.feed.pk).has_new_entries)
+
+    @skipUnless(connection.vendor == 'sqlite', 'SQLite only')
+    def test_update_subscriptions_sqlite_single_process(self):
+        # SQLite has one writer, shards are not run in a worker pool
+        with mock.patch('reader.models.Pool') as pool:
+            self.assertEqual(15, UserEntry.update_subscriptions(shards=3, processes=4))
+        self.assertFalse(pool.called)
+
+    def test_fan_out_retry(self):
+        # running a shard again does not create duplicate user entries
+        max_entry_id = self.feed.entry_set.latest('id').id
+        user_ids = [u.pk for u in self.users]
+        self.assertEqual(6, UserEntry.fan_out(self.feed.pk, max_entry_id, user_ids[0], user_ids[1]))
+        self.assertEqual(0, UserEntry.fan_out(self.feed.pk, max_entry_id, user_ids[0], user_ids[1]))
+        self.assertEqual(9, UserEntry.update_subscriptions(shards=3))
+
+    def test_update_subscriptions_filter_rules(self):
+        # rules are applied to the rule owner's user entries only, mute marks entries read
+        Entry.objects.filter(entry_id='entry0').update(title='Robots Run Amok')
+        Entry.objects.filter(entry_id='entry1').update(content='<p>about <em>python</em></p>')
+        FilterRule.objects.create(user=self.users[0], keyword='robots', action=FilterRule.ACTION.mute)
+        FilterRule.objects.create(user=self.users[1], keyword='python', action=FilterRule.ACTION.highlight)
+        UserEntry.update_subscriptions()
+
+        muted = UserEntry.objects.get(user=self.users[0], entry__entry_id='entry0')
+        self.assertEqual(UserEntry.MUTED, muted.flag)
+        self.assertEqual(UserEntry.READ, muted.status)
+        highlighted = UserEntry.objects.get(user=self.users[1], entry__entry_id='entry1')
+        self.assertEqual(UserEntry.HIGHLIGHTED, highlighted.flag)
+        self.assertEqual(UserEntry.UNREAD, highlighted.status)
+        self.assertEqual(2, UserEntry.objects.exclude(flag=UserEntry.NO_FLAG).count())
+
+    def test_get_matcher_subscribers_only(self):
+        # rules of users without new entries are not compiled
+        outsider = User.objects.create(username='outsider')
+        FilterRule.objects.create(user=outsider, keyword='robots', action=FilterRule.ACTION.mute)
+        self.assertIsNone(FilterRule.get_matcher(
+            Feed.subscriptions.through.objects.filter(feed=self.feed).values('user_id')))
+        FilterRule.objects.create(user=self.users[0], keyword='robots', action=FilterRule.ACTION.mute)
+        matcher = FilterRule.get_matcher(Feed.subscriptions.through.objects.filter(feed=self.feed).values('user_id'))
+        self.assertEqual(1, len(matcher))
+
+
+class SearchModelsTest(TestCase):
+
+    def setUp(self):
+        if search_backend() is None:
+            self.skipTest('needs PostgreSQL or SQLite built with FTS5')
+        self.feed = Feed.objects.create(title='test feed', feed_url='http://example.com/feed/')
+        self.other = Feed.objects.create(title='other feed', feed_url='http://example.com/other/')
+        time_hack = now()
+        for feed, title, content in (
+                (self.feed, 'Robots Run Amok', '<p>The robots are <em>coming</em>.</p>'),
+                (self.feed, 'Gardening', '<p>Robots &amp; tomatoes.</p>'),
+                (self.feed, 'Cooking', '<p>Nothing to see.</p>'),
+                (self.other, 'Robots elsewhere', '<p>Other feed.</p>')):
+            Entry.objects.create(
+                feed=feed,
+                entry_id=hashlib.sha1(title.encode('utf-8')).hexdigest(),
+                link='http://example.com/',
+                title=title,
+                content=content,
+                updated=time_hack,
+                published=time_hack
+            )
+
+    def test_search_backend(self):
+        self.assertEqual(connection.vendor, search_backend())
+        # decided once, not looked up again
+        with self.assertNumQueries(0):
+            self.assertEqual(connection.vendor, search_backend())
+
+    def test_index_pending(self):
+        self.assertEqual(4, Entry.index_pending(chunk=3))
+        self.assertFalse(Entry.objects.filter(indexed=False).exists())
+        self.assertEqual(0, Entry.index_pending())
+
+    def test_search(self):
+        Entry.index_pending()
+        self.assertSetEqual(
+            {'Robots Run Amok', 'Gardening'},
+            set(Entry.search('robots', [self.feed.pk]).values_list('title', flat=True))
+        )
+        self.assertListEqual(
+            ['Gardening'],
+            list(Entry.search('ROBOTS tomatoes', [self.feed.pk]).values_list('title', flat=True))
+        )
+        self.assertEqual(3, Entry.search('robots', [self.feed.pk, self.other.pk]).count())
+        self.assertEqual(0, Entry.search('robots', []).count())
+        # query syntax is not passed through
+        self.assertEqual(0, Entry.search('"', [self.feed.pk]).count())
+        self.assertEqual(1, Entry.search('robots -coming', [self.feed.pk]).count())
+
+    def test_rebuild_index(self):
+        Entry.index_pending()
+        Entry.objects.filter(title='Cooking').update(content='<p>Robots in the kitchen.</p>')
+        self.assertEqual(2, Entry.search('robots', [self.feed.pk]).count())
+        self.assertEqual(4, Entry.rebuild_index())
+        self.assertEqual(3, Entry.search('robots', [self.feed.pk]).count())
+
+
+class RetentionModelsTest(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.feed = Feed.objects.create(title='test feed 01', feed_url='http://example.com/feedtest/')
+        self.user = User.objects.create(username='tester', email='tester@example.com')
+        time_hack = now()
+        for x in range(6):
+            Entry.objects.create(
+                feed=self.feed,
+                entry_id='entry{0}'.format(x),
+                link='http://example.com/entry{0}'.format(x),
+                title='entry {0}'.format(x),
+                content='Some text.',
+                updated=time_hack - timedelta(days=x),
+                published=time_hack - timedelta(days=x),
+                added_to_subscribers=True
+            )
+        self.feed.subscribe(self.user)
+        # the oldest entry is saved
+        UserEntry.objects.filter(user=self.user, entry__entry_id='entry5').update(status=UserEntry.SAVED)
+
+    def test_max_entries(self):
+        version = UserVersion.get(self.user).version
+        self.assertEqual(3, Entry.delete_expired(max_entries=2, max_days=None, chunk=2, pause=0))
+        self.assertSetEqual(
+            {'entry0', 'entry1', 'entry5'}, set(self.feed.entry_set.values_list('entry_id', flat=True)))
+        self.assertSetEqual(
+            {'entry0', 'entry1', 'entry5'},
+            set(UserEntry.objects.filter(user=self.user).values_list('entry__entry_id', flat=True)))
+        self.assertEqual(UserEntry.SAVED, UserEntry.objects.get(entry__entry_id='entry5').status)
+        self.assertEqual(1, Feed.objects.get(pk=self.feed.pk).version)
+        self.assertEqual(version + 1, UserVersion.get(self.user).version)
+        self.assertEqual(0, Entry.delete_expired(max_entries=2, max_days=None, pause=0))
+
+    def test_max_days(self):
+        self.assertEqual(2, Entry.delete_expired(max_entries=None, max_days=2.5, pause=0))
+        self.assertSetEqual(
+            {'entry0', 'entry1', 'entry2', 'entry5'}, set(self.feed.entry_set.values_list('entry_id', flat=True)))
+
+    def test_keeps_newest_and_pending(self):
+        # the newest entry always stays, entries not yet added to subscribers are left for fan-out
+        Entry.objects.filter(entry_id='entry4').update(added_to_subscribers=False)
+        self.assertEqual(3, Entry.delete_expired(max_entries=None, max_days=0, pause=0))
+        self.assertSetEqual(
+            {'entry0', 'entry4', 'entry5'}, set(self.feed.entry_set.values_list('entry_id', flat=True)))
+
+    def test_no_caps(self):
+        self.assertEqual(0, Entry.delete_expired(max_entries=None, max_days=None))
+        self.assertEqual(6, self.feed.entry_set.count())
+
+    def test_feed_caps(self):
+        # a feed's own caps replace the global ones, feeds without caps use the global ones
+        other = Feed.objects.create(title='test feed 02', feed_url='http://example.com/other/')
+        for x in range(3):
+            Entry.objects.create(
+                feed=other, entry_id='other{0}'.format(x), link='http://example.com/other', title='other',
+                content='Some text.', updated=now() - timedelta(days=x), published=now() - timedelta(days=x),
+                added_to_subscribers=True)
+        Feed.objects.filter(pk=self.feed.pk).update(retain_entries=4)
+        self.assertEqual(1, Entry.delete_expired(max_entries=None, max_days=None, pause=0))
+        self.assertEqual(5, self.feed.entry_set.count())
+        self.assertEqual(3, other.entry_set.count())
+        self.assertEqual(2, Entry.delete_expired(max_entries=1, max_days=None, pause=0))
+        self.assertEqual(5, self.feed.entry_set.count())
+        self.assertEqual(1, other.entry_set.count())
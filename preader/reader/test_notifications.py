@@ -0,0 +1,102 @@
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.urlresolvers import reverse
+from django.test import Client, TestCase
+from django.utils.timezone import now
+
+import json
+
+from .models import Feed, Entry, UserEntry, UserVersion
+from .notifications import event_stream, unread_counts
+
+
+class EventStreamTest(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user('tester', 'tester@example.com', 'tester')
+        self.feed = Feed.objects.create(title='test feed', feed_url='http://example.com/feed/')
+        self.feed.subscribe(self.user)
+
+    def _add_entry(self, x):
+        entry = Entry.objects.create(
+            feed=self.feed,
+            entry_id='entry{0}'.format(x),
+            link='http://example.com/entry{0}'.format(x),
+            title='entry {0}'.format(x),
+            content='Some text.',
+            updated=now(),
+            published=now(),
+            added_to_subscribers=True
+        )
+        UserEntry.objects.create(user=self.user, feed=self.feed, entry=entry, published=entry.published)
+
+    def _data(self, event):
+        return json.loads(event.split('data: ', 1)[1])
+
+    def test_unread_counts(self):
+        self.assertDictEqual({}, unread_counts(self.user))
+        self._add_entry(1)
+        self._add_entry(2)
+        self.assertDictEqual({self.feed.pk: 2}, unread_counts(self.user))
+        self.feed.unsubscribe(self.user, background=True)
+        self.assertDictEqual({}, unread_counts(self.user))
+
+    def test_event_stream(self):
+        self._add_entry(1)
+        stream = event_stream(self.user, timeout=60, interval=0)
+        self.assertEqual('retry', next(stream).split(':')[0])
+        event = next(stream)
+        version = UserVersion.get(self.user).version
+        self.assertTrue(event.startswith('id: {0}\nevent: unread\n'.format(version)))
+        self.assertDictEqual({str(self.feed.pk): 1}, self._data(event))
+        self.assertEqual(': keepalive\n\n', next(stream))
+
+        self._add_entry(2)
+        self._add_entry(3)
+        UserVersion.bump(self.user)
+        event = next(stream)
+        self.assertTrue(event.startswith('event: entries\n'))
+        self.assertDictEqual({'feed': self.feed.pk, 'new': 2}, self._data(event))
+        self.assertDictEqual({str(self.feed.pk): 3}, self._data(next(stream)))
+
+        UserEntry.objects.update(status=UserEntry.READ)
+        UserVersion.bump(self.user)
+        event = next(stream)
+        self.assertTrue(event.startswith('id: {0}\nevent: unread\n'.format(version + 2)))
+        self.assertDictEqual({}, self._data(event))
+        stream.close()
+
+    def test_event_stream_polling(self):
+        # a timeout of 0 answers at once, a poll with the current version as Last-Event-ID gets no events
+        self._add_entry(1)
+        events = list(event_stream(self.user, timeout=0, interval=15))
+        self.assertListEqual(['retry: 15000\n\n'], events[:1])
+        self.assertEqual(2, len(events))
+        version = UserVersion.get(self.user).version
+        self.assertEqual(1, len(list(event_stream(self.user, timeout=0, last_version=version))))
+
+        # new entries since the last poll
+        self._add_entry(2)
+        UserVersion.bump(self.user)
+        events = list(event_stream(self.user, timeout=0, last_version=version))
+        self.assertEqual(3, len(events))
+        self.assertDictEqual({'feed': self.feed.pk, 'new': 1}, self._data(events[1]))
+        self.assertDictEqual({str(self.feed.pk): 2}, self._data(events[2]))
+
+        # version changed without a change of counts, only the id moves on
+        UserVersion.bump(self.user)
+        events = list(event_stream(self.user, timeout=0, last_version=version + 1))
+        self.assertListEqual(['id: {0}\n\n'.format(version + 2)], events[1:])
+
+    def test_entry_events_view(self):
+        c = Client()
+        self.assertEqual(302, c.get(reverse('feeds:entry-events')).status_code)
+        c.login(username='tester', password='tester')
+        res = c.get(reverse('feeds:entry-events'))
+        self.assertEqual(200, res.status_code)
+        self.assertEqual('text/event-stream', res['Content-Type'])
+        self.assertTrue(res.streaming)
+        self.assertEqual(2, len(list(res.streaming_content)))
+        res = c.get(reverse('feeds:entry-events'), HTTP_LAST_EVENT_ID=str(UserVersion.get(self.user).version))
+        self.assertEqual(1, len(list(res.streaming_content)))
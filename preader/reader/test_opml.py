@@ -0,0 +1,110 @@
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.urlresolvers import reverse
+from django.test import Client, TestCase
+from django.utils.timezone import now
+
+from io import BytesIO
+import requests_mock
+
+from .models import Feed, Entry, UserEntry, DiscoveryJob
+from .opml import OPMLError, import_opml, parse_opml
+
+OPML = b"""<?xml version="1.0" encoding="UTF-8"?>
+<opml version="1.0">
+    <head><title>subscriptions</title></head>
+    <body>
+        <outline text="Known" title="Known" xmlUrl="http://example.com/known/" htmlUrl="http://example.com/"/>
+        <outline text="Folder">
+            <outline text="New" type="rss" xmlUrl="http://example.com/new/"/>
+            <outline text="Site only" htmlUrl="http://example.org/"/>
+        </outline>
+    </body>
+</opml>
+"""
+
+FEED = """<?xml version="1.0" encoding="utf-8"?>
+<feed xmlns="http://www.w3.org/2005/Atom">
+    <title>New Feed</title>
+    <id>urn:uuid:60a76c80-d399-11d9-b91C-0003939e0af6</id>
+    <updated>2003-12-13T18:30:02Z</updated>
+    <entry>
+        <title>Atom-Powered Robots Run Amok</title>
+        <link href="http://example.com/new/1"/>
+        <id>urn:uuid:1225c695-cfb8-4ebb-aaaa-80da344efa6a</id>
+        <updated>2003-12-13T18:30:02Z</updated>
+        <summary>Some text.</summary>
+    </entry>
+</feed>
+"""
+
+
+class OPMLTest(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user('tester', 'tester@example.com', 'tester')
+        self.known = Feed.objects.create(title='known', feed_url='http://example.com/known/')
+        Entry.objects.create(
+            feed=self.known, entry_id='known', link='http://example.com/known/1', title='known', content='Some text.',
+            updated=now(), published=now(), added_to_subscribers=True)
+
+    def _mock(self, mock):
+        mock.get('http://example.org/', text='<html><head><link type="application/rss+xml" href="/rss/"></head></html>',
+                 headers={'content-type': 'text/html'})
+        mock.get('http://example.com/new/', text=FEED, headers={'content-type': 'application/atom+xml'})
+        mock.get('http://example.org/rss/', text=FEED.replace('example.com/new', 'example.org/rss'),
+                 headers={'content-type': 'application/rss+xml'})
+
+    def test_parse_opml(self):
+        self.assertListEqual(
+            [
+                ('http://example.com/known/', 'http://example.com/', 'Known'),
+                ('http://example.com/new/', '', 'New'),
+                ('', 'http://example.org/', 'Site only'),
+            ],
+            parse_opml(BytesIO(OPML))
+        )
+        with self.assertRaises(OPMLError):
+            parse_opml(BytesIO(b'<opml><body>'))
+
+    def test_import_opml(self):
+        with requests_mock.Mocker() as mock:
+            self._mock(mock)
+            self.assertEqual((3, 3, 0), import_opml(self.user, BytesIO(OPML), workers=1))
+        self.assertSetEqual(
+            {'http://example.com/known/', 'http://example.com/new/', 'http://example.org/rss/'},
+            set(Feed.objects.filter(subscriptions=self.user).values_list('feed_url', flat=True))
+        )
+        self.assertEqual('New', Feed.objects.get(feed_url='http://example.com/new/').title)
+        # known feed backfilled, new feeds fetched and fanned out
+        self.assertEqual(3, UserEntry.objects.filter(user=self.user).count())
+        # discovery result is cached, importing again finds everything without requests
+        with requests_mock.Mocker() as mock:
+            self.assertEqual((3, 0, 0), import_opml(self.user, BytesIO(OPML), fetch=False))
+            self.assertEqual(0, mock.call_count)
+
+    def test_OPMLImportView(self):
+        c = Client()
+        c.login(username='tester', password='tester')
+        with requests_mock.Mocker() as mock:
+            self._mock(mock)
+            res = c.post(reverse('feeds:import'), {'opml': SimpleUploadedFile('feeds.opml', OPML)})
+            self.assertRedirects(res, reverse('feeds:feed-list'), fetch_redirect_response=False)
+            # sites are not fetched inside the request
+            self.assertFalse(mock.called)
+        self.assertEqual(2, Feed.objects.filter(subscriptions=self.user).count())
+        # new feeds wait for update_feeds
+        self.assertFalse(Feed.objects.filter(last_checked__isnull=False).exists())
+        res = c.post(reverse('feeds:import'), {'opml': SimpleUploadedFile('feeds.opml', b'garbage')})
+        self.assertRedirects(res, reverse('feeds:import'), fetch_redirect_response=False)
+
+        # the discovery job subscribes to the site's feed
+        job = DiscoveryJob.objects.get(user=self.user)
+        self.assertTupleEqual(('http://example.org/', True), (job.url, job.subscribe))
+        with requests_mock.Mocker() as mock:
+            self._mock(mock)
+            self.assertEqual(1, DiscoveryJob.run_pending())
+        self.assertEqual(3, Feed.objects.filter(subscriptions=self.user).count())
+        self.assertTrue(Feed.objects.filter(subscriptions=self.user, feed_url='http://example.org/rss/').exists())
@@ -0,0 +1,16 @@
+from django.test import SimpleTestCase
+from django.utils.timezone import now
+
+from .pagination import encode_cursor, decode_cursor
+
+
+class CursorTest(SimpleTestCase):
+
+    def test_round_trip(self):
+        published = now()
+        self.assertEqual((published, 42), decode_cursor(encode_cursor(published, 42)))
+
+    def test_invalid(self):
+        self.assertIsNone(decode_cursor('garbage'))
+        self.assertIsNone(decode_cursor('1.2.3'))
+        self.assertIsNone(decode_cursor('99999999999999999999999.1'))
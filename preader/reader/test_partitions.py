@@ -0,0 +1,77 @@
+from django.contrib.auth.models import User
+from django.db import connection
+from django.test import SimpleTestCase, TestCase
+from django.utils.timezone import now, utc
+
+from datetime import datetime
+from unittest import skipUnless
+import re
+
+from .models import Feed, FeedLog, UserEntry
+from .partitions import (
+    add_months, convert_table, drop_partitions_before, is_partitioned, month_start, partitioning_supported,
+    partitions, range_partition_sql, roll_table
+)
+
+
+class MonthTest(SimpleTestCase):
+
+    def test_add_months(self):
+        month = datetime(2016, 11, 1, tzinfo=utc)
+        self.assertEqual(datetime(2017, 2, 1, tzinfo=utc), add_months(month, 3))
+        self.assertEqual(datetime(2015, 11, 1, tzinfo=utc), add_months(month, -12))
+        self.assertEqual(datetime(2016, 12, 1, tzinfo=utc), add_months(datetime(2017, 1, 1, tzinfo=utc), -1))
+
+    def test_month_start(self):
+        self.assertEqual(datetime(2016, 5, 1, tzinfo=utc), month_start(datetime(2016, 5, 21, 19, 15, 3, tzinfo=utc)))
+
+    def test_range_partition_sql(self):
+        self.assertEqual(
+            "CREATE TABLE t_p201605 PARTITION OF t FOR VALUES FROM ('2016-05-01 00:00:00+00') TO (MAXVALUE)",
+            range_partition_sql('t', 't_p201605', datetime(2016, 5, 1, tzinfo=utc), None))
+
+
+def execute(sql):
+    with connection.cursor() as cursor:
+        cursor.execute(sql)
+
+
+@skipUnless(connection.vendor == 'postgresql', 'partitioning is PostgreSQL only')
+class PartitionTest(TestCase):
+
+    def setUp(self):
+        if not partitioning_supported():
+            self.skipTest('needs PostgreSQL 11 or later')
+        self.user = User.objects.create_user('tester', 'tester@example.com', 'tester')
+        self.feed = Feed.objects.create(title='test feed', feed_url='http://example.com/feed/')
+
+    def test_user_entries(self):
+        convert_table('userentry', execute, modulus=4)
+        self.assertTrue(is_partitioned(UserEntry._meta.db_table))
+        self.assertEqual(4, len(partitions(UserEntry._meta.db_table)))
+
+        # queries for one user only read that user's partition
+        sql, params = UserEntry.objects.filter(user=self.user, status=UserEntry.UNREAD).query.sql_with_params()
+        with connection.cursor() as cursor:
+            cursor.execute('EXPLAIN ' + sql, params)
+            plan = '\n'.join(row[0] for row in cursor.fetchall())
+        self.assertEqual(1, len(set(re.findall(r'reader_userentry_p\d+', plan))), plan)
+
+    def test_feed_logs(self):
+        FeedLog.objects.create(feed=self.feed, duration=1)
+        convert_table('feedlog', execute, history=2, ahead=1)
+        self.assertEqual(1, FeedLog.objects.count())
+        FeedLog.objects.create(feed=self.feed, duration=1)
+        self.assertEqual(2, FeedLog.objects.count())
+
+        # already far enough ahead
+        self.assertEqual([], roll_table('feedlog', execute, ahead=1))
+        created = roll_table('feedlog', execute, ahead=3)
+        self.assertEqual(2, len(created))
+        self.assertEqual(2, FeedLog.objects.count())
+
+        # the current month is kept, everything before it dropped
+        dropped = drop_partitions_before('feedlog', execute, month_start(now()))
+        self.assertIn(FeedLog._meta.db_table + '_old', dropped)
+        self.assertEqual(3, len(dropped))
+        self.assertEqual(2, FeedLog.objects.count())
@@ -0,0 +1,100 @@
+from django.contrib.auth.models import User
+from django.db import connection
+from django.db.models import Count, Q
+from django.test import TestCase
+from django.utils.timezone import now
+
+from unittest import skipUnless
+import re
+
+from .models import Feed, Entry, UserEntry
+
+# SQLite "SCAN reader_entry" (or "SCAN TABLE reader_entry AS e" on older versions) is a full table scan,
+# "SCAN ... USING INDEX" and "SEARCH" are not, neither are scans of subquery results
+sqlite_full_scan = re.compile(r'^SCAN (?:TABLE )?(\S+)(?: AS \w+)?$')
+sqlite_subquery = re.compile(r'^(?:CO-ROUTINE|MATERIALIZE) (\S+)')
+postgresql_full_scan = re.compile(r'Seq Scan on (\w+)')
+
+
+@skipUnless(connection.vendor in ('sqlite', 'postgresql'), 'query plans are only checked on SQLite and PostgreSQL')
+class QueryPlanTest(TestCase):
+    """
+    Query Plan Test
+
+    EXPLAIN the hot queries and fail if any of them reads a whole table instead of an index.  On PostgreSQL
+    sequential scans are disabled first, so a Seq Scan in the plan means no usable index exists rather than the
+    planner preferring a scan of a small test table.
+    """
+
+    def setUp(self):
+        self.user = User.objects.create_user('tester', 'tester@example.com', 'tester')
+        self.feed = Feed.objects.create(title='test feed', feed_url='http://example.com/feed/')
+        if connection.vendor == 'postgresql':
+            with connection.cursor() as cursor:
+                cursor.execute('SET enable_seqscan = off')
+
+    def tearDown(self):
+        if connection.vendor == 'postgresql':
+            with connection.cursor() as cursor:
+                cursor.execute('RESET enable_seqscan')
+
+    def explain(self, queryset):
+        sql, params = queryset.query.sql_with_params()
+        with connection.cursor() as cursor:
+            if connection.vendor == 'sqlite':
+                cursor.execute('EXPLAIN QUERY PLAN ' + sql, params)
+                return [row[-1] for row in cursor.fetchall()]
+            cursor.execute('EXPLAIN ' + sql, params)
+            return [row[0] for row in cursor.fetchall()]
+
+    def assertIndexed(self, queryset, ordered=False):
+        """
+        Assert Indexed
+
+        :param queryset: queryset to EXPLAIN
+        :param ordered: also fail if rows are sorted after reading instead of read in index order
+        """
+        plan = [line.strip() for line in self.explain(queryset)]
+        message = 'full scan in plan:\n' + '\n'.join(plan)
+        if connection.vendor == 'postgresql':
+            for line in plan:
+                self.assertIsNone(postgresql_full_scan.search(line), message)
+            return
+
+        subqueries = {match.group(1) for match in map(sqlite_subquery.match, plan) if match}
+        for line in plan:
+            match = sqlite_full_scan.match(line)
+            if match is not None:
+                name = match.group(1)
+                self.assertTrue(name.startswith('(') or name in subqueries, message)
+            if ordered:
+                self.assertNotIn('TEMP B-TREE', line, 'sort in plan:\n' + '\n'.join(plan))
+
+    def test_scheduler(self):
+        self.assertIndexed(Feed.active.filter(Q(next_checked=None) | Q(next_checked__lte=now()))[:10])
+
+    def test_entry_list(self):
+        self.assertIndexed(Entry.objects.filter(feed=self.feed).order_by('-published', '-id')[:26], ordered=True)
+        self.assertIndexed(Entry.objects.filter(feed=self.feed).order_by('-published')[:1])
+
+    def test_latest_for_feeds(self):
+        self.assertIndexed(Entry.latest_for_feeds([self.feed.pk], 5))
+
+    def test_fan_out(self):
+        self.assertIndexed(Entry.objects.filter(feed=self.feed, added_to_subscribers=False).order_by('-id')[:1])
+        self.assertIndexed(Entry.objects.filter(feed=self.feed, added_to_subscribers=False, id__lte=100))
+
+    def test_user_entries(self):
+        self.assertIndexed(UserEntry.objects.filter(user=self.user, feed=self.feed, status=UserEntry.UNREAD))
+        self.assertIndexed(UserEntry.objects.filter(user=self.user, feed=self.feed))
+
+    def test_timeline(self):
+        self.assertIndexed(
+            UserEntry.objects.filter(user=self.user, status=UserEntry.UNREAD).order_by('-published', '-id')[:26],
+            ordered=True
+        )
+        self.assertIndexed(UserEntry.objects.filter(user=self.user).order_by('-published', '-id')[:26], ordered=True)
+
+    def test_unread_counts(self):
+        self.assertIndexed(
+            UserEntry.unread.filter(user=self.user).values('feed').annotate(unread=Count('id')).order_by())
@@ -0,0 +1,60 @@
+from django.db import DEFAULT_DB_ALIAS
+from django.http import HttpResponse
+from django.test import RequestFactory, SimpleTestCase
+
+from unittest import mock
+
+from .models import Feed, FeedLog
+from .routers import IngestRouter, PrimaryPinMiddleware, REPLICA_PIN_COOKIE, read_database
+
+
+class IngestRouterTest(SimpleTestCase):
+
+    def setUp(self):
+        self.router = IngestRouter()
+
+    def test_not_configured(self):
+        with mock.patch('reader.routers.INGEST_DATABASE', None):
+            self.assertIsNone(self.router.db_for_write(FeedLog))
+            self.assertIsNone(self.router.db_for_read(Feed))
+
+    def test_ingest_database(self):
+        with mock.patch('reader.routers.INGEST_DATABASE', 'ingest'):
+            self.assertEqual('ingest', self.router.db_for_write(FeedLog))
+            self.assertEqual('ingest', self.router.db_for_read(FeedLog))
+            self.assertIsNone(self.router.db_for_read(Feed))
+            # the feed of a log is read from the default database, not the log's
+            self.assertEqual(DEFAULT_DB_ALIAS, self.router.db_for_read(Feed, instance=FeedLog()))
+            self.assertTrue(self.router.allow_relation(Feed(), FeedLog()))
+            self.assertIsNone(self.router.allow_relation(Feed(), Feed()))
+
+    def test_allow_migrate(self):
+        with mock.patch('reader.routers.READ_REPLICA_DATABASE', 'replica'):
+            self.assertFalse(self.router.allow_migrate('replica', 'reader'))
+            self.assertIsNone(self.router.allow_migrate(DEFAULT_DB_ALIAS, 'reader'))
+
+
+class ReadDatabaseTest(SimpleTestCase):
+
+    def setUp(self):
+        self.factory = RequestFactory()
+
+    def test_no_replica(self):
+        with mock.patch('reader.routers.READ_REPLICA_DATABASE', None):
+            self.assertEqual(DEFAULT_DB_ALIAS, read_database(self.factory.get('/')))
+
+    def test_replica(self):
+        with mock.patch('reader.routers.READ_REPLICA_DATABASE', 'replica'):
+            self.assertEqual('replica', read_database(self.factory.get('/')))
+            self.assertEqual(DEFAULT_DB_ALIAS, read_database(self.factory.post('/')))
+
+    def test_pinned_after_write(self):
+        with mock.patch('reader.routers.READ_REPLICA_DATABASE', 'replica'):
+            response = PrimaryPinMiddleware().process_response(self.factory.post('/'), HttpResponse())
+            self.assertIn(REPLICA_PIN_COOKIE, response.cookies)
+            response = PrimaryPinMiddleware().process_response(self.factory.get('/'), HttpResponse())
+            self.assertNotIn(REPLICA_PIN_COOKIE, response.cookies)
+
+            request = self.factory.get('/')
+            request.COOKIES[REPLICA_PIN_COOKIE] = '1'
+            self.assertEqual(DEFAULT_DB_ALIAS, read_database(request))
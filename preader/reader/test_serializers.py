@@ -0,0 +1,27 @@
+from django.http import StreamingHttpResponse
+from django.test import SimpleTestCase
+from django.utils.timezone import now
+
+import json
+
+from .serializers import iter_json_list, json_list_response, STREAM_JSON_ROWS
+
+
+class SerializersTest(SimpleTestCase):
+
+    def test_iter_json_list(self):
+        rows = [{'id': x} for x in range(5)]
+        self.assertListEqual(rows, json.loads(''.join(iter_json_list(rows, chunk_size=2))))
+        self.assertListEqual([], json.loads(''.join(iter_json_list([]))))
+
+    def test_json_list_response(self):
+        # short lists are sent in one piece, datetimes are encoded
+        res = json_list_response([{'published': now()}])
+        self.assertNotIsInstance(res, StreamingHttpResponse)
+        self.assertEqual(1, len(json.loads(res.content.decode('utf-8'))))
+
+    def test_json_list_response_streamed(self):
+        rows = [{'id': x} for x in range(STREAM_JSON_ROWS + 1)]
+        res = json_list_response(rows)
+        self.assertIsInstance(res, StreamingHttpResponse)
+        self.assertListEqual(rows, json.loads(b''.join(res.streaming_content).decode('utf-8')))
@@ -1,12 +1,21 @@
 from django.contrib.auth.models import User
-from django.core.urlresolvers import reverse
+from django.core.cache import cache
+from django.core.urlresolvers import resolve, reverse
+from django.db.models import F
 from django.test import Client, TestCase
+from django.utils.timezone import now
 
-from .models import Feed
+from datetime import timedelta
+from unittest import mock
+import json
+
+from .models import Feed, Entry, UserEntry, UserVersion, DiscoveryJob, search_backend
+from .views import EntryListView, DiscoveryJobView, SearchView, TimelineView, DASHBOARD_ENTRIES
 
 
 class ReaderViewsTests(TestCase):
     def setUp(self):
+        cache.clear()
         self.c = Client()
         User.objects.create_user('tester', 'tester@example.com', 'tester')
         Feed.objects.create(feed_url='http://example.com/feed/')
@@ -22,8 +31,303 @@ class ReaderViewsTests(TestCase):
         )
         res = self.c.get(reverse('feeds:feed-list'))
         self.assertEqual(res.status_code, 200)
-        self.assertEqual(0, len(res.context['object_list']))
+        self.assertEqual(0, len(json.loads(res.content.decode('utf-8'))))
         f.subscribe(u)
         res = self.c.get(reverse('feeds:feed-list'))
         self.assertEqual(res.status_code, 200)
-        self.assertEqual(1, len(res.context['object_list']))
\ No newline at end of file
+        self.assertListEqual(
+            [{'id': f.pk, 'title': f.title, 'description': f.description}],
+            json.loads(res.content.decode('utf-8'))
+        )
+
+    def test_FeedListView_fields(self):
+        # only requested fields are serialized, unknown fields are ignored
+        self.c.login(username='tester', password='tester')
+        f = Feed.objects.get(pk=1)
+        f.subscribe(User.objects.get(pk=1))
+        res = self.c.get(reverse('feeds:feed-list'), {'fields': 'id,feed_url'})
+        self.assertListEqual([{'id': f.pk}], json.loads(res.content.decode('utf-8')))
+
+    def test_index_dashboard(self):
+        # the index page builds the feed list from one dashboard request
+        res = self.c.get('/')
+        self.assertNotContains(res, 'feedDashboard')
+        self.c.login(username='tester', password='tester')
+        res = self.c.get('/')
+        self.assertContains(res, '<div id="feedDashboard"></div>', count=1)
+        self.assertContains(res, '$.getJSON(dashboard_url)', count=1)
+
+
+class EntryActionViewsTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.c = Client()
+        self.user = User.objects.create_user('tester', 'tester@example.com', 'tester')
+        self.feed = Feed.objects.create(title='test feed', feed_url='http://example.com/feed/')
+        time_hack = now()
+        self.entries = [
+            Entry.objects.create(
+                feed=self.feed,
+                entry_id='entry{0}'.format(x),
+                link='http://example.com/entry{0}'.format(x),
+                title='entry {0}'.format(x),
+                content='<p>Some text {0}.</p>'.format(x),
+                snippet='Some text {0}.'.format(x),
+                updated=time_hack - timedelta(hours=x),
+                published=time_hack - timedelta(hours=x),
+                added_to_subscribers=True
+            ) for x in range(4)
+        ]
+        self.feed.subscribe(self.user)
+        self.c.login(username='tester', password='tester')
+
+    def _post_read(self, data):
+        return self.c.post(reverse('feeds:mark-read'), json.dumps(data), content_type='application/json')
+
+    def test_entry_actions(self):
+        entry = self.entries[0]
+        res = self.c.post(reverse('feeds:entry-action', args=(self.feed.pk, entry.pk, 'read')))
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(UserEntry.READ, UserEntry.objects.get(user=self.user, entry=entry).status)
+        res = self.c.post(reverse('feeds:entry-action', args=(self.feed.pk, entry.pk, 'clear')))
+        self.assertEqual(UserEntry.UNREAD, UserEntry.objects.get(user=self.user, entry=entry).status)
+
+    def test_entry_actions_saved(self):
+        # read and clear leave saved entries saved
+        entry = self.entries[0]
+        UserEntry.objects.filter(user=self.user, entry=entry).update(status=UserEntry.SAVED)
+        for action in ('read', 'clear'):
+            res = self.c.post(reverse('feeds:entry-action', args=(self.feed.pk, entry.pk, action)))
+            self.assertEqual(res.status_code, 200)
+            self.assertEqual(0, json.loads(res.content.decode('utf-8'))['updated'])
+            self.assertEqual(UserEntry.SAVED, UserEntry.objects.get(user=self.user, entry=entry).status)
+
+    def test_entry_actions_not_subscribed(self):
+        self.feed.unsubscribe(self.user, background=False)
+        res = self.c.post(reverse('feeds:entry-action', args=(self.feed.pk, self.entries[0].pk, 'read')))
+        self.assertEqual(res.status_code, 404)
+
+    def test_mark_entries_read_ids(self):
+        res = self._post_read({'entries': [self.entries[0].pk, self.entries[1].pk]})
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(2, json.loads(res.content.decode('utf-8'))['updated'])
+        self.assertEqual(2, UserEntry.read.filter(user=self.user).count())
+
+    def test_mark_entries_read_watermark(self):
+        # entries published at or before the watermark are marked read, saved entries are left alone
+        UserEntry.objects.filter(user=self.user, entry=self.entries[3]).update(status=UserEntry.SAVED)
+        res = self._post_read({'feeds': {str(self.feed.pk): self.entries[1].published.isoformat()}})
+        self.assertEqual(2, json.loads(res.content.decode('utf-8'))['updated'])
+        self.assertListEqual(
+            [self.entries[0].pk],
+            list(UserEntry.unread.filter(user=self.user).values_list('entry_id', flat=True))
+        )
+        self.assertEqual(1, UserEntry.saved.filter(user=self.user).count())
+
+    def test_mark_entries_read_beacon(self):
+        # navigator.sendBeacon posts a form with the CSRF token and the JSON in "data"
+        c = Client(enforce_csrf_checks=True)
+        c.login(username='tester', password='tester')
+        token = 'a' * 32
+        c.cookies['csrftoken'] = token
+        data = json.dumps({'entries': [self.entries[0].pk]})
+        self.assertEqual(403, c.post(reverse('feeds:mark-read'), {'data': data}).status_code)
+        res = c.post(reverse('feeds:mark-read'), {'csrfmiddlewaretoken': token, 'data': data})
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(1, json.loads(res.content.decode('utf-8'))['updated'])
+
+    def test_mark_entries_read_invalid(self):
+        self.assertEqual(400, self._post_read({'feeds': {str(self.feed.pk): 'not a date'}}).status_code)
+        self.assertEqual(405, self.c.get(reverse('feeds:mark-read')).status_code)
+
+    def test_EntryListView_pagination(self):
+        # pages follow (published, id) newest first, next cursor is stable and ends on the last page
+        with mock.patch.object(EntryListView, 'page_size', 3):
+            url = reverse('feeds:entry-list', args=(self.feed.pk, ))
+            res = self.c.get(url)
+            self.assertEqual(res.status_code, 200)
+            self.assertListEqual(self.entries[:3], list(res.context['entry_list']))
+            self.assertIsNotNone(res.context['next_cursor'])
+
+            res = self.c.get(url, {'cursor': res.context['next_cursor']})
+            self.assertListEqual(self.entries[3:], list(res.context['entry_list']))
+            self.assertIsNone(res.context['next_cursor'])
+
+            res = self.c.get(url, {'cursor': 'garbage'})
+            self.assertEqual(res.status_code, 404)
+
+    def test_EntryListView_json(self):
+        with mock.patch.object(EntryListView, 'page_size', 3):
+            url = reverse('feeds:entry-list', args=(self.feed.pk, ))
+            data = json.loads(self.c.get(url, {'format': 'json'}).content.decode('utf-8'))
+            self.assertEqual(3, len(data['entries']))
+            data = json.loads(self.c.get(url, {'format': 'json', 'cursor': data['next']}).content.decode('utf-8'))
+            self.assertEqual(1, len(data['entries']))
+            self.assertIsNone(data['next'])
+            self.assertEqual('Some text 3.', data['entries'][0]['snippet'])
+            self.assertNotIn('content', data['entries'][0])
+
+    def test_EntryListView_no_content(self):
+        res = self.c.get(reverse('feeds:entry-list', args=(self.feed.pk, )))
+        self.assertContains(res, 'Some text 0.')
+        self.assertNotContains(res, '<p>Some text 0.</p>')
+
+    def test_entry_content(self):
+        url = reverse('feeds:entry-content')
+        res = self.c.get(url, {'ids': '{0},{1}'.format(self.entries[0].pk, self.entries[1].pk)})
+        self.assertEqual(res.status_code, 200)
+        self.assertDictEqual(
+            {str(self.entries[0].pk): '<p>Some text 0.</p>', str(self.entries[1].pk): '<p>Some text 1.</p>'},
+            json.loads(res.content.decode('utf-8'))
+        )
+        self.assertEqual(self.c.get(url, {'ids': 'garbage'}).status_code, 400)
+        self.assertEqual(self.c.get(url).status_code, 400)
+        with mock.patch('reader.views.MAX_CONTENT_ENTRIES', 1):
+            res = self.c.get(url, {'ids': '{0},{1}'.format(self.entries[0].pk, self.entries[1].pk)})
+            self.assertEqual(res.status_code, 400)
+
+    def test_entry_content_inactive_feed(self):
+        Feed.objects.filter(pk=self.feed.pk).update(disabled=True)
+        res = self.c.get(reverse('feeds:entry-content'), {'ids': str(self.entries[0].pk)})
+        self.assertDictEqual({}, json.loads(res.content.decode('utf-8')))
+
+    def test_SearchView(self):
+        if search_backend() is None:
+            self.skipTest('needs PostgreSQL or SQLite built with FTS5')
+        Entry.index_pending()
+        other = Feed.objects.create(title='other feed', feed_url='http://example.com/other/')
+        Entry.objects.create(
+            feed=other, entry_id='other', link='http://example.com/other', title='other', content='Some text 1.',
+            updated=now(), published=now())
+        Entry.index_pending()
+        url = reverse('feeds:search')
+        res = self.c.get(url, {'q': 'text 1'})
+        self.assertEqual(res.status_code, 200)
+        self.assertListEqual([self.entries[1]], list(res.context['entry_list']))
+        with mock.patch.object(SearchView, 'page_size', 3):
+            data = json.loads(self.c.get(url, {'q': 'text', 'format': 'json'}).content.decode('utf-8'))
+            self.assertEqual(3, len(data['entries']))
+            self.assertIsNotNone(data['next'])
+        res = self.c.get(url)
+        self.assertEqual(0, len(res.context['entry_list']))
+
+    def test_DashboardView(self):
+        # every subscribed feed with its newest entries, newest first, in a fixed number of queries
+        other = Feed.objects.create(title='other feed', feed_url='http://example.com/other/')
+        other.subscribe(self.user)
+        UserVersion.get(self.user)
+        cache.clear()
+        with self.assertNumQueries(6):  # session, user, user version, subscribed feed ids, feeds, entries
+            res = self.c.get(reverse('feeds:dashboard'))
+        data = json.loads(res.content.decode('utf-8'))
+        feeds = {feed['id']: feed for feed in data}
+        self.assertEqual(0, len(feeds[other.pk]['entries']))
+        self.assertListEqual(
+            [e.pk for e in self.entries[:DASHBOARD_ENTRIES]],
+            [e['id'] for e in feeds[self.feed.pk]['entries']]
+        )
+
+    def test_conditional_get(self):
+        # polling with the ETag returns 304 until the user's or the feed's version changes
+        for url in (reverse('feeds:feed-list'), reverse('feeds:dashboard'),
+                    reverse('feeds:entry-list', args=(self.feed.pk, )) + '?format=json'):
+            res = self.c.get(url)
+            self.assertEqual(res.status_code, 200)
+            etag = res['ETag']
+            res = self.c.get(url, HTTP_IF_NONE_MATCH=etag)
+            self.assertEqual(res.status_code, 304)
+
+            UserVersion.bump(self.user)
+            Feed.objects.filter(pk=self.feed.pk).update(version=F('version') + 1)
+            res = self.c.get(url, HTTP_IF_NONE_MATCH=etag)
+            self.assertEqual(res.status_code, 200)
+
+    def test_read_bumps_user_version(self):
+        version = UserVersion.get(self.user).version
+        self._post_read({'entries': [self.entries[0].pk]})
+        self.assertEqual(version + 1, UserVersion.get(self.user).version)
+
+    def test_TimelineView(self):
+        # entries of every feed, newest first, filtered by status and keyset paginated
+        other = Feed.objects.create(title='other feed', feed_url='http://example.com/other/')
+        other_entry = Entry.objects.create(
+            feed=other, entry_id='other', link='http://example.com/other', title='other', content='Some text.',
+            updated=self.entries[1].published, published=self.entries[1].published, added_to_subscribers=True)
+        other.subscribe(self.user)
+        self.assertEqual(other_entry.published, UserEntry.objects.get(entry=other_entry).published)
+        UserEntry.objects.filter(user=self.user, entry=self.entries[0]).update(status=UserEntry.READ)
+
+        with mock.patch.object(TimelineView, 'page_size', 2):
+            url = reverse('feeds:timeline')
+            res = self.c.get(url)
+            self.assertEqual(res.status_code, 200)
+            self.assertListEqual(
+                [other_entry.pk, self.entries[1].pk],
+                sorted([ue.entry_id for ue in res.context['userentry_list']], reverse=True)
+            )
+            data = json.loads(self.c.get(url, {'format': 'json', 'cursor': res.context['next_cursor']}).content.decode(
+                'utf-8'))
+            self.assertListEqual([self.entries[2].pk, self.entries[3].pk], [ue['entry'] for ue in data['entries']])
+            self.assertIsNone(data['next'])
+
+            res = self.c.get(url, {'status': 'all'})
+            self.assertEqual(self.entries[0].pk, res.context['userentry_list'][0].entry_id)
+            self.assertEqual(404, self.c.get(url, {'status': 'bogus'}).status_code)
+
+    def test_TimelineView_unsubscribed_in_background(self):
+        # entries are hidden as soon as the feed is unsubscribed, before the job deletes them
+        self.feed.unsubscribe(self.user, background=True)
+        self.assertTrue(UserEntry.objects.filter(user=self.user, feed=self.feed).exists())
+        res = self.c.get(reverse('feeds:timeline'), {'status': 'all'})
+        self.assertEqual(0, len(res.context['userentry_list']))
+
+
+class DiscoveryViewsTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.c = Client()
+        self.user = User.objects.create_user('tester', 'tester@example.com', 'tester')
+        self.c.login(username='tester', password='tester')
+
+    def test_URLFormView_background(self):
+        res = self.c.post(reverse('feeds:add-url'), {'url': 'http://example.com/'})
+        job = DiscoveryJob.objects.get(user=self.user)
+        self.assertRedirects(res, reverse('feeds:discovery', args=(job.pk, )))
+        url = reverse('feeds:discovery', args=(job.pk, ))
+        self.assertTemplateUsed(self.c.get(url), 'reader/discovery.html')
+        data = json.loads(self.c.get(url, {'format': 'json'}).content.decode('utf-8'))
+        self.assertDictEqual({'status': DiscoveryJob.STATUS.pending, 'next': None}, data)
+
+        feed = Feed.objects.create(feed_url='http://example.com/feed/')
+        job.feeds.add(feed)
+        DiscoveryJob.objects.filter(pk=job.pk).update(status=DiscoveryJob.STATUS.done)
+        data = json.loads(self.c.get(url, {'format': 'json'}).content.decode('utf-8'))
+        self.assertEqual(reverse('feeds:subscribe'), data['next'])
+        self.assertListEqual([feed.pk], self.c.session['feed_id_list'])
+
+    def test_URLFormView_known_feed(self):
+        # feeds already in the database need no job
+        feed = Feed.objects.create(feed_url='http://example.com/feed/')
+        res = self.c.post(reverse('feeds:add-url'), {'url': 'http://example.com/feed/'})
+        self.assertRedirects(res, reverse('feeds:subscribe'))
+        self.assertListEqual([feed.pk], self.c.session['feed_id_list'])
+        self.assertFalse(DiscoveryJob.objects.exists())
+
+    def test_DiscoveryJobView_no_feeds(self):
+        job = DiscoveryJob.objects.create(user=self.user, url='http://example.com/', status=DiscoveryJob.STATUS.done)
+        res = self.c.get(reverse('feeds:discovery', args=(job.pk, )))
+        self.assertRedirects(res, reverse('feeds:feed-list'), fetch_redirect_response=False)
+
+    def test_DiscoveryJobView_route(self):
+        # job urls must not be swallowed by the entry list pattern
+        job = DiscoveryJob.objects.create(user=self.user, url='http://example.com/')
+        url = reverse('feeds:discovery', args=(job.pk, ))
+        self.assertIs(DiscoveryJobView, resolve(url).func.view_class)
+        res = self.c.get(url)
+        self.assertEqual(200, res.status_code)
+        self.assertTemplateUsed(res, 'reader/discovery.html')
+
+    def test_DiscoveryJobView_other_user(self):
+        other = User.objects.create_user('other', 'other@example.com', 'other')
+        job = DiscoveryJob.objects.create(user=other, url='http://example.com/')
+        self.assertEqual(404, self.c.get(reverse('feeds:discovery', args=(job.pk, ))).status_code)
@@ -2,13 +2,26 @@ from django.conf.urls import url
 from . import views
 
 urlpatterns = [
-    url(r'(?P<feed_id>[0-9]+)/$', views.EntryListView.as_view(), name='entry-list'),
-    url(r'add/url/$', views.URLFormView.as_view(), name='add-url'),
-    url(r'subscribe/$', views.SubscriptionFormView.as_view(), name='subscribe'),
+    url(r'^(?P<feed_id>[0-9]+)/$', views.EntryListView.as_view(), name='entry-list'),
+    url(r'^(?P<feed_id>[0-9]+)/(?P<entry_id>[0-9]+)/(?P<action>read|clear)/$', views.entry_actions,
+        name='entry-action'),
+    url(r'^entries/read/$', views.mark_entries_read, name='mark-read'),
+    url(r'^entries/content/$', views.entry_content, name='entry-content'),
+    url(r'^entries/events/$', views.entry_events, name='entry-events'),
+    url(r'^add/url/$', views.URLFormView.as_view(), name='add-url'),
+    url(r'^add/url/(?P<job_id>[0-9]+)/$', views.DiscoveryJobView.as_view(), name='discovery'),
+    url(r'^subscribe/$', views.SubscriptionFormView.as_view(), name='subscribe'),
+    url(r'^import/$', views.OPMLImportView.as_view(), name='import'),
+    url(r'^export/opml/$', views.export_opml, name='export-opml'),
+    url(r'^export/entries/$', views.export_entries, name='export-entries'),
 
-    url(r'feeds/$', views.FeedListView.as_view(), name='feed-list'),
+    url(r'^feeds/$', views.FeedListView.as_view(), name='feed-list'),
+    url(r'^timeline/$', views.TimelineView.as_view(), name='timeline'),
+    url(r'^search/$', views.SearchView.as_view(), name='search'),
+    url(r'^dashboard/$', views.DashboardView.as_view(), name='dashboard'),
+    url(r'^jobs/$', views.SubscriptionJobListView.as_view(), name='job-list'),
 
-    #url(r'', views.home, name='feed-home'),
+    #url(r'^', views.home, name='feed-home'),
 
-#    url(r'subscribe/$', AddFeedView.as_view(), name='add-feed'),
+#    url(r'^subscribe/$', AddFeedView.as_view(), name='add-feed'),
 ]
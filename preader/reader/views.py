@@ -1,40 +1,216 @@
-from django.core import serializers
+from django.conf import settings
+from django.core.cache import cache
 from django.core.urlresolvers import reverse
 from django.core.exceptions import PermissionDenied
 from django.contrib import messages
 from django.contrib.auth.decorators import login_required
-from django.http import HttpResponseNotAllowed, HttpResponse, Http404
-from django.shortcuts import get_object_or_404, redirect
+from django.db.models import Q
+from django.http import (
+    HttpResponseNotAllowed, HttpResponseBadRequest, HttpResponse, Http404, JsonResponse, StreamingHttpResponse
+)
+from django.shortcuts import get_object_or_404, redirect, render
+from django.utils.dateparse import parse_datetime
+from django.utils.decorators import method_decorator
+from django.views.decorators.http import condition, require_POST
+from django.views.generic import View
 from braces.views import LoginRequiredMixin
 from vanilla import FormView, ListView
-from .forms import URLForm, NewSubscriptionForm
-from .models import Feed, Entry, UserEntry
+from .forms import URLForm, NewSubscriptionForm, OPMLForm
+from .fragments import render_entries
+from .models import (
+    Feed, Entry, UserEntry, SubscriptionJob, DiscoveryJob, UserVersion, get_subscribed_feed_ids, versioned_key,
+    DISCOVERY_IN_BACKGROUND
+)
+from .export import iter_entries_jsonl, iter_opml
+from .notifications import event_stream
+from .opml import OPMLError, import_opml
+from .pagination import KeysetPaginationMixin
+from .routers import read_database
+from .serializers import dumps, json_list_response, json_response, select_fields
+import hashlib
+import json
+
+DASHBOARD_ENTRIES = getattr(settings, 'DASHBOARD_ENTRIES', 5)
+MAX_CONTENT_ENTRIES = getattr(settings, 'MAX_CONTENT_ENTRIES', 100)
+
+ENTRY_ACTIONS = {
+    'read': UserEntry.READ,
+    'clear': UserEntry.UNREAD,
+}
 
 
 @login_required
+@require_POST
 def entry_actions(request, feed_id, entry_id, action='read'):
-    entry = get_object_or_404(Entry.objects.select_related('feed'), pk=entry_id, feed__pk=feed_id)
-    if not entry.feed.is_subscribed(request.user):
+    # user entries only exist for subscribers, so one UPDATE checks the subscription and changes the status,
+    # saved entries stay saved
+    user_entries = UserEntry.objects.filter(user=request.user, feed_id=feed_id, entry_id=entry_id)
+    updated = user_entries.exclude(status=UserEntry.SAVED).update(status=ENTRY_ACTIONS[action])
+    if updated:
+        UserVersion.bump(request.user)
+    elif not user_entries.exists():
+        raise Http404
+    return JsonResponse({'updated': updated})
+
+
+@login_required
+@require_POST
+def mark_entries_read(request):
+    """
+    Mark Entries Read
+
+    Mark many of the user's unread entries read with a single UPDATE.  Expects a JSON body with a list of entry ids
+    and/or a "mark all up to" watermark per feed:
+
+        {"entries": [1, 2, 3], "feeds": {"4": "2016-05-21T19:20:00Z"}}
+
+    Entries of a feed in "feeds" published at or before its watermark are marked read.  The JSON may also come as
+    the "data" field of a form, navigator.sendBeacon can not set the CSRF header so the token is sent in the form.
+    """
+    try:
+        if 'data' in request.POST:
+            data = json.loads(request.POST['data'])
+        else:
+            data = json.loads(request.body.decode('utf-8'))
+        entry_ids = [int(entry_id) for entry_id in data.get('entries', [])]
+        watermarks = [(int(feed_id), parse_datetime(published)) for feed_id, published in data.get('feeds', {}).items()]
+    except (ValueError, TypeError, AttributeError):
+        return HttpResponseBadRequest('Invalid request.')
+    if None in (published for feed_id, published in watermarks):
+        return HttpResponseBadRequest('Invalid request.')
+
+    query = Q()
+    if entry_ids:
+        query |= Q(entry_id__in=entry_ids)
+    for feed_id, published in watermarks:
+        query |= Q(feed_id=feed_id, entry__published__lte=published)
+    if not query:
+        return JsonResponse({'updated': 0})
+
+    updated = UserEntry.unread.filter(query, user=request.user).update(status=UserEntry.READ)
+    if updated:
+        UserVersion.bump(request.user)
+    return JsonResponse({'updated': updated})
+
+
+@login_required
+def entry_content(request):
+    """
+    Entry Content
+
+    Full content of a batch of entries, list views only carry the snippet and fetch content when an entry is
+    expanded.  Expects comma separated entry ids in the "ids" GET parameter, at most MAX_CONTENT_ENTRIES of them:
+
+        /entries/content/?ids=1,2,3  ->  {"1": "<p>...</p>", "2": "<p>...</p>", "3": "<p>...</p>"}
+
+    Only entries of active feeds are returned, the same entries EntryListView shows.
+    """
+    try:
+        entry_ids = {int(entry_id) for entry_id in request.GET.get('ids', '').split(',') if entry_id}
+    except ValueError:
+        return HttpResponseBadRequest('Invalid request.')
+    if not entry_ids or len(entry_ids) > MAX_CONTENT_ENTRIES:
+        return HttpResponseBadRequest('Invalid request.')
+
+    contents = Entry.objects.filter(
+        id__in=entry_ids, feed__disabled=False, feed__has_subscribers=True).values_list('id', 'content')
+    return json_response(dict(contents))
+
+
+@login_required
+def entry_events(request):
+    """
+    Entry Events
+
+    Server-Sent Events of new entries and unread counts for the user, see notifications.event_stream.  By default
+    every request is answered at once and the browser polls, set SSE_TIMEOUT to keep streams open when this URL
+    is served by an async worker.
+    """
+    try:
+        last_version = int(request.META['HTTP_LAST_EVENT_ID'])
+    except (KeyError, ValueError):
+        last_version = None
+    response = StreamingHttpResponse(
+        event_stream(request.user, last_version=last_version), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    # keep nginx from buffering the stream
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+
+EXPORT_STATUSES = {
+    'saved': (UserEntry.SAVED, ),
+    'read': (UserEntry.READ, ),
+    'all': (UserEntry.SAVED, UserEntry.READ),
+}
+
+
+@login_required
+def export_opml(request):
+    response = StreamingHttpResponse(iter_opml(request.user), content_type='text/x-opml; charset=utf-8')
+    response['Content-Disposition'] = 'attachment; filename="subscriptions.opml"'
+    return response
+
+
+@login_required
+def export_entries(request):
+    """
+    Export Entries
+
+    The user's saved and/or read entries as JSON lines, "status" is "saved", "read" or "all" (default).  Rows are
+    streamed in chunks so memory does not grow with the account.
+    """
+    statuses = EXPORT_STATUSES.get(request.GET.get('status', 'all'))
+    if statuses is None:
         raise Http404
+    response = StreamingHttpResponse(
+        iter_entries_jsonl(request.user, statuses), content_type='application/x-ndjson')
+    response['Content-Disposition'] = 'attachment; filename="entries.jsonl"'
+    return response
+
+
+def _make_etag(*parts):
+    return hashlib.sha1(':'.join(str(part) for part in parts).encode('utf-8')).hexdigest()
+
+
+def _user_version(request):
+    # kept on the request so ETag and Last-Modified share one query
+    if not hasattr(request, '_user_version'):
+        request._user_version = UserVersion.get(request.user)
+    return request._user_version
+
+
+def feed_list_etag(request, *args, **kwargs):
+    version = _user_version(request)
+    return _make_etag(request.path, request.user.pk, version.version, request.GET.urlencode())
 
-    entry_status, created = UserEntry.objects.get_or_create(
-        user=request.user, feed=entry.feed, entry=entry, defaults={'status': UserEntry.READ})
 
-    if action == 'read':
-        if not created:
-            entry_status.status = UserEntry.READ
-    elif action == 'clear':
-        pass
+def feed_list_last_modified(request, *args, **kwargs):
+    return _user_version(request).modified
+
+
+def entry_list_etag(request, feed_id, *args, **kwargs):
+    # same database as the entries, a lagging replica must not pair old entries with a new version
+    version = Feed.active.using(read_database(request)).filter(pk=feed_id).values_list('version', flat=True).first()
+    if version is None:
+        return None
+    # the HTML page also carries the user's CSRF token
+    return _make_etag(
+        request.path, request.user.pk, version, request.is_ajax(), request.GET.urlencode(),
+        request.META.get('CSRF_COOKIE', ''))
 
 
 class JSONSerializedQueryset(LoginRequiredMixin, ListView):
+    """
+    JSON Serialized Queryset
+
+    Serializes get_queryset() as a flat JSON list of objects read with .values(), no model instances are built.
+    The "fields" GET parameter selects a subset of fields.
+    """
     fields = None
 
     def get(self, request, *args, **kwargs):
-        return HttpResponse(
-            serializers.serialize('json', self.get_queryset(), fields=self.fields),
-            content_type='application/json'
-        )
+        return json_list_response(self.get_queryset().values(*select_fields(request, self.fields)))
 
 
 class FeedListView(JSONSerializedQueryset):
@@ -45,11 +221,82 @@ class FeedListView(JSONSerializedQueryset):
         'id'
     )
 
+    @method_decorator(condition(etag_func=feed_list_etag, last_modified_func=feed_list_last_modified))
+    def get(self, request, *args, **kwargs):
+        return super(FeedListView, self).get(request, *args, **kwargs)
+
+    def get_queryset(self):
+        return Feed.active.using(read_database(self.request)).filter(
+            id__in=get_subscribed_feed_ids(self.request.user))
+
+
+class DashboardView(LoginRequiredMixin, View):
+    """
+    Dashboard View
+
+    Every subscribed feed with its newest DASHBOARD_ENTRIES entries as JSON, two queries however many feeds the
+    user has:
+
+        [{"id": 1, "title": "...", "entries": [{"id": 2, "title": "...", "link": "...", "published": "..."}]}]
+
+    The response body is cached under the user's version, which changes when entries are added to the user's feeds.
+    """
+    entry_fields = (
+        'id',
+        'feed',
+        'title',
+        'link',
+        'published'
+    )
+
+    @method_decorator(condition(etag_func=feed_list_etag, last_modified_func=feed_list_last_modified))
+    def get(self, request, *args, **kwargs):
+        key = versioned_key('dashboard', request.user.pk, _user_version(request).version)
+        content = cache.get(key)
+        if content is None:
+            content = dumps(self.get_feeds())
+            cache.set(key, content)
+        return HttpResponse(content, content_type='application/json')
+
+    def get_feeds(self):
+        feeds = list(Feed.active.filter(id__in=get_subscribed_feed_ids(self.request.user)).values('id', 'title'))
+        feeds_by_id = {}
+        for feed in feeds:
+            feed['entries'] = []
+            feeds_by_id[feed['id']] = feed
+
+        entries = Entry.latest_for_feeds(feeds_by_id.keys(), DASHBOARD_ENTRIES).values(*self.entry_fields)
+        for entry in entries:
+            feeds_by_id[entry.pop('feed')]['entries'].append(entry)
+        return feeds
+
+
+class SubscriptionJobListView(JSONSerializedQueryset):
+    model = SubscriptionJob
+    fields = (
+        'feed',
+        'action',
+        'status',
+        'entries',
+        'modified'
+    )
+
     def get_queryset(self):
-        return Feed.active.filter(subscriptions=self.request.user)
+        return SubscriptionJob.objects.filter(
+            user=self.request.user,
+            action=SubscriptionJob.ACTION.backfill,
+            status__in=(SubscriptionJob.STATUS.pending, SubscriptionJob.STATUS.running)
+        )
 
 
-class EntryListView(LoginRequiredMixin, ListView):
+class EntryListView(LoginRequiredMixin, KeysetPaginationMixin, ListView):
+    """
+    Entry List View
+
+    One page of a feed's entries, newest first.  Rendered as HTML, or as JSON with the cursor of the next page
+    for AJAX requests and "?format=json".  Entry panels come from the fragment cache, see fragments.render_entries.
+    Read from the replica when there is one, see routers.read_database.
+    """
     model = Entry
     feed = None
     fields = (
@@ -57,7 +304,7 @@ class EntryListView(LoginRequiredMixin, ListView):
         'id',
         'title',
         'link',
-        'content',
+        'snippet',
         'updated',
         'published'
     )
@@ -65,21 +312,171 @@ class EntryListView(LoginRequiredMixin, ListView):
     def _get_feed(self):
         if self.feed is None:
             self.feed = get_object_or_404(
-                Feed.active.all(),
+                Feed.active.using(read_database(self.request)),
                 pk=self.kwargs['feed_id']
             )
         return self.feed
 
+    @method_decorator(condition(etag_func=entry_list_etag))
+    def get(self, request, *args, **kwargs):
+        if request.is_ajax() or request.GET.get('format') == 'json':
+            entries, next_cursor = self.paginate_keyset(
+                self.get_queryset().values(*set(select_fields(request, self.fields)) | {'id', 'published'}))
+            return json_response({'entries': entries, 'next': next_cursor})
+        self.object_list, next_cursor = self.paginate_keyset(self.get_queryset())
+        context = self.get_context_data(next_cursor=next_cursor)
+        return self.render_to_response(context)
+
     def get_context_data(self, **kwargs):
         context = super(EntryListView, self).get_context_data(**kwargs)
         context['feed'] = self._get_feed()
+        context['entry_panels'] = render_entries(self.object_list)
         return context
 
     def get_queryset(self):
-        return Entry.objects.select_related('feed').filter(
+        return Entry.objects.using(read_database(self.request)).select_related('feed').filter(
             feed=self._get_feed()).only(*self.fields)
 
 
+class TimelineView(LoginRequiredMixin, KeysetPaginationMixin, ListView):
+    """
+    Timeline View
+
+    River of news: the user's entries across all subscriptions, newest first, one page at a time.  "status" is
+    "unread" (default), "saved" or "all".  Pages are read from the (user, status, published, id) and
+    (user, published, id) indexes on UserEntry, so cost per page does not depend on how many feeds or entries the
+    user has.  Rendered as HTML, or as JSON for AJAX requests and "?format=json".
+    """
+    model = UserEntry
+    template_name = 'reader/timeline.html'
+    statuses = {
+        'unread': UserEntry.UNREAD,
+        'saved': UserEntry.SAVED,
+        'all': None,
+    }
+    fields = (
+        'id',
+        'entry',
+        'feed',
+        'status',
+        'flag',
+        'published',
+        'entry__title',
+        'entry__link',
+        'entry__snippet',
+        'feed__title'
+    )
+
+    def get(self, request, *args, **kwargs):
+        if request.is_ajax() or request.GET.get('format') == 'json':
+            entries, next_cursor = self.paginate_keyset(
+                self.get_queryset().values(*set(select_fields(request, self.fields)) | {'id', 'published'}))
+            return json_response({'entries': entries, 'next': next_cursor})
+        self.object_list, next_cursor = self.paginate_keyset(
+            self.get_queryset().select_related('entry', 'feed').only(
+                'id', 'entry', 'feed', 'status', 'flag', 'published', 'entry__title', 'entry__link', 'entry__snippet',
+                'feed__title'))
+        context = self.get_context_data(next_cursor=next_cursor, status=self.get_status())
+        return self.render_to_response(context)
+
+    def get_status(self):
+        status = self.request.GET.get('status', 'unread')
+        if status not in self.statuses:
+            raise Http404
+        return status
+
+    def get_queryset(self):
+        # rows of feeds unsubscribed in the background are left out until they are deleted
+        queryset = UserEntry.objects.filter(
+            user=self.request.user, feed_id__in=get_subscribed_feed_ids(self.request.user))
+        status = self.statuses[self.get_status()]
+        if status is None:
+            return queryset.exclude(flag=UserEntry.MUTED)
+        return queryset.filter(status=status)
+
+
+class SearchView(LoginRequiredMixin, KeysetPaginationMixin, ListView):
+    """
+    Search View
+
+    Full text search of the entries of the user's subscriptions, "q" holds the search text.  Results are newest
+    first, one page at a time.  Rendered as HTML, or as JSON for AJAX requests and "?format=json".
+    """
+    model = Entry
+    template_name = 'reader/search.html'
+    fields = (
+        'feed',
+        'id',
+        'title',
+        'link',
+        'snippet',
+        'published'
+    )
+
+    def get(self, request, *args, **kwargs):
+        if request.is_ajax() or request.GET.get('format') == 'json':
+            entries, next_cursor = self.paginate_keyset(
+                self.get_queryset().values(*set(select_fields(request, self.fields)) | {'id', 'published'}))
+            return json_response({'entries': entries, 'next': next_cursor})
+        self.object_list, next_cursor = self.paginate_keyset(
+            self.get_queryset().select_related('feed').only(*(self.fields + ('feed__title', ))))
+        context = self.get_context_data(next_cursor=next_cursor, query=self.get_query())
+        return self.render_to_response(context)
+
+    def get_query(self):
+        return self.request.GET.get('q', '').strip()
+
+    def get_queryset(self):
+        query = self.get_query()
+        if not query:
+            return Entry.objects.none()
+        return Entry.search(query, get_subscribed_feed_ids(self.request.user))
+
+
+def found_feeds(request, feed_ids):
+    """
+    Found Feeds
+
+    Hand discovered feeds to SubscriptionFormView.
+
+    :param request: HttpRequest
+    :param feed_ids: ids of discovered feeds
+    :return: URL to go to next
+    """
+    if not feed_ids:
+        messages.error(request, 'No feed urls found.')
+        return reverse('feeds:feed-list')
+    request.session['feed_id_list'] = list(feed_ids)
+    return reverse('feeds:subscribe')
+
+
+class DiscoveryJobView(LoginRequiredMixin, View):
+    """
+    Discovery Job View
+
+    Progress of a DiscoveryJob.  While the job is pending or running the HTML page polls this view as JSON, once
+    it is finished both go on to subscribing to the feeds found or back to the feed list.
+    """
+    template_name = 'reader/discovery.html'
+
+    def get(self, request, *args, **kwargs):
+        job = get_object_or_404(DiscoveryJob, pk=self.kwargs['job_id'], user=request.user)
+        as_json = request.is_ajax() or request.GET.get('format') == 'json'
+        if job.status in (DiscoveryJob.STATUS.pending, DiscoveryJob.STATUS.running):
+            if as_json:
+                return json_response({'status': job.status, 'next': None})
+            return render(request, self.template_name, {'job': job})
+
+        if job.status == DiscoveryJob.STATUS.done:
+            next_url = found_feeds(request, job.feeds.values_list('id', flat=True))
+        else:
+            messages.error(request, 'Could not check {0}, please try again later.'.format(job.url))
+            next_url = reverse('feeds:feed-list')
+        if as_json:
+            return json_response({'status': job.status, 'next': next_url})
+        return redirect(next_url)
+
+
 class URLFormView(LoginRequiredMixin, FormView):
     form_class = URLForm
 
@@ -87,20 +484,44 @@ class URLFormView(LoginRequiredMixin, FormView):
         return HttpResponseNotAllowed('Not allowed.')
 
     def form_valid(self, form):
-        feeds = Feed.get_feeds_from_url(form.cleaned_data['url'])
-        if not feeds:
-            raise PermissionError
-            messages.error(self.request, 'No feed urls found.')
-            return redirect(reverse('feeds:feed-list'))
-
-        self.request.session['feed_id_list'] = [feed.id for feed in feeds]
-        return redirect(reverse('feeds:subscribe'))
+        url = form.cleaned_data['url']
+        feeds = Feed.get_known_feeds(url)
+        if feeds is None:
+            if DISCOVERY_IN_BACKGROUND:
+                job = DiscoveryJob.objects.create(user=self.request.user, url=url)
+                return redirect(reverse('feeds:discovery', args=(job.pk, )))
+            feeds = Feed.get_feeds_from_url(url)
+        return redirect(found_feeds(self.request, [feed.pk for feed in feeds]))
 
     def form_invalid(self, form):
         messages.error(self.request, 'Please enter a valid URL.')
         return redirect(reverse('feeds:feed-list'))
 
 
+class OPMLImportView(LoginRequiredMixin, FormView):
+    """
+    OPML Import View
+
+    Subscribe to every feed in an uploaded OPML file, see opml.import_opml.  New feeds are fetched by the next
+    update_feeds run and sites without a feed URL are checked by DiscoveryJobs rather than inside the request.
+    """
+    form_class = OPMLForm
+    template_name = 'reader/import.html'
+
+    def form_valid(self, form):
+        try:
+            found, subscribed, queued = import_opml(
+                self.request.user, form.cleaned_data['opml'], fetch=False, background=True)
+        except OPMLError:
+            messages.error(self.request, 'Please upload a valid OPML file.')
+            return redirect(reverse('feeds:import'))
+        messages.success(
+            self.request, '{0} feeds found, subscribed to {1} new feeds.'.format(found, subscribed))
+        if queued:
+            messages.info(self.request, '{0} sites are checked for feeds in the background.'.format(queued))
+        return redirect(reverse('feeds:feed-list'))
+
+
 class SubscriptionFormView(LoginRequiredMixin, FormView):
     template_name = 'reader/subscribe.html'
 
@@ -119,16 +540,17 @@ class SubscriptionFormView(LoginRequiredMixin, FormView):
         if not feeds:
             messages.error(self.request, 'No feed urls found.')
 
+        subscribed = get_subscribed_feed_ids(self.request.user)
         for feed in feeds:
-            already_subscribed = False
-            if feed.is_subscribed(self.request.user):
-                already_subscribed = True
-
-            if already_subscribed:
+            if feed.pk in subscribed:
                 messages.warning(self.request, 'Already subscribed to ' + feed.feed_url)
             else:
-                feed.subscribe(self.request.user)
-                messages.success(self.request, 'Subscribed to ' + feed.feed_url)
+                job = feed.subscribe(self.request.user)
+                if job is None:
+                    messages.success(self.request, 'Subscribed to ' + feed.feed_url)
+                else:
+                    messages.success(
+                        self.request, 'Subscribed to ' + feed.feed_url + ', older entries are loading in the background')
 
         del self.request.session['feed_id_list']
         return redirect(reverse('feeds:feed-list'))
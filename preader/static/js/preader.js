@@ -1,10 +1,126 @@
 $(function() {
-    $.getJSON(feed_list_url).done(function(data){
+    $.getJSON(feed_list_url, {fields: 'id,title'}).done(function(data){
         $.each(data, function(i, item){
-            $('<li><a title="' + item.fields.title + '" id="feedLink_' + item.pk + '" href="/f/' + item.pk + '">' + item.fields.title + '</a></li>').appendTo('ul#feedList');
+            var link = $('<a>').attr({title: item.title, id: 'feedLink_' + item.id, href: '/f/' + item.id}).text(item.title);
+            $('<li>').append(link).appendTo('ul#feedList');
         });
+        poll_jobs();
+        listen_events();
     }).fail(function(){console.log('error')});
 });
+// one server-sent event stream per page instead of polling, the browser reconnects when it ends
+function listen_events(){
+    if (!window.EventSource) {
+        return;
+    }
+    var source = new EventSource(entry_events_url);
+    source.addEventListener('unread', function(e){
+        var counts = JSON.parse(e.data);
+        $('ul#feedList span.unread-count').remove();
+        $.each(counts, function(feed_id, count){
+            $('#feedLink_' + feed_id).append(' <span class="badge unread-count">' + count + '</span>');
+        });
+    });
+    source.addEventListener('entries', function(e){
+        $(document).trigger('preader:entries', JSON.parse(e.data));
+    });
+}
+function poll_jobs(){
+    // mark feeds that are still loading older entries, check again until no jobs are left
+    $.getJSON(job_list_url, {fields: 'feed'}).done(function(data){
+        $('ul#feedList i.job-spinner').remove();
+        $.each(data, function(i, item){
+            $('#feedLink_' + item.feed).append(' <i class="fa fa-spinner fa-spin job-spinner"></i>');
+        });
+        if (data.length > 0) {
+            setTimeout(poll_jobs, 5000);
+        }
+    }).fail(function(){console.log('error')});
+}
+function get_cookie(name){
+    var match = document.cookie.match('(^|;)\\s*' + name + '=([^;]*)');
+    return match ? decodeURIComponent(match[2]) : null;
+}
+$.ajaxSetup({
+    beforeSend: function(xhr, settings){
+        if (!/^(GET|HEAD|OPTIONS|TRACE)$/.test(settings.type) && !this.crossDomain) {
+            xhr.setRequestHeader('X-CSRFToken', get_cookie('csrftoken'));
+        }
+    }
+});
+// read marks are queued and sent together, one request (and one UPDATE) per flush
+var read_queue = {entries: [], feeds: {}};
+var read_timer = null;
+function mark_read(entry_id){
+    if (read_queue.entries.indexOf(entry_id) < 0) {
+        read_queue.entries.push(entry_id);
+    }
+    schedule_read_flush();
+}
+function mark_all_read(feed_id, published){
+    read_queue.feeds[feed_id] = published;
+    schedule_read_flush();
+}
+function schedule_read_flush(){
+    if (read_timer === null) {
+        read_timer = setTimeout(flush_read_queue, 2000);
+    }
+}
+// pass unloading when the page is being left, its pending requests are cancelled but a beacon is still sent
+function flush_read_queue(unloading){
+    clearTimeout(read_timer);
+    read_timer = null;
+    if (read_queue.entries.length === 0 && $.isEmptyObject(read_queue.feeds)) {
+        return;
+    }
+    var data = read_queue;
+    read_queue = {entries: [], feeds: {}};
+    if (unloading === true && navigator.sendBeacon && window.URLSearchParams) {
+        // a beacon can not set headers, the CSRF token goes in the form body
+        var form = new URLSearchParams();
+        form.append('csrfmiddlewaretoken', get_cookie('csrftoken'));
+        form.append('data', JSON.stringify(data));
+        if (navigator.sendBeacon(mark_read_url, form)) {
+            return;
+        }
+    }
+    $.ajax({
+        type: 'POST',
+        url: mark_read_url,
+        contentType: 'application/json',
+        data: JSON.stringify(data)
+    }).fail(function(){console.log('error')});
+}
+$(window).on('beforeunload', function(){
+    flush_read_queue(true);
+});
+$(document).on('visibilitychange', function(){
+    if (document.visibilityState === 'hidden') {
+        flush_read_queue(true);
+    }
+});
+// full entry content is fetched on demand, in one request for all entries not loaded yet
+function load_content(entry_ids){
+    var ids = $.grep(entry_ids, function(entry_id){
+        return $('#entryContent_' + entry_id).data('loaded') === undefined;
+    });
+    if (ids.length === 0) {
+        return;
+    }
+    $.each(ids, function(i, entry_id){
+        $('#entryContent_' + entry_id).data('loaded', false);
+    });
+    $.getJSON(entry_content_url, {ids: ids.join(',')}).done(function(data){
+        $.each(data, function(entry_id, content){
+            $('#entryContent_' + entry_id).html(content).data('loaded', true);
+        });
+    }).fail(function(){
+        $.each(ids, function(i, entry_id){
+            $('#entryContent_' + entry_id).removeData('loaded');
+        });
+        console.log('error');
+    });
+}
 function get_id(ele, del='_', num=1){
     return ele.attr('id').split(del)[num];
 }
\ No newline at end of file